@@ -0,0 +1,550 @@
+"""
+Offline extractive notecard and quiz generation: the fast tier in front of the LLM.
+
+Sentences of a source are ranked TextRank-style: each sentence is linked to
+its most similar sentences and PageRank over that graph picks the sentences
+the rest of the lecture keeps coming back to. Similarity is the cosine of the
+MiniLM sentence embeddings (the model the RAG service embeds chunks with)
+when sentence-transformers is installed, and TF-IDF cosine otherwise or
+while the model is still loading. Everything runs locally on the CPU.
+
+From the ranked sentences the generators build definition cards ("X is
+defined as / refers to / means ...") and cloze quiz items whose blank is a
+central term and whose distractors are other central terms of the lecture.
+
+Every call gets a latency budget. The embedding pass is abandoned for TF-IDF
+when it would overrun, and the generators return None when even that does not
+fit, so callers can fall back to ``fallback_generation``.
+
+Run ``python extractive_generation.py`` to time the engine on a synthetic
+lecture.
+"""
+
+import heapq
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from transcript_cleaning import score_sentence
+from transcript_enrichment import COMMON_WORDS, extract_key_terms, fallback_paragraphs
+
+EMBEDDING_MODEL = os.getenv("EXTRACTIVE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+USE_EMBEDDINGS = os.getenv("EXTRACTIVE_EMBEDDINGS", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_BUDGET_SECONDS = 1.0
+MAX_RANKED_SENTENCES = 300  # longer sources are pre-filtered with score_sentence
+NEIGHBORS = 12  # edges kept per sentence in the similarity graph
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-4
+REDUNDANCY_THRESHOLD = 0.8  # picked sentences more similar than this are skipped
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_CACHE_SIZE = 20000
+# Share of the budget the embedding pass may use before falling back to TF-IDF
+EMBEDDING_BUDGET_SHARE = 0.6
+
+STOPWORDS = COMMON_WORDS | {
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "her", "was",
+    "one", "our", "out", "has", "him", "his", "how", "its", "may", "new", "now", "old", "see",
+    "two", "way", "who", "did", "get", "let", "say", "she", "too", "use", "with", "from", "into",
+    "than", "then", "them", "were", "will", "your", "also", "just", "like", "more", "most",
+    "some", "such", "very", "each", "only", "over", "same", "here", "what", "does", "done",
+    "make", "made", "much", "many", "well", "going", "really", "basically", "actually", "thing",
+    "things", "okay", "right", "yeah", "know", "think", "want", "need", "look", "kind", "sort",
+}
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_-]{2,}")
+_DEFINITION_CUE = re.compile(r"\s(is defined as|refers to|is known as|is called|means|is an?|is the)\s", re.IGNORECASE)
+_WEAK_CUES = {"is a", "is an", "is the"}
+_TERM_LEADERS = {"so", "basically", "the", "a", "an", "and", "well", "now", "okay", "then", "also", "which",
+                 "this", "that", "these", "those", "our", "your", "their", "its", "um", "uh", "here", "there"}
+_NOT_TERMS = {"it", "this", "that", "there", "what", "which", "he", "she", "they", "we", "you", "one", "result"}
+_FILLER = re.compile(r"^(?:so|um|uh|well|now|okay|all right|basically|yeah)\b", re.IGNORECASE)
+RANKED_CACHE_SIZE = 32
+
+_model = None
+_model_state = "idle"  # idle -> loading -> ready | unavailable
+_model_lock = threading.Lock()
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_ranked_cache = OrderedDict()
+_ranked_cache_lock = threading.Lock()
+# Measured encoding cost, so a batch that cannot finish in time is never started
+_seconds_per_sentence = None
+CALIBRATION_BATCH_SIZE = 8
+
+
+class BudgetExceeded(Exception):
+    """Raised internally when ranking cannot finish within the latency budget"""
+
+
+def _load_model():
+    """Load the MiniLM model; runs on a background thread"""
+    global _model, _model_state
+    try:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+        _model_state = "ready"
+        logging.info(f"Extractive generation loaded embedding model {EMBEDDING_MODEL}")
+    except ImportError:
+        _model_state = "unavailable"
+        logging.warning("Sentence Transformers not installed, extractive ranking uses TF-IDF similarity")
+    except Exception as e:
+        _model_state = "unavailable"
+        logging.error(f"Error loading embedding model for extractive generation: {str(e)}")
+
+
+def get_embedding_model():
+    """
+    Return the sentence embedding model, or None if it is not loaded yet
+
+    The first call starts loading the model in the background, so no request
+    ever waits for it.
+    """
+    global _model_state
+    if _model_state == "idle" and USE_EMBEDDINGS:
+        with _model_lock:
+            if _model_state == "idle":
+                _model_state = "loading"
+                threading.Thread(target=_load_model, name="extractive-model-loader", daemon=True).start()
+    return _model
+
+
+def embedding_status() -> Dict[str, Any]:
+    """Describe the state of the embedding model and its sentence cache"""
+    return {
+        "model": EMBEDDING_MODEL,
+        "state": _model_state if USE_EMBEDDINGS else "disabled",
+        "cached_sentences": len(_embedding_cache),
+    }
+
+
+def _check(deadline: float):
+    if time.perf_counter() > deadline:
+        raise BudgetExceeded()
+
+
+def _tokens(sentence: str) -> List[str]:
+    return [word for word in (w.lower() for w in _WORD.findall(sentence)) if word not in STOPWORDS]
+
+
+def _tfidf_vectors(token_lists: List[List[str]]) -> Tuple[List[Dict[str, float]], Dict[str, float]]:
+    """Return L2-normalized TF-IDF vectors of the sentences and the idf of each term"""
+    document_frequency = defaultdict(int)
+    for tokens in token_lists:
+        for term in set(tokens):
+            document_frequency[term] += 1
+
+    count = len(token_lists)
+    idf = {term: math.log((1 + count) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    vectors = []
+    for tokens in token_lists:
+        vector = defaultdict(float)
+        for term in tokens:
+            vector[term] += idf[term]
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors, idf
+
+
+def _tfidf_graph(vectors: List[Dict[str, float]], deadline: float) -> List[List[Tuple[int, float]]]:
+    """Nearest neighbours of each sentence by TF-IDF cosine, via term postings"""
+    postings = defaultdict(list)
+    for i, vector in enumerate(vectors):
+        for term, weight in vector.items():
+            postings[term].append((i, weight))
+
+    neighbors = []
+    for i, vector in enumerate(vectors):
+        if i % 50 == 0:
+            _check(deadline)
+        scores = defaultdict(float)
+        for term, weight in vector.items():
+            for j, other_weight in postings[term]:
+                if j != i:
+                    scores[j] += weight * other_weight
+        neighbors.append(heapq.nlargest(NEIGHBORS, scores.items(), key=lambda item: item[1]))
+    return neighbors
+
+
+def _embed(sentences: List[str], model, deadline: float):
+    """
+    Return normalized embeddings of the sentences as a matrix, using the sentence cache
+
+    Encoding cannot be interrupted, so each batch is only started when the
+    measured cost per sentence says it will finish before the deadline.
+    Batches encoded before giving up stay cached for the next request.
+    """
+    global _seconds_per_sentence
+    import numpy as np
+
+    with _embedding_cache_lock:
+        cached = {s: _embedding_cache[s] for s in sentences if s in _embedding_cache}
+    missing = [s for s in dict.fromkeys(sentences) if s not in cached]
+    while missing:
+        size = EMBEDDING_BATCH_SIZE if _seconds_per_sentence is not None else CALIBRATION_BATCH_SIZE
+        batch, missing = missing[:size], missing[size:]
+        if time.perf_counter() + len(batch) * (_seconds_per_sentence or 0) > deadline:
+            raise BudgetExceeded()
+        start = time.perf_counter()
+        encoded = model.encode(batch, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True,
+                               show_progress_bar=False)
+        _seconds_per_sentence = (time.perf_counter() - start) / len(batch)
+        for sentence, vector in zip(batch, encoded):
+            cached[sentence] = vector
+        with _embedding_cache_lock:
+            for sentence, vector in zip(batch, encoded):
+                _embedding_cache[sentence] = vector
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    _check(deadline)
+    return np.vstack([cached[s] for s in sentences])
+
+
+def _embedding_graph(embeddings) -> List[List[Tuple[int, float]]]:
+    """Nearest neighbours of each sentence by embedding cosine"""
+    import numpy as np
+
+    similarity = embeddings @ embeddings.T
+    np.fill_diagonal(similarity, -1.0)
+    k = min(NEIGHBORS, len(similarity) - 1)
+    if k <= 0:
+        return [[] for _ in range(len(similarity))]
+    top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    return [[(int(j), float(similarity[i, j])) for j in row if similarity[i, j] > 0] for i, row in enumerate(top)]
+
+
+def _pagerank(neighbors: List[List[Tuple[int, float]]], prior: List[float], deadline: float) -> List[float]:
+    """
+    Weighted PageRank over the symmetrized neighbour graph
+
+    The random jump lands on sentences in proportion to ``prior`` (biased
+    TextRank), so filler that happens to share words with everything does not
+    outrank the sentences that carry the lecture content.
+    """
+    count = len(neighbors)
+    total = sum(prior) or 1.0
+    teleport = [(1 - DAMPING) * count * weight / total for weight in prior]
+    edges = [defaultdict(float) for _ in range(count)]
+    for i, row in enumerate(neighbors):
+        for j, weight in row:
+            if weight > 0:
+                edges[i][j] = max(edges[i][j], weight)
+                edges[j][i] = max(edges[j][i], weight)
+
+    out_weight = [sum(row.values()) for row in edges]
+    scores = [1.0] * count
+    for _ in range(MAX_ITERATIONS):
+        _check(deadline)
+        updated = [
+            teleport[i] + DAMPING * sum(weight / out_weight[j] * scores[j] for j, weight in edges[i].items())
+            for i in range(count)
+        ]
+        delta = max(abs(a - b) for a, b in zip(updated, scores))
+        scores = updated
+        if delta < TOLERANCE:
+            break
+    return scores
+
+
+class RankedContent:
+    """
+    TextRank result for one source
+
+    Attributes:
+        sentences: Candidate sentences in source order
+        ranking: Sentence indexes, most central first
+        keywords: Terms ordered by how central the sentences using them are
+        method: ``"embeddings"`` or ``"tfidf"``
+    """
+
+    def __init__(self, content: Dict[str, Any], deadline: float):
+        paragraphs = fallback_paragraphs(content["content"])
+        sentences = []
+        for paragraph in paragraphs:
+            for piece in paragraph.split('.'):
+                piece = piece.strip()
+                if 30 < len(piece) <= 300 and len(piece.split()) >= 6:
+                    sentences.append(piece)
+        sentences = list(dict.fromkeys(sentences))
+        if len(sentences) > MAX_RANKED_SENTENCES:
+            keep = set(heapq.nlargest(MAX_RANKED_SENTENCES, range(len(sentences)),
+                                      key=lambda i: score_sentence(sentences[i])))
+            sentences = [s for i, s in enumerate(sentences) if i in keep]
+        _check(deadline)
+
+        self.sentences = sentences
+        self.tokens = [_tokens(s) for s in sentences]
+        self.vectors, self.idf = _tfidf_vectors(self.tokens)
+        key_terms = content.get("key_terms") or extract_key_terms(paragraphs)
+        self.topic_words = {word.lower() for topic in key_terms["potential_topics"] for word in topic.split()}
+        _check(deadline)
+
+        neighbors = None
+        self.method = "tfidf"
+        model = get_embedding_model() if len(sentences) > 1 else None
+        if model is not None:
+            remaining = deadline - time.perf_counter()
+            try:
+                embeddings = _embed(sentences, model, time.perf_counter() + remaining * EMBEDDING_BUDGET_SHARE)
+                neighbors = _embedding_graph(embeddings)
+                self.method = "embeddings"
+            except BudgetExceeded:
+                logging.info("Embedding pass over budget, ranking with TF-IDF similarity")
+            except Exception as e:
+                logging.warning(f"Embedding pass failed, ranking with TF-IDF similarity: {str(e)}")
+        if neighbors is None:
+            neighbors = _tfidf_graph(self.vectors, deadline)
+
+        self.similar = [dict(row) for row in neighbors]
+        prior = [(1.0 + score_sentence(s)) * (0.5 if _FILLER.match(s) else 1.0) for s in sentences]
+        scores = _pagerank(neighbors, prior, deadline) if sentences else []
+        self.ranking = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+
+        keyword_scores = defaultdict(float)
+        for i, vector in enumerate(self.vectors):
+            for term, weight in vector.items():
+                if len(term) >= 4:
+                    keyword_scores[term] += scores[i] * weight * (1.5 if term in self.topic_words else 1.0)
+        self.keywords = sorted(keyword_scores, key=keyword_scores.get, reverse=True)
+        self.keyword_rank = {term: rank for rank, term in enumerate(self.keywords)}
+
+    def top_sentences(self) -> Iterator[int]:
+        """Yield sentence indexes by rank, skipping near-duplicates of earlier ones"""
+        picked = []
+        for i in self.ranking:
+            if any(self.similar[i].get(j, 0) > REDUNDANCY_THRESHOLD or self.similar[j].get(i, 0) > REDUNDANCY_THRESHOLD
+                   for j in picked):
+                continue
+            picked.append(i)
+            yield i
+
+    def sentence_keyword(self, i: int) -> Optional[str]:
+        """The most central keyword used in sentence ``i``"""
+        candidates = [term for term in self.vectors[i] if term in self.keyword_rank]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda term: (term not in self.topic_words, self.keyword_rank[term]))
+
+
+def rank_content(content: Dict[str, Any], budget_seconds: float = DEFAULT_BUDGET_SECONDS) -> Optional[RankedContent]:
+    """
+    Rank the sentences of a source
+
+    Args:
+        content: Source dict with ``content`` and optionally ``key_terms``
+        budget_seconds: Latency budget for the whole ranking
+
+    Returns:
+        RankedContent, or None if ranking did not fit the budget. Rankings
+        are cached per source text.
+    """
+    cache_key = (content.get("id"), hash(content["content"]))
+    with _ranked_cache_lock:
+        ranked = _ranked_cache.get(cache_key)
+    # Rankings made before the embedding model finished loading are redone with it
+    if ranked is not None and (ranked.method == "embeddings" or get_embedding_model() is None):
+        return ranked
+
+    try:
+        ranked = RankedContent(content, time.perf_counter() + budget_seconds)
+    except BudgetExceeded:
+        logging.warning(f"Extractive ranking of content {content.get('id')} exceeded {budget_seconds:.2f}s budget")
+        return None
+
+    with _ranked_cache_lock:
+        _ranked_cache[cache_key] = ranked
+        while len(_ranked_cache) > RANKED_CACHE_SIZE:
+            _ranked_cache.popitem(last=False)
+    return ranked
+
+
+def _surface(sentence: str, term: str) -> Optional[re.Match]:
+    return re.search(r'\b' + re.escape(term) + r'\b', sentence, re.IGNORECASE)
+
+
+def _definition(sentence: str, ranked: RankedContent) -> Optional[str]:
+    """Return the term a sentence defines, if it is a definition"""
+    cue = _DEFINITION_CUE.search(sentence)
+    if not cue:
+        return None
+    words = sentence[:cue.start()].split(',')[-1].split()[-4:]
+    while words and words[0].lower() in _TERM_LEADERS:
+        words = words[1:]
+    if not words or len(" ".join(words)) < 3 or words[-1].lower() in _NOT_TERMS:
+        return None
+    if all(word.lower() in STOPWORDS for word in words):
+        return None
+    if cue.group(1).lower() in _WEAK_CUES:
+        # "X is a ..." only counts when X is a capitalized or central term
+        if not any(word[0].isupper() or word.lower() in ranked.topic_words for word in words):
+            return None
+    return " ".join(words)
+
+
+def generate_extractive_notecards(content: Dict[str, Any], num_cards: int,
+                                  budget_seconds: float = DEFAULT_BUDGET_SECONDS) -> Optional[List[Dict[str, str]]]:
+    """
+    Build notecards from the most central sentences of a source
+
+    Definition sentences become "What is X?" cards; the remaining cards pair
+    a central sentence with its most central keyword.
+
+    Returns:
+        Up to ``num_cards`` cards, or None if nothing could be extracted within the budget
+    """
+    ranked = rank_content(content, budget_seconds)
+    if ranked is None or not ranked.sentences:
+        return None
+
+    definitions, key_points = [], []
+    seen_terms = set()
+    for i in ranked.top_sentences():
+        if len(definitions) >= num_cards:
+            break
+        sentence = ranked.sentences[i]
+        term = _definition(sentence, ranked)
+        if term and term.lower() not in seen_terms:
+            seen_terms.add(term.lower())
+            definitions.append((term, sentence))
+        elif len(key_points) < num_cards:
+            keyword = ranked.sentence_keyword(i)
+            match = _surface(sentence, keyword) if keyword and keyword not in seen_terms else None
+            if match:
+                seen_terms.add(keyword)
+                key_points.append((match.group(0), sentence))
+
+    cards = [{"front": f"What is {term}?", "back": sentence + "."} for term, sentence in definitions]
+    cards += [{"front": f"What does the material say about {keyword}?", "back": sentence + "."}
+              for keyword, sentence in key_points]
+    cards = cards[:num_cards]
+    for i, card in enumerate(cards):
+        card["id"] = f"card_{content['id']}_{i}"
+    return [{"id": card["id"], "front": card["front"], "back": card["back"]} for card in cards] or None
+
+
+def _distractors(ranked: RankedContent, answer: str, sentence_terms: set, difficulty: str) -> List[str]:
+    """Pick three other central terms as wrong options"""
+    answer_lower = answer.lower()
+    pool = [term for term in ranked.keywords
+            if term not in sentence_terms and term[:5] != answer_lower[:5]
+            and answer_lower not in term and term not in answer_lower]
+    # Terms the lecture names as topics read as plausible answers; plain words rarely do
+    pool = sorted(pool, key=lambda term: term not in ranked.topic_words)[:40]
+    if difficulty == "hard":
+        # Central terms of about the same length are the hardest to rule out
+        candidates = sorted(pool[:15], key=lambda term: (abs(len(term) - len(answer)), ranked.keyword_rank[term]))[:3]
+    elif difficulty == "easy":
+        candidates = random.sample(pool[15:] or pool, min(3, len(pool[15:] or pool)))
+    else:
+        candidates = random.sample(pool[:15], min(3, len(pool[:15])))
+    if answer[:1].isupper():
+        candidates = [term.capitalize() for term in candidates]
+    return candidates
+
+
+def generate_extractive_quiz(content: Dict[str, Any], num_questions: int, difficulty: str = "medium",
+                             budget_seconds: float = DEFAULT_BUDGET_SECONDS) -> Optional[List[Dict[str, Any]]]:
+    """
+    Build cloze questions from the most central sentences of a source
+
+    The blank is the sentence's most central keyword; the distractors are
+    other central keywords (closest in length for ``hard``, less central ones
+    for ``easy``).
+
+    Returns:
+        Up to ``num_questions`` questions, or None if nothing could be extracted within the budget
+    """
+    ranked = rank_content(content, budget_seconds)
+    if ranked is None or not ranked.sentences:
+        return None
+
+    prompts = {
+        "easy": "Fill in the blank: ",
+        "medium": "Complete the following statement: ",
+        "hard": "Which term correctly completes this statement from the material? ",
+    }
+    questions = []
+    used_answers = set()
+    for i in ranked.top_sentences():
+        if len(questions) >= num_questions:
+            break
+        sentence = ranked.sentences[i]
+        if len(sentence.split()) < 8:
+            continue
+        keyword = ranked.sentence_keyword(i)
+        if not keyword or keyword in used_answers:
+            continue
+        match = _surface(sentence, keyword)
+        if not match:
+            continue
+        answer = match.group(0)
+        distractors = _distractors(ranked, answer, set(ranked.tokens[i]), difficulty)
+        options = [answer] + distractors
+        if len(options) < 4 or len({option.lower() for option in options}) < 4:
+            continue
+
+        used_answers.add(keyword)
+        random.shuffle(options)
+        questions.append({
+            "question": prompts.get(difficulty, prompts["medium"])
+                        + sentence[:match.start()] + "_____" + sentence[match.end():] + ".",
+            "options": options,
+            "correctIndex": options.index(answer)
+        })
+    return questions or None
+
+
+def benchmark(duration_minutes: int = 180, repeat: int = 3) -> Dict[str, Any]:
+    """Time ranking and both generators on a synthetic lecture (one sentence every 4 seconds)"""
+    subjects = ["cache", "pipeline", "scheduler", "allocator", "compiler", "protocol", "kernel", "database"]
+    sentences = []
+    for i in range(duration_minutes * 15):
+        subject = subjects[i % len(subjects)]
+        other = subjects[(i * 3 + 1) % len(subjects)]
+        if i % 7 == 0:
+            sentences.append(f"A {subject} {i % 13} is defined as the component that coordinates the {other} state")
+        else:
+            sentences.append(f"The {subject} keeps shared data consistent while the {other} handles "
+                             f"request {i % 41} under heavy load")
+    paragraphs = [". ".join(sentences[i:i + 6]) + "." for i in range(0, len(sentences), 6)]
+    content = {"id": "benchmark", "content": "\n\n".join(paragraphs)}
+    content["key_terms"] = extract_key_terms(fallback_paragraphs(content["content"]))
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            random.seed(0)
+            _ranked_cache.clear()
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    rank_seconds, ranked = timed(lambda: rank_content(content, budget_seconds=30))
+    notecard_seconds, cards = timed(lambda: generate_extractive_notecards(content, 5, budget_seconds=30))
+    quiz_seconds, questions = timed(lambda: generate_extractive_quiz(content, 10, budget_seconds=30))
+    return {
+        "characters": len(content["content"]),
+        "sentences": len(ranked.sentences),
+        "method": ranked.method,
+        "rank_seconds": rank_seconds,
+        "notecards_seconds": notecard_seconds,
+        "quiz_seconds": quiz_seconds,
+        "cards": len(cards or []),
+        "questions": len(questions or []),
+    }
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 3-hour lecture: {report['characters'] / 1024:.1f} KiB, "
+          f"{report['sentences']} candidate sentences ranked with {report['method']}")
+    print(f"rank {report['rank_seconds'] * 1000:.1f} ms  "
+          f"notecards {report['notecards_seconds'] * 1000:.1f} ms ({report['cards']})  "
+          f"quiz {report['quiz_seconds'] * 1000:.1f} ms ({report['questions']})")
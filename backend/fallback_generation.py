@@ -0,0 +1,736 @@
+"""
+Fallback notecard and quiz generation used when the RAG API is unavailable.
+
+The generators used to find topics by rescanning every paragraph (lowercasing
+it again) for each candidate term, and the fill-in-the-blank loop re-split
+the whole text on every attempt. ``ContentIndex`` lowercases and splits a
+source once: term lookups are ``str.find`` scans over the joined text mapped
+back to sentences by offset, memoized per term. They return exactly what the
+old ``term in paragraph`` scans returned.
+
+Run ``python fallback_generation.py`` to time both generators on a synthetic
+lecture with and without the index.
+"""
+
+import random
+import re
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List
+
+from transcript_enrichment import extract_key_terms, fallback_paragraphs
+
+# Joins sentences in the searchable text; never part of a term
+_SEPARATOR = "\x00"
+
+
+class ContentIndex:
+    """
+    Sentence offsets over the paragraphs of one source
+
+    Sentences are the ``'.'``-separated pieces of each paragraph, as the
+    generators split them. Matching is substring matching, like ``in``.
+    """
+
+    def __init__(self, paragraphs: List[str], indexed: bool = True):
+        """
+        Args:
+            paragraphs: Paragraphs of the source
+            indexed: False rescans (and re-lowercases) the sentences on every
+                lookup, like the generators used to; only for benchmarking
+        """
+        self.paragraphs = paragraphs
+        self.indexed = indexed
+        self._lowered_paragraphs = None
+        self._words_by_length = None
+        self._lookups = {}
+
+        # (paragraph index, sentence) pairs
+        self.sentences = [
+            (paragraph_id, sentence)
+            for paragraph_id, paragraph in enumerate(paragraphs)
+            for sentence in paragraph.split('.')
+        ]
+        self.lowered = [sentence.lower() for _, sentence in self.sentences]
+
+        # Joined text and sentence start offsets, lowercased and as written
+        self._text, self._starts = self._join(self.lowered)
+        self._raw_text, self._raw_starts = self._join(sentence for _, sentence in self.sentences)
+
+    @staticmethod
+    def _join(sentences: Iterable[str]):
+        starts = []
+        position = 0
+        pieces = []
+        for sentence in sentences:
+            starts.append(position)
+            pieces.append(sentence)
+            position += len(sentence) + len(_SEPARATOR)
+        return _SEPARATOR.join(pieces), starts
+
+    @property
+    def lowered_paragraphs(self) -> List[str]:
+        if self._lowered_paragraphs is None:
+            self._lowered_paragraphs = [paragraph.lower() for paragraph in self.paragraphs]
+        return self._lowered_paragraphs
+
+    def _sentence_ids(self, term: str, case_sensitive: bool = False) -> List[int]:
+        """Ids of the sentences containing the term, ascending."""
+        needle = term if case_sensitive else term.lower()
+        if not self.indexed:
+            return [i for i, (_, sentence) in enumerate(self.sentences)
+                    if needle in (sentence if case_sensitive else sentence.lower())]
+
+        key = (term, case_sensitive)
+        if key in self._lookups:
+            return self._lookups[key]
+
+        if not needle:
+            sentence_ids = list(range(len(self.sentences)))
+        else:
+            text, starts = (self._raw_text, self._raw_starts) if case_sensitive else (self._text, self._starts)
+            sentence_ids = []
+            position = text.find(needle)
+            while position != -1:
+                sentence_id = bisect_right(starts, position) - 1
+                sentence_ids.append(sentence_id)
+                if sentence_id + 1 == len(starts):
+                    break
+                # A sentence is reported once; continue from the next one
+                position = text.find(needle, starts[sentence_id + 1])
+
+        self._lookups[key] = sentence_ids
+        return sentence_ids
+
+    def _paragraph_ids(self, term: str) -> List[int]:
+        query = term.lower()
+        if '.' in query:
+            # Can span sentences; check whole paragraphs
+            return [i for i, lowered in enumerate(self.lowered_paragraphs) if query in lowered]
+        return list(dict.fromkeys(self.sentences[i][0] for i in self._sentence_ids(term)))
+
+    def paragraphs_with(self, term: str) -> List[str]:
+        """Paragraphs containing the term (case-insensitive), in order."""
+        return [self.paragraphs[i] for i in self._paragraph_ids(term)]
+
+    def paragraphs_with_any(self, terms: Iterable[str]) -> List[str]:
+        """Paragraphs containing at least one of the terms (case-insensitive), in order."""
+        paragraph_ids = set()
+        for term in terms:
+            paragraph_ids.update(self._paragraph_ids(term))
+        return [self.paragraphs[i] for i in sorted(paragraph_ids)]
+
+    def contains(self, term: str) -> bool:
+        """Return True if any paragraph contains the term (case-insensitive)."""
+        return bool(self._paragraph_ids(term))
+
+    def first_paragraph(self, term: str) -> str:
+        """First paragraph containing the term (case-insensitive), or ""."""
+        paragraph_ids = self._paragraph_ids(term)
+        return self.paragraphs[paragraph_ids[0]] if paragraph_ids else ""
+
+    def sentences_with(self, term: str) -> List[str]:
+        """Sentences containing the term (case-insensitive), in order."""
+        return [self.sentences[i][1] for i in self._sentence_ids(term)]
+
+    def first_sentence(self, term: str, case_sensitive: bool = False) -> str:
+        """First sentence containing the term, stripped and ending with '.', or ""."""
+        sentence_ids = self._sentence_ids(term, case_sensitive=case_sensitive)
+        return self.sentences[sentence_ids[0]][1].strip() + "." if sentence_ids else ""
+
+    def sentences_with_any(self, terms: Iterable[str], min_paragraph_length: int = 0) -> List[str]:
+        """Sentences containing at least one of the terms (case-insensitive), in order."""
+        sentence_ids = set()
+        for term in terms:
+            sentence_ids.update(self._sentence_ids(term))
+        return [
+            self.sentences[i][1] for i in sorted(sentence_ids)
+            if len(self.paragraphs[self.sentences[i][0]]) >= min_paragraph_length
+        ]
+
+    def word_counts(self, minimum: int, maximum: int) -> Counter:
+        """Occurrences of each lowercased word (punctuation stripped) with a length in [minimum, maximum]."""
+        if self._words_by_length is None or not self.indexed:
+            self._words_by_length = defaultdict(Counter)
+            # Count raw tokens first; stripping is then done once per distinct token
+            for token, count in Counter(" ".join(self.lowered_paragraphs).split()).items():
+                word = token.strip(".,;:()[]{}")
+                self._words_by_length[len(word)][word] += count
+        counts = Counter()
+        for length in range(max(minimum, 0), maximum + 1):
+            counts.update(self._words_by_length.get(length, {}))
+        return counts
+
+
+def generate_fallback_notecards(content: Dict[str, Any], num_cards: int, indexed: bool = True) -> List[Dict[str, str]]:
+    """
+    Generate notecards from a source's text without the RAG API
+
+    Args:
+        content: Source dict with ``id``, ``content`` and optionally the ingest-time ``key_terms``
+        num_cards: Number of cards wanted
+        indexed: Look terms up through the ContentIndex sentence offsets (False rescans the sentences, for benchmarking)
+
+    Returns:
+        List of ``{id, front, back}`` cards
+    """
+    # Extract educational content from cleaned transcript
+    paragraphs = fallback_paragraphs(content["content"])
+    index = ContentIndex(paragraphs, indexed=indexed)
+    
+    # Key terms and topics; precomputed at ingest for lecture transcripts
+    key_terms = content.get("key_terms") or extract_key_terms(paragraphs)
+    defined_terms = key_terms["defined_terms"]
+    potential_topics = key_terms["potential_topics"]
+    key_topics = key_terms["key_topics"]
+    
+    # Create cards around the identified topics
+    cards = []
+    
+    # First, create cards from defined terms (highest quality)
+    for term in defined_terms[:min(num_cards, len(defined_terms))]:
+        # Validate term format (don't use terms that are nonsensical fragments)
+        term = term.strip()
+        # Skip terms that contain partial words or don't make grammatical sense
+        if (len(term.split()) > 5 or  # Skip terms that are too long (likely sentence fragments)
+            len(term) < 4 or  # Skip terms that are too short 
+            term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'in', 'on', 'at', 'with', 'by', 'for')) or
+            not all(len(word) > 1 for word in term.split())): # Skip terms with single-letter words
+            continue
+        
+        # Find the full definition sentence
+        definition_sentence = index.first_sentence(term, case_sensitive=True)
+    
+        if definition_sentence and len(definition_sentence) > 20:
+            cards.append({
+                "id": f"card_{content['id']}_{len(cards)}",
+                "front": f"What is {term}? Define this concept.",
+                "back": definition_sentence if len(definition_sentence) > 20 else f"A key concept related to {key_topics[0] if key_topics else 'the subject'}."
+            })
+    
+    # Create a list of validated, high-quality topics
+    validated_topics = []
+    for topic in key_topics:
+        if len(topic) > 3 and not topic.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as')):
+            # Look for evidence this is really a topic in the content
+            if index.contains(topic):
+                validated_topics.append(topic)
+    
+    # Then create cards based on validated key topics
+    for topic in validated_topics[:min(num_cards - len(cards), len(validated_topics))]:
+        # Find a relevant paragraph that mentions this topic
+        relevant_paragraph = index.first_paragraph(topic)
+        
+        if not relevant_paragraph and paragraphs:
+            # Fall back to first paragraph if no specific mention
+            relevant_paragraph = paragraphs[0]
+                
+        cards.append({
+            "id": f"card_{content['id']}_{len(cards)}",
+            "front": f"Explain the key concepts and principles of {topic}:",
+            "back": relevant_paragraph if relevant_paragraph else f"A fundamental concept in the subject material."
+        })
+    
+    # Finally, add cards for any remaining specific terms that are of high quality
+    remaining_slots = num_cards - len(cards)
+    if remaining_slots > 0 and potential_topics:
+        # Filter potential topics to ensure they're proper terms
+        validated_terms = []
+        for term in potential_topics:
+            # Basic validation to ensure term is an actual meaningful term
+            if (isinstance(term, str) and 
+                len(term) >= 4 and 
+                not term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'the', 'in', 'on', 'at')) and
+                not term.lower().endswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'the')) and
+                not any(frag in term.lower() for frag in ['ontinue', ' to be ', ' while ', ' that ', ' which ', ' then ']) and
+                not re.search(r'^[a-z]+ [a-z]+ [a-z]+ [a-z]+$', term)): # Avoid sentence fragments
+                # Look for evidence this is a real term in the content
+                if index.contains(term):
+                    validated_terms.append(term)
+        
+        for term in validated_terms[:remaining_slots]:
+            # Find relevant content for this term
+            relevant_text = index.first_paragraph(term)
+                
+            if not relevant_text and paragraphs:
+                # Only use a random paragraph as a last resort, and only if it's high quality
+                if len(paragraphs) > 0 and any(len(p) > 200 for p in paragraphs):
+                    # Select the longest paragraph as it likely has most content
+                    relevant_text = max(paragraphs, key=len)
+                
+            if relevant_text and len(relevant_text) > 50:
+                cards.append({
+                    "id": f"card_{content['id']}_{len(cards)}",
+                    "front": f"What is the significance of {term} in this subject?",
+                    "back": relevant_text
+                })
+    
+    # If still no good cards, create some based on sentences with educational keywords
+    if len(cards) < 2:
+        # Look for sentences that contain educational keywords
+        educational_keywords = ['defined', 'concept', 'principle', 'theory', 'method', 
+                              'important', 'significant', 'key', 'fundamental', 
+                              'framework', 'approach', 'technique', 'model']
+        educational_sentences = [sentence.strip() + '.' for sentence in index.sentences_with_any(educational_keywords)
+                                 if len(sentence.strip()) > 30]
+        
+        # Select the top educational sentences
+        # Remove duplicates, best scoring first when sentence scores were computed at ingest
+        sentence_scores = dict(content.get("sentence_scores") or [])
+        educational_sentences = sorted(dict.fromkeys(educational_sentences),
+                                       key=lambda sentence: sentence_scores.get(sentence, 0), reverse=True)
+        for i, sentence in enumerate(educational_sentences[:min(num_cards - len(cards), len(educational_sentences))]):
+            # Extract a potential topic from the sentence
+            words = sentence.split()
+            topic_phrase = ""
+            
+            # Look for capitalized terms or first sentence components
+            for j, word in enumerate(words[:10]):  # Check first 10 words
+                if word and word[0].isupper() and len(word) > 3:
+                    if j < len(words) - 1:  # If not the last word
+                        topic_phrase = f"{word} {words[j+1]}"
+                    else:
+                        topic_phrase = word
+                    break
+            
+            # If no capitalized term, use a generic question
+            if not topic_phrase:
+                if sentence.lower().startswith('the '):
+                    topic_phrase = ' '.join(words[1:min(4, len(words))])
+                else:
+                    topic_phrase = ' '.join(words[:min(3, len(words))])
+                
+            cards.append({
+                "id": f"card_{content['id']}_{len(cards)}",
+                "front": f"Explain this key concept from the material: '{topic_phrase}'",
+                "back": sentence
+            })
+    
+    # Ensure we have at least one card
+    if not cards and paragraphs:
+        # Find the best paragraph - the one with most educational content
+        best_paragraph = ""
+        max_score = 0
+        
+        for paragraph in paragraphs:
+            if len(paragraph) < 50:
+                continue
+                
+            score = 0
+            # Score based on educational terms
+            educational_terms = ['defined', 'concept', 'principle', 'theory', 'method', 
+                               'important', 'significant', 'key', 'fundamental']
+            paragraph_lower = paragraph.lower()
+            for term in educational_terms:
+                if term in paragraph_lower:
+                    score += 2
+            
+            # Score based on paragraph length (but not too long)
+            if 100 <= len(paragraph) <= 500:
+                score += 3
+            
+            # Score based on sentence structure
+            sentences = [s for s in paragraph.split('.') if len(s.strip()) > 0]
+            if 2 <= len(sentences) <= 5:  # Good paragraph size
+                score += 2
+                
+            if score > max_score:
+                max_score = score
+                best_paragraph = paragraph
+        
+        if best_paragraph:
+            cards.append({
+                "id": f"card_{content['id']}_0",
+                "front": "What are the key concepts covered in this material?",
+                "back": best_paragraph
+            })
+        else:
+            # Last resort - create a generic card
+            cards.append({
+                "id": f"card_{content['id']}_0",
+                "front": "Summarize the main points from this material:",
+                "back": "This material covers important concepts in " + 
+                      (key_topics[0] if key_topics else "the subject area") + "."
+            })
+
+    return cards
+
+
+def generate_fallback_quiz(content: Dict[str, Any], num_questions: int, difficulty: str = "medium",
+                           indexed: bool = True) -> List[Dict[str, Any]]:
+    """
+    Generate quiz questions from a source's text without the RAG API
+
+    Args:
+        content: Source dict with ``id``, ``content`` and optionally the ingest-time ``key_terms``
+        num_questions: Number of questions wanted
+        difficulty: "easy", "medium" or "hard"
+        indexed: Look terms up through the ContentIndex sentence offsets (False rescans the sentences, for benchmarking)
+
+    Returns:
+        List of ``{question, options, correctIndex}`` questions
+    """
+    # Extract educational content from cleaned transcript
+    paragraphs = fallback_paragraphs(content["content"])
+    index = ContentIndex(paragraphs, indexed=indexed)
+    
+    # Key terms and topics; precomputed at ingest for lecture transcripts
+    key_terms = content.get("key_terms") or extract_key_terms(paragraphs)
+    defined_terms = key_terms["defined_terms"]
+    potential_topics = key_terms["potential_topics"]
+    key_topics = key_terms["key_topics"]
+    
+    # Generate quiz questions based on identified topics and terms
+    questions = []
+    
+    # First, create questions from defined terms (highest quality)
+    for term in defined_terms[:min(num_questions // 2, len(defined_terms))]:
+        # Validate term format (avoid nonsensical fragments)
+        term = term.strip()
+        # Skip terms that contain partial words or don't make grammatical sense
+        if (len(term.split()) > 5 or  # Skip terms that are too long (likely sentence fragments)
+            len(term) < 4 or  # Skip terms that are too short 
+            term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'in', 'on', 'at', 'with', 'by', 'for')) or
+            not all(len(word) > 1 for word in term.split())): # Skip terms with single-letter words
+            continue
+        
+        # Find the full definition sentence
+        definition_sentence = index.first_sentence(term, case_sensitive=True)
+        
+        if definition_sentence and len(definition_sentence) > 20:
+            # Create a multiple choice question about the definition
+            options = []
+            
+            # The correct answer is the actual definition
+            correct_option = definition_sentence
+            options.append(correct_option)
+            
+            # Generate plausible but incorrect alternatives
+            # Option 1: Take a different sentence from the same paragraph
+            alternative_sentences = [s for s in paragraphs[0].split('.') if len(s) > 25 and s.strip() != definition_sentence]
+            if alternative_sentences and len(alternative_sentences) > 0:
+                options.append(alternative_sentences[0].strip() + ".")
+            else:
+                # Fallback - invert some meaning
+                inverted = definition_sentence.replace("is", "is not").replace("can", "cannot")
+                if inverted == definition_sentence:  # If no change, be more creative
+                    inverted = "This is unrelated to the subject matter."
+                options.append(inverted)
+                
+            # Option 2: Create a definition for a different term
+            other_term = None
+            for t in defined_terms:
+                if t != term:
+                    other_term = t
+                    break
+            if other_term:
+                options.append(f"{other_term} is a key concept in this domain.")
+            else:
+                options.append(f"None of these concepts are relevant to {term}.")
+                
+            # Option 3: Complete distractor
+            if key_topics:
+                options.append(f"This relates to an entirely different field of {key_topics[0] if key_topics[0] != term else 'study'}.")
+            else:
+                options.append("This concept is from a different subject area entirely.")
+            
+            # Shuffle options and determine correct index
+            correct_idx = 0  # Correct answer is the first one before shuffling
+            correct_answer = options[correct_idx]
+            random.shuffle(options)
+            correct_idx = options.index(correct_answer)
+            
+            question_text = f"Which of the following correctly describes {term}?"
+            if difficulty == "hard":
+                question_text = f"Which of the following best characterizes the concept of {term} as used in this context?"
+            elif difficulty == "easy":
+                question_text = f"What is {term}?"
+            
+            questions.append({
+                "question": question_text,
+                "options": options,
+                "correctIndex": correct_idx
+            })
+    
+    # Create a list of validated, high-quality topics
+    validated_topics = []
+    for topic in key_topics:
+        if len(topic) > 3 and not topic.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as')):
+            # Look for evidence this is really a topic in the content
+            if index.contains(topic):
+                validated_topics.append(topic)
+    
+    # Then create questions about validated key topics/concepts
+    for topic in validated_topics[:min(num_questions - len(questions), len(validated_topics))]:
+        # Find relevant paragraphs for this topic
+        relevant_paragraphs = index.paragraphs_with(topic)
+        
+        if not relevant_paragraphs and paragraphs:
+            continue  # Skip if no relevant paragraphs - don't default to random
+        
+        if relevant_paragraphs:
+            # Create a question about this topic
+            if difficulty == "easy":
+                question_text = f"Which of the following relates to {topic}?"
+            elif difficulty == "medium":
+                question_text = f"Which statement correctly describes a key aspect of {topic}?"
+            else:  # hard
+                question_text = f"Which of the following best represents an advanced principle of {topic}?"
+        
+            # Create options - the first one is correct
+            options = []
+        
+            # Extract or create a correct statement about the topic
+            topic_sentences = [s.strip() + "." for s in index.sentences_with(topic) if len(s.strip()) > 20]
+            
+            if topic_sentences:
+                correct_option = topic_sentences[0]
+            else:
+                # Fall back to first sentence of relevant paragraph
+                correct_option = relevant_paragraphs[0].split('.')[0] + "."
+                
+            if len(correct_option) < 20 or len(correct_option) > 200:  # If too short or too long
+                continue  # Skip this topic
+            
+            options.append(correct_option)
+            
+            # Generate plausible but incorrect alternatives
+            # Option 1: Take content from a different topic if available
+            other_content = ""
+            for other_topic in validated_topics:
+                if other_topic != topic:
+                    for paragraph in index.paragraphs_with(other_topic):
+                        if len(paragraph) > 30:
+                            sentences = [s.strip() + "." for s in paragraph.split('.') if len(s.strip()) > 20]
+                            if sentences:
+                                other_content = sentences[0]
+                                break
+                    if other_content:
+                        break
+            
+            if other_content:
+                options.append(other_content)
+            else:
+                # Fallback - create a statement that reverses meaning
+                reversed_meaning = correct_option.replace("is", "is not").replace("should", "should not")
+                if reversed_meaning == correct_option:  # If no change
+                    reversed_meaning = f"This topic is unrelated to {topic}."
+                options.append(reversed_meaning)
+            
+            # Option 2 & 3: More challenging distractors
+            options.append(f"The concept of {topic} is primarily used in fields unrelated to this subject matter.")
+            options.append(f"None of the material contains substantive information about {topic}.")
+            
+            # Shuffle options and track correct answer
+            correct_idx = 0  # Correct answer is the first one
+            correct_answer = options[correct_idx]
+            random.shuffle(options)
+            correct_idx = options.index(correct_answer)
+            
+            questions.append({
+                "question": question_text,
+                "options": options,
+                "correctIndex": correct_idx
+            })
+    
+    # If we still need more questions, create high-quality fill-in-the-blank questions
+    # Select paragraphs with sufficient educational content (and a basic quality check)
+    educational_terms = ['concept', 'principle', 'theory', 'method', 'important', 'key']
+    candidate_paragraphs = [p for p in index.paragraphs_with_any(educational_terms) if 100 <= len(p) <= 1000]
+    if not candidate_paragraphs:
+        candidate_paragraphs = [p for p in paragraphs if len(p) >= 100]
+    topic_words = {t.lower() for t in potential_topics}
+    
+    attempts = 0
+    while len(questions) < num_questions and paragraphs and attempts < 10:
+        attempts += 1
+        
+        if not candidate_paragraphs:
+            break  # No suitable paragraphs found
+            
+        paragraph = random.choice(candidate_paragraphs)
+        sentences = [s.strip() for s in paragraph.split('.') if len(s.strip()) > 30]
+        
+        if not sentences:
+            continue
+        
+        # Select the longest sentence which likely has more content
+        sentence = max(sentences, key=len)
+        words = sentence.split()
+        
+        if len(words) < 8:  # Skip very short sentences
+            continue
+        
+        # Choose a word to blank out - prefer nouns or technical terms
+        candidate_positions = []
+        for i, word in enumerate(words):
+            # Skip first and last few words
+            if i < 2 or i > len(words) - 3:
+                continue
+            # Skip common words and very short words
+            if word.lower() in ["the", "and", "or", "but", "for", "with", "that", "this", "were", "was", "had", "has"] or len(word) < 4:
+                continue
+            # Prioritize capitalized words and technical terms
+            priority = 1
+            if word[0].isupper():
+                priority += 2
+            if word.lower() in topic_words:
+                priority += 3
+            # Favor words in middle of sentence
+            middle_position_score = 1 - abs((i / len(words)) - 0.5)  # 0.5 is middle, score higher near middle
+            priority += middle_position_score * 2
+            
+            candidate_positions.append((i, priority))
+        
+        # If no good candidates, skip this sentence
+        if not candidate_positions:
+            continue
+        
+        # Sort by priority
+        candidate_positions.sort(key=lambda x: x[1], reverse=True)
+        blank_idx = candidate_positions[0][0]
+        
+        # Create the question
+        correct_word = words[blank_idx]
+        # Skip very short words or common words after additional validation
+        if len(correct_word) < 4 or correct_word.lower() in ["from", "that", "with", "have", "this", "what", "when", "where", "which"]:
+            continue
+            
+        words[blank_idx] = "_____"
+        question_text = "Complete the following statement: " + ' '.join(words)
+        
+        # Create options - correct answer + 3 distractors
+        options = [correct_word]
+        
+        # Add distractor options - use other words from the text
+        # Look for similar words for more challenging distractors, weighted by how often they occur
+        distractors = index.word_counts(max(len(correct_word) - 2, 4), len(correct_word) + 2)
+        for word in [correct_word.lower(), "from", "that", "with", "have", "this", "what", "when", "where", "which"]:
+            distractors.pop(word, None)
+        
+        # If we have enough distractors, use them; otherwise create some
+        if sum(distractors.values()) >= 3:
+            options.extend(random.sample(list(distractors), 3, counts=list(distractors.values())))
+        else:
+            # Add some generic alternatives based on the correct word
+            if correct_word.endswith("ing"):
+                options.append(correct_word.replace("ing", "ed"))
+            else:
+                options.append(correct_word + "ed")
+                
+            if correct_word.endswith("s"):
+                options.append(correct_word[:-1])
+            else:
+                options.append(correct_word + "s")
+                
+            options.append("none of these")
+        
+        # Ensure we have exactly 4 options
+        options = options[:4]
+        while len(options) < 4:
+            options.append(f"Option {len(options)+1}")
+        
+        # Ensure options are unique
+        if len(set(options)) < 4:
+            continue  # Skip if we can't generate 4 unique options
+        
+        # Shuffle options and track the correct answer
+        correct_idx = 0  # The first option is the correct one
+        correct_answer = options[correct_idx]
+        
+        random.shuffle(options)
+        correct_idx = options.index(correct_answer)
+        
+        questions.append({
+            "question": question_text,
+            "options": options,
+            "correctIndex": correct_idx
+        })
+    
+    # Ensure we have at least one question
+    if not questions and paragraphs:
+        # Create a high-quality conceptual question about the material
+        # Look for sentences containing educational terms
+        educational_keywords = ['concept', 'principle', 'theory', 'method', 'important', 'key', 'fundamental']
+        educational_sentences = [
+            sentence.strip() + "." for sentence in index.sentences_with_any(educational_keywords, min_paragraph_length=50)
+            if len(sentence.strip()) > 30
+        ]
+        
+        main_topic = key_topics[0] if key_topics else "the subject"
+        
+        if educational_sentences:
+            # Use a good educational sentence as the correct answer
+            options = [
+                educational_sentences[0],
+                f"This material contains no substantive information about {main_topic}.",
+                f"The content is primarily focused on administrative matters rather than {main_topic}.",
+                "None of the provided statements accurately reflect the content."
+            ]
+        else:
+            # Generic options as fallback
+            options = [
+                f"The material focuses primarily on {main_topic}.",
+                "The content does not contain any educational material.",
+                "This material is entirely unrelated to the subject matter.",
+                "None of the statements correctly describe the content."
+            ]
+        
+        correct_idx = 0  # The first option is the correct one
+        
+        questions.append({
+            "question": "Which statement best characterizes the educational content of this material?",
+            "options": options,
+            "correctIndex": correct_idx
+        })
+
+    return questions
+
+
+def benchmark(duration_minutes: int = 180, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time the fallback generators on a synthetic lecture, with and without the index
+
+    The lecture has one sentence every 4 seconds, grouped into paragraphs of
+    six sentences, and mentions many distinct technical terms so topic lookups
+    have real work to do.
+    """
+    subjects = ["Cache", "Pipeline", "Scheduler", "Allocator", "Compiler", "Protocol", "Kernel", "Database"]
+    sentences = []
+    for i in range(duration_minutes * 15):
+        subject = f"{subjects[i % len(subjects)]}{i % 97}"
+        if i % 5 == 0:
+            sentences.append(f"The {subject} Model is defined as a method for managing shared state")
+        else:
+            sentences.append(f"An important concept is that {subject} keeps data consistent under load "
+                             f"while the server handles each request and query")
+    paragraphs = [". ".join(sentences[i:i + 6]) + "." for i in range(0, len(sentences), 6)]
+    content = {"id": "benchmark", "content": "\n\n".join(paragraphs)}
+    content["key_terms"] = extract_key_terms(fallback_paragraphs(content["content"]))
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            random.seed(0)  # the generators pick paragraphs and options at random
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    results = {"characters": len(content["content"])}
+    for indexed in (False, True):
+        name = "indexed" if indexed else "scan"
+        results[name] = {
+            "notecards_seconds": timed(lambda: generate_fallback_notecards(content, 5, indexed=indexed)),
+            "quiz_seconds": timed(lambda: generate_fallback_quiz(content, 5, indexed=indexed)),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 3-hour lecture: {report['characters'] / 1024:.1f} KiB")
+    for name in ("scan", "indexed"):
+        entry = report[name]
+        print(f"{name:8s} notecards {entry['notecards_seconds'] * 1000:8.1f} ms  quiz {entry['quiz_seconds'] * 1000:8.1f} ms")
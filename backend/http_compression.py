@@ -0,0 +1,328 @@
+"""
+gzip / zstd compression for HTTP request and response bodies.
+
+``CompressionMiddleware`` is a plain ASGI middleware added to both FastAPI
+apps. It:
+
+- decompresses request bodies sent with ``Content-Encoding: gzip`` or ``zstd``
+  (so the extension and the backend can upload transcripts compressed)
+- compresses responses larger than ``minimum_size`` using the best encoding the
+  client accepts (zstd if the ``zstandard`` package is installed, else gzip)
+
+Streaming responses (more than one body chunk) and ``text/event-stream`` are
+passed through untouched.
+
+``post_json`` is the matching client helper used by the backend to call the
+RAG service with a compressed body.
+
+Shared by the backend and the RAG service: ``backend/http_compression.py``
+and ``summarization/http_compression.py`` are the same file, and
+``backend/test_shared_modules.py`` fails when they differ.
+"""
+
+import gzip
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+# Bodies smaller than this are not worth compressing
+DEFAULT_MINIMUM_SIZE = int(os.getenv("HTTP_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Refuse request bodies that inflate past this size (decompression bombs)
+MAX_DECOMPRESSED_BYTES = int(os.getenv("HTTP_COMPRESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+EXCLUDED_CONTENT_TYPES = ("text/event-stream",)
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Content encodings this process can decode and produce, best first."""
+    return ("zstd", "gzip") if ZSTD_AVAILABLE else ("gzip",)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress bytes with the given content encoding."""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    if encoding == "zstd" and ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def decompress(data: bytes, encoding: str, max_size: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Decompress bytes with the given content encoding
+
+    Raises:
+        ValueError: If the encoding is unsupported, the data is corrupt or it
+            inflates past ``max_size``
+    """
+    try:
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            result = decompressor.decompress(data, max_size + 1)
+        elif encoding == "zstd" and ZSTD_AVAILABLE:
+            reader = zstandard.ZstdDecompressor().stream_reader(data)
+            result = reader.read(max_size + 1)
+        else:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+    except (zlib.error, EOFError) as e:
+        raise ValueError(f"Invalid {encoding} body: {str(e)}")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise ValueError(f"Invalid {encoding} body: {str(e)}")
+        raise
+
+    if len(result) > max_size:
+        raise ValueError(f"Decompressed body exceeds {max_size} bytes")
+    return result
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip())
+
+    for encoding in supported_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def compress_json(payload: Any, encoding: Optional[str] = None,
+                  minimum_size: int = DEFAULT_MINIMUM_SIZE) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Serialize a payload to JSON, compressing it if it is large enough
+
+    Args:
+        payload: JSON-serializable object
+        encoding: Content encoding to use (defaults to the best supported one)
+        minimum_size: Bodies smaller than this are sent uncompressed
+
+    Returns:
+        Tuple of (body bytes, headers to send with it)
+    """
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if len(body) >= minimum_size:
+        encoding = encoding or supported_encodings()[0]
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def post_json(url: str, payload: Any, timeout: float = 30, headers: Optional[Dict[str, str]] = None,
+              encoding: Optional[str] = None, minimum_size: int = DEFAULT_MINIMUM_SIZE) -> requests.Response:
+    """
+    POST a JSON payload with a compressed body and accept compressed responses
+
+    The receiving service must run ``CompressionMiddleware``.
+    """
+    body, body_headers = compress_json(payload, encoding=encoding, minimum_size=minimum_size)
+    body_headers["Accept-Encoding"] = ", ".join(supported_encodings())
+    if headers:
+        body_headers.update(headers)
+    return requests.post(url, data=body, headers=body_headers, timeout=timeout)
+
+
+def _header(headers, name: bytes) -> str:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def _send_plain(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """ASGI middleware for compressed request and response bodies"""
+
+    def __init__(self, app, minimum_size: int = DEFAULT_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = scope.get("headers", [])
+        content_encoding = _header(request_headers, b"content-encoding").strip().lower()
+
+        if content_encoding and content_encoding != "identity":
+            if content_encoding not in supported_encodings():
+                await _send_plain(send, 415, f"Unsupported Content-Encoding: {content_encoding}")
+                return
+
+            chunks = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunks.append(message.get("body", b""))
+                more_body = message.get("more_body", False)
+
+            try:
+                body = decompress(b"".join(chunks), content_encoding)
+            except ValueError as e:
+                await _send_plain(send, 400, str(e))
+                return
+
+            scope = dict(scope)
+            scope["headers"] = [
+                (key, value) for key, value in request_headers
+                if key.lower() not in (b"content-encoding", b"content-length")
+            ] + [(b"content-length", str(len(body)).encode())]
+
+            body_sent = False
+            receive_upstream = receive
+
+            async def receive():
+                nonlocal body_sent
+                if body_sent:
+                    # Body already delivered: wait for the real disconnect (streaming
+                    # responses listen for it and stop as soon as it arrives)
+                    return await receive_upstream()
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+
+        response_encoding = choose_encoding(_header(request_headers, b"accept-encoding"))
+        if response_encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, streaming
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = list(start_message.get("headers", []))
+            content_type = _header(headers, b"content-type")
+
+            if (message.get("more_body", False)
+                    or _header(headers, b"content-encoding")
+                    or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+                    or len(body) < self.minimum_size):
+                # Streaming, already encoded, or too small: pass through unchanged
+                streaming = message.get("more_body", False)
+                await send(start_message)
+                await send(message)
+                return
+
+            body = compress(body, response_encoding)
+            headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+            headers += [
+                (b"content-encoding", response_encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send(dict(start_message, headers=headers))
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def benchmark(duration_minutes: int = 120, link_mbps: float = 10.0, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Measure bytes on the wire and latency for a transcript upload
+
+    A synthetic lecture (one segment every 4 seconds) is posted as a
+    ``/zoom/store-transcript`` style payload to an in-process FastAPI app running
+    ``CompressionMiddleware``, which echoes it back. Latency is the measured
+    round trip plus the time both bodies take over a ``link_mbps`` connection.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return await request.json()
+
+    client = TestClient(app)
+
+    words = ("the cache line is fetched from memory and the tag is compared against the "
+             "address while the coherence protocol keeps every processor consistent").split()
+    segments = []
+    for i in range(duration_minutes * 60 // 4):
+        seconds = i * 4
+        text = " ".join(words[(i * 3 + j) % len(words)] for j in range(10 + i % 9))
+        segments.append({"timestamp_seconds": seconds, "timestamp": f"{seconds//60:02d}:{seconds%60:02d}", "text": text})
+    payload = {"recording_id": "benchmark", "transcript_data": segments, "segment_count": len(segments)}
+
+    results = {"segments": len(segments), "link_mbps": link_mbps}
+    for encoding in ("identity",) + supported_encodings():
+        if encoding == "identity":
+            body, headers = compress_json(payload, minimum_size=float("inf"))
+            headers["Accept-Encoding"] = "identity"
+        else:
+            body, headers = compress_json(payload, encoding=encoding, minimum_size=0)
+            headers["Accept-Encoding"] = encoding
+
+        best = float("inf")
+        response_bytes = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if encoding != "identity":
+                body, _ = compress_json(payload, encoding=encoding, minimum_size=0)
+            response = client.post("/echo", content=body, headers=headers)
+            response.json()
+            response_bytes = response.num_bytes_downloaded
+            best = min(best, time.perf_counter() - start)
+
+        wire_bytes = len(body) + response_bytes
+        results[encoding] = {
+            "request_bytes": len(body),
+            "response_bytes": response_bytes,
+            "round_trip_seconds": best,
+            "latency_seconds": best + wire_bytes * 8 / (link_mbps * 1_000_000),
+        }
+
+    return results
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 2-hour lecture: {report['segments']} segments, {report['link_mbps']} Mbit/s link")
+    for encoding in ("identity",) + supported_encodings():
+        entry = report[encoding]
+        print(f"{encoding:9s} request {entry['request_bytes'] / 1024:8.1f} KiB  "
+              f"response {entry['response_bytes'] / 1024:8.1f} KiB  "
+              f"round trip {entry['round_trip_seconds'] * 1000:7.1f} ms  "
+              f"est. latency {entry['latency_seconds'] * 1000:7.1f} ms")
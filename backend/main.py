@@ -13,18 +13,32 @@ import logging
 import uuid
 import json
 import time
-import random
 import requests
-import re  # Add at the top with other imports
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from http_compression import CompressionMiddleware, post_json
+from metrics import MetricsMiddleware, counter, gauge, histogram, metrics_response
+from tracing import KIND_CLIENT, TraceLogFilter, TracingMiddleware, bind, instrument_httpx, outgoing_headers, set_service, span
+from transcript_codec import encode_transcript, decode_transcript, format_transcript, segment_count as count_segments
+from transcript_cleaning import clean_text
+from transcript_enrichment import ENRICHMENT_COLUMNS, enrich_transcript, is_enriched
+from fallback_generation import generate_fallback_notecards, generate_fallback_quiz
+from extractive_generation import embedding_status, generate_extractive_notecards, generate_extractive_quiz
+from llm_output_parser import batch_format_instructions, json_format_instructions, parse_batch, parse_notecards, parse_quiz, parse_stats
+from prompt_batching import estimate_tokens, pack_sources, packing_report
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
     handlers=[
         logging.StreamHandler()
     ]
 )
+# Request id of the current trace in every line (tracing.py)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceLogFilter())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -33,6 +47,14 @@ load_dotenv()
 # Initialize FastAPI app
 app = FastAPI(title="FaciliGator API", description="Backend API for FaciliGator Chrome Extension")
 
+# A trace span per request, continuing the caller's traceparent / X-Request-ID (added first, so it
+# runs inside the others and sees the matched route); RAG API calls carry the trace on
+set_service("backend")
+app.add_middleware(TracingMiddleware)
+
+# Request count and latency per route for GET /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -42,12 +64,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Accept gzip/zstd request bodies and compress large responses (transcripts, lecture lists)
+app.add_middleware(CompressionMiddleware)
+
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_KEY")
 JWT_SECRET = os.getenv("JWT_SECRET")
 
+# Store transcripts as zlib-compressed columnar blobs (smaller rows, opaque to SQL)
+TRANSCRIPT_COMPRESS = os.getenv("TRANSCRIPT_COMPRESS", "false").lower() == "true"
+
 # Initialize Supabase client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -59,6 +87,10 @@ except Exception as e:
     logger.warning(f"Failed to initialize Supabase admin client: {str(e)}")
     supabase_admin = supabase  # Fallback to regular client if admin fails
 
+# A trace span per PostgREST request
+for client in {id(supabase): supabase, id(supabase_admin): supabase_admin}.values():
+    instrument_httpx(client.postgrest.session)
+
 # Models
 class UserCreate(BaseModel):
     email: str
@@ -119,11 +151,13 @@ class NotecardGeneration(BaseModel):
     title: Optional[str] = "Generated Notecards"
     content_selection: ContentSelection
     cards_per_source: int = 10
+    pack_sources: bool = True  # share LLM requests between small sources
 
 class QuizGeneration(BaseModel):
     content_selection: ContentSelection
     questions_per_source: int = 5
     difficulty: str = "medium"  # easy, medium, hard
+    pack_sources: bool = True  # share LLM requests between small sources
 
 # Helper functions
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -162,6 +196,17 @@ async def get_current_user_id(current_user: dict = Depends(get_current_user)) ->
     """Extract user_id from the current user dict"""
     return current_user["user_id"]
 
+def transcript_formatted_text(transcript: dict) -> str:
+    """Return the formatted text of a transcript row, building it from transcript_data if not stored"""
+    return transcript.get("formatted_text") or format_transcript(transcript.get("transcript_data"))
+
+def expand_transcript(transcript: dict) -> dict:
+    """Expand a packed transcript row into the segment list + formatted text the extension expects"""
+    expanded = dict(transcript)
+    expanded["transcript_data"] = decode_transcript(transcript.get("transcript_data"))
+    expanded["formatted_text"] = transcript_formatted_text(transcript)
+    return expanded
+
 # Routes
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -224,6 +269,11 @@ async def root():
     """
     return html_content
 
+@app.get("/metrics")
+async def metrics():
+    """Request latency, generation cache and tier counters and LLM requests in flight, in the Prometheus text format"""
+    return metrics_response()
+
 @app.get("/ping")
 async def ping():
     """Simple ping endpoint for checking if the API is running"""
@@ -599,7 +649,12 @@ async def create_tables(current_user: dict = Depends(get_current_user)):
             user_id uuid NOT NULL,
             transcript_data jsonb NOT NULL,
             formatted_text text NOT NULL,
+            content_length integer,
             segment_count integer NOT NULL,
+            cleaned_text text,
+            sentence_scores jsonb,
+            key_terms jsonb,
+            enrichment_version smallint,
             created_at timestamp with time zone DEFAULT now(),
             updated_at timestamp with time zone
         );
@@ -776,9 +831,9 @@ async def get_user_lectures(current_user: dict = Depends(get_current_user)):
             transcript_response = supabase.table("zoom_transcripts").select("*").eq("recording_id", recording_id).limit(1).execute()
             if transcript_response.data and len(transcript_response.data) > 0:
                 # Add transcript data to the lecture
-                transcript = transcript_response.data[0]
-                lecture["transcript_data"] = transcript.get("transcript_data")
-                lecture["formatted_text"] = transcript.get("formatted_text")
+                transcript = expand_transcript(transcript_response.data[0])
+                lecture["transcript_data"] = transcript["transcript_data"]
+                lecture["formatted_text"] = transcript["formatted_text"]
             
             lectures.append(lecture)
         
@@ -938,10 +993,13 @@ async def batch_extract_transcripts(submission: ZoomRecordingSubmission, current
                 transcript_data = {
                     "recording_id": recording_id,
                     "user_id": user_id,
-                    "transcript_data": result["transcript_data"],
-                    "formatted_text": result["formatted_text"],
+                    "transcript_data": encode_transcript(result["transcript_data"], compress=TRANSCRIPT_COMPRESS),
+                    "formatted_text": "",  # Built on demand from transcript_data
+                    "content_length": len(result["formatted_text"]),
                     "segment_count": result["segment_count"],
-                    "created_at": datetime.utcnow().isoformat()
+                    "created_at": datetime.utcnow().isoformat(),
+                    # Cleaned text and key terms for the generators, computed once at ingest
+                    **enrich_transcript(result["transcript_data"], result["formatted_text"])
                 }
                 
                 logger.info(f"Inserting transcript with {len(result['transcript_data'])} segments")
@@ -1034,7 +1092,7 @@ async def get_transcript(recording_id: str, current_user: dict = Depends(get_cur
         return {
             "status": "success",
             "message": "Transcript found",
-            "transcript": transcripts[0]
+            "transcript": expand_transcript(transcripts[0])
         }
     
     except HTTPException as e:
@@ -1091,39 +1149,24 @@ async def store_transcript(transcript: ZoomTranscript, current_user: dict = Depe
         recording_id = recordings[0]["id"]
         logger.info(f"Verified recording with ID {recording_id}")
         
-        # Convert nested dicts in transcript_data to ensure JSON compatibility
-        cleaned_transcript_data = []
-        for item in transcript.transcript_data:
-            if isinstance(item, dict):
-                # Convert any non-serializable values to strings
-                cleaned_item = {}
-                for k, v in item.items():
-                    if isinstance(v, (str, int, float, bool, type(None))):
-                        cleaned_item[k] = v
-                    else:
-                        cleaned_item[k] = str(v)
-                cleaned_transcript_data.append(cleaned_item)
-            else:
-                # If item is not a dict, convert to a dict with a text field
-                cleaned_transcript_data.append({"text": str(item)})
+        # Pack segments into the columnar format; non-dict items are kept as text
+        packed_transcript_data = encode_transcript(transcript.transcript_data, compress=TRANSCRIPT_COMPRESS)
         
         # Calculate segment count
-        segment_count = transcript.segment_count if transcript.segment_count is not None else len(cleaned_transcript_data)
+        segment_count = transcript.segment_count if transcript.segment_count is not None else count_segments(packed_transcript_data)
         logger.info(f"Final segment count: {segment_count}")
         
-        # Log sanitized data for debugging
-        logger.info(f"Prepared cleaned transcript data with {len(cleaned_transcript_data)} items")
-        if cleaned_transcript_data:
-            logger.info(f"Sample items (first 2): {cleaned_transcript_data[:2]}")
-        
         # Prepare final data for insert
         transcript_data_to_store = {
             "recording_id": recording_id,
             "user_id": user_id,
-            "transcript_data": cleaned_transcript_data,
-            "formatted_text": transcript.formatted_text or "",
+            "transcript_data": packed_transcript_data,
+            "formatted_text": "",  # Built on demand from transcript_data
+            "content_length": len(format_transcript(packed_transcript_data)),
             "segment_count": segment_count,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.utcnow().isoformat(),
+            # Cleaned text and key terms for the generators, computed once at ingest
+            **enrich_transcript(packed_transcript_data, transcript.formatted_text)
         }
         
         # Insert using Supabase client
@@ -1248,12 +1291,12 @@ async def get_raw_transcript(transcript_id: str, current_user: dict = Depends(ge
         
         # Check if transcript_data exists and is not empty
         has_data = transcript.get("transcript_data") is not None
-        data_length = len(transcript.get("transcript_data", [])) if has_data else 0
+        data_length = count_segments(transcript["transcript_data"]) if has_data else 0
         logger.info(f"Transcript {transcript_id} has data: {has_data}, data length: {data_length}")
         
         if data_length > 0:
             # Log sample of the data
-            sample = transcript["transcript_data"][:2] if data_length > 0 else []
+            sample = decode_transcript(transcript["transcript_data"])[:2]
             logger.info(f"Sample of transcript data: {sample}")
         
         return {
@@ -1396,10 +1439,21 @@ def sanitize_content(content_obj):
     return content_obj
 
 # Simple in-memory cache for generation results
-# Format: {"cache_key": {"timestamp": timestamp, "result": result}}
+# Format: {"cache_key": {"timestamp": timestamp, "result": result, "tier": tier}}
 generation_cache = {}
 CACHE_EXPIRY_SECONDS = 3600  # Cache items expire after 1 hour
 
+# Generation metrics (GET /metrics)
+GENERATION_CACHE_LOOKUPS = counter("generation_cache_lookups_total", "Generation cache lookups by result", ("result",))
+GENERATION_CACHE_HIT, GENERATION_CACHE_MISS, GENERATION_CACHE_EXPIRED = (
+    GENERATION_CACHE_LOOKUPS.labels(result) for result in ("hit", "miss", "expired"))
+GENERATION_TIERS = counter("generation_results_total",
+                           "Generated items returned per source, by item type and tier (extractive and fallback are LLM fallbacks)",
+                           ("item_type", "tier"))
+LLM_UPGRADES = counter("generation_llm_upgrades_total", "Cached extractive results replaced by late LLM output", ("item_type",))
+RAG_REQUEST_SECONDS = histogram("rag_request_seconds", "Latency of LLM requests through the RAG API", ("outcome",))
+LLM_REQUESTS_IN_PROGRESS = gauge("llm_requests_in_progress", "LLM generation requests in flight")
+
 def get_cache_key(content_id, num_items, item_type, difficulty=None):
     """Generate a cache key for storing generation results"""
     if difficulty:
@@ -1412,6 +1466,7 @@ def get_from_cache(content_id, num_items, item_type, difficulty=None):
     cached_item = generation_cache.get(cache_key)
     
     if not cached_item:
+        GENERATION_CACHE_MISS.inc()
         return None
     
     # Check if cache item has expired
@@ -1419,16 +1474,19 @@ def get_from_cache(content_id, num_items, item_type, difficulty=None):
     if now - cached_item["timestamp"] > CACHE_EXPIRY_SECONDS:
         # Remove expired item
         del generation_cache[cache_key]
+        GENERATION_CACHE_EXPIRED.inc()
         return None
     
+    GENERATION_CACHE_HIT.inc()
     return cached_item["result"]
 
-def store_in_cache(content_id, num_items, item_type, result, difficulty=None):
-    """Store generation results in cache"""
+def store_in_cache(content_id, num_items, item_type, result, difficulty=None, tier=None):
+    """Store generation results in cache, with the generation tier that produced them"""
     cache_key = get_cache_key(content_id, num_items, item_type, difficulty)
     generation_cache[cache_key] = {
         "timestamp": time.time(),
-        "result": result
+        "result": result,
+        "tier": tier
     }
     
     # Clean up cache if it gets too large (keep it under 1000 items)
@@ -1440,6 +1498,413 @@ def store_in_cache(content_id, num_items, item_type, result, difficulty=None):
             if key in generation_cache:
                 del generation_cache[key]
 
+# Cleaned lecture transcripts, so repeat generations skip fetching and cleaning them
+# Format: {(transcript_id, version): {"timestamp": timestamp, "enrichment": enrichment}}
+cleaned_transcript_cache = {}
+CLEANED_TRANSCRIPT_CACHE_SIZE = int(os.getenv("CLEANED_TRANSCRIPT_CACHE_SIZE", "200"))
+TRANSCRIPT_VERSION_COLUMNS = "id,segment_count,created_at,updated_at"
+
+def transcript_version(transcript):
+    """Identify a stored revision of a transcript row"""
+    return (transcript.get("updated_at") or transcript.get("created_at"), transcript.get("segment_count"))
+
+def load_transcript_enrichment(transcript_id):
+    """
+    Read the ingest-time enrichment of a transcript row
+
+    Rows stored before enrichment existed (or by an older enrichment version) are
+    enriched from their segments now and the result is written back.
+    """
+    try:
+        stored = supabase.table("zoom_transcripts").select(ENRICHMENT_COLUMNS).eq("id", transcript_id).limit(1).execute()
+        if stored.data and is_enriched(stored.data[0]):
+            return stored.data[0]
+    except Exception as e:
+        logging.warning(f"Could not read enrichment for transcript {transcript_id}: {str(e)}")
+
+    transcript_result = supabase.table("zoom_transcripts").select("transcript_data,formatted_text").eq("id", transcript_id).limit(1).execute()
+    if not transcript_result.data:
+        return None
+
+    transcript = transcript_result.data[0]
+    enrichment = enrich_transcript(transcript.get("transcript_data"), transcript.get("formatted_text") or "")
+    try:
+        supabase.table("zoom_transcripts").update(enrichment).eq("id", transcript_id).execute()
+    except Exception as e:
+        logging.warning(f"Could not store enrichment for transcript {transcript_id}: {str(e)}")
+    return enrichment
+
+def get_transcript_enrichment(lecture_id):
+    """
+    Return the cleaned text, sentence scores and key terms of a lecture's transcript
+
+    Returns None if the lecture has no transcript. Only the version columns are
+    fetched when the enrichment is already cached.
+    """
+    version_result = supabase.table("zoom_transcripts").select(TRANSCRIPT_VERSION_COLUMNS).eq("recording_id", lecture_id).limit(1).execute()
+    if not version_result.data:
+        return None
+
+    row = version_result.data[0]
+    cache_key = (row["id"], transcript_version(row))
+    cached_item = cleaned_transcript_cache.get(cache_key)
+    if cached_item and time.time() - cached_item["timestamp"] <= CACHE_EXPIRY_SECONDS:
+        return cached_item["enrichment"]
+
+    enrichment = load_transcript_enrichment(row["id"])
+    if enrichment is None:
+        return None
+
+    cleaned_transcript_cache[cache_key] = {
+        "timestamp": time.time(),
+        "enrichment": enrichment
+    }
+
+    # Keep the cache bounded; cleaned lectures can be large
+    if len(cleaned_transcript_cache) > CLEANED_TRANSCRIPT_CACHE_SIZE:
+        oldest_keys = sorted(cleaned_transcript_cache.keys(),
+                            key=lambda k: cleaned_transcript_cache[k]["timestamp"])[:len(cleaned_transcript_cache) // 10 + 1]
+        for key in oldest_keys:
+            del cleaned_transcript_cache[key]
+
+    return enrichment
+
+# Tiered generation: the extractive engine answers within the latency budget,
+# and an LLM result that arrives later replaces it in the generation cache
+EXTRACTIVE_BUDGET_SECONDS = float(os.getenv("EXTRACTIVE_BUDGET_SECONDS", "1.0"))
+GENERATION_LATENCY_BUDGET_SECONDS = float(os.getenv("GENERATION_LATENCY_BUDGET_SECONDS", "8"))
+llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_GENERATION_WORKERS", "4")),
+                                  thread_name_prefix="llm-generation")
+# Format: {"cache_key": future of the LLM request still running}
+pending_llm_upgrades = {}
+
+def generation_status(content_id, num_items, item_type, difficulty=None):
+    """Return which tier produced the cached items and whether an LLM upgrade is on its way"""
+    cache_key = get_cache_key(content_id, num_items, item_type, difficulty)
+    return {
+        "tier": generation_cache.get(cache_key, {}).get("tier"),
+        "upgrade_pending": cache_key in pending_llm_upgrades
+    }
+
+async def generate_tiered(content_id, num_items, item_type, llm_job, extractive_call, fallback_call, difficulty=None,
+                          deadline=None):
+    """
+    Generate study material with the fastest tier that answers in time
+
+    The LLM request (if any) is already running and the extractive engine runs
+    while it is in flight. The LLM result is returned if it arrives before the
+    deadline; otherwise the extractive result (or the
+    heuristic fallback when extraction found nothing) is returned and the LLM
+    result is stored in the generation cache once it arrives.
+
+    Args:
+        content_id, num_items, item_type, difficulty: Generation cache key parts
+        llm_job: Future of the LLM items ([] on failure), or None
+        extractive_call: Callable returning extractive items or None
+        fallback_call: Callable returning heuristic items
+        deadline: Event loop time to stop waiting for the LLM (default
+            GENERATION_LATENCY_BUDGET_SECONDS from now)
+
+    Returns:
+        Tuple of (items, tier) where tier is "llm", "extractive" or "fallback"
+    """
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + GENERATION_LATENCY_BUDGET_SECONDS
+    cache_key = get_cache_key(content_id, num_items, item_type, difficulty)
+
+    with span("generation.extractive", item_type=item_type, content_id=str(content_id)):
+        items = await loop.run_in_executor(None, bind(extractive_call))
+    tier = "extractive"
+    if not items:
+        logging.info(f"Using fallback {item_type} generation for content {content_id}")
+        with span("generation.fallback", item_type=item_type, content_id=str(content_id)):
+            items = fallback_call()
+        tier = "fallback"
+
+    if llm_job is None:
+        GENERATION_TIERS.labels(item_type, tier).inc()
+        return items, tier
+
+    done, _ = await asyncio.wait({asyncio.wrap_future(llm_job)}, timeout=max(0, deadline - loop.time()))
+    if done:
+        llm_items = llm_job.result() if not llm_job.exception() else None
+        if llm_items:
+            GENERATION_TIERS.labels(item_type, "llm").inc()
+            return llm_items, "llm"
+        GENERATION_TIERS.labels(item_type, tier).inc()
+        return items, tier
+
+    logging.info(f"LLM {item_type} for content {content_id} still running, returning {tier} result")
+    pending_llm_upgrades[cache_key] = llm_job
+
+    def store_upgrade(job):
+        pending_llm_upgrades.pop(cache_key, None)
+        llm_items = job.result() if not job.cancelled() and not job.exception() else None
+        if llm_items:
+            logging.info(f"Upgraded cached {item_type} for content {content_id} to LLM output")
+            LLM_UPGRADES.labels(item_type).inc()
+            store_in_cache(content_id, num_items, item_type, llm_items, difficulty, tier="llm")
+
+    def on_llm_done(job):
+        # Runs on the LLM worker thread; the cache is only touched from the event loop
+        try:
+            loop.call_soon_threadsafe(store_upgrade, job)
+        except RuntimeError:  # event loop already closed
+            store_upgrade(job)
+
+    llm_job.add_done_callback(on_llm_done)
+    GENERATION_TIERS.labels(item_type, tier).inc()
+    return items, tier
+
+# Instructions shared by single-source and packed generation prompts
+NOTECARD_INSTRUCTIONS = """        
+        CRITICAL INSTRUCTIONS:
+        - First perform a careful ANALYSIS of the lecture content to identify the SPECIFIC ACADEMIC TOPICS being taught
+        - Extract the SPECIFIC SUBJECT MATTER and KEY CONCEPTS that represent the core educational content
+        - Determine the 3-5 most important topics or concepts covered in this content
+        - Focus EXCLUSIVELY on these specific subject matter topics when creating flashcards
+        - If the content seems to contain irrelevant text or artifacts, IGNORE those completely
+        - Your flashcards should represent the ACTUAL EDUCATIONAL CONCEPTS in the domain being taught
+        - If you're unsure what the main topics are, focus on technical terms, definitions, and formulas you can identify
+        
+        PROCESS:
+        1. Read and analyze the entire content to identify the specific academic subject and topics
+        2. List the 3-5 primary educational concepts or topics being taught
+        3. Create flashcards ONLY about these specific concepts (not about the lecture itself)
+        4. If you can't identify clear topics, default to general concepts in the apparent subject domain
+        
+        The flashcards should:
+        - Cover SPECIFIC technical concepts, theories, methodologies, or frameworks presented
+        - Include precise definitions, examples, and explanations from the domain
+        - Be written as proper educational material that would appear in a textbook
+        - Contain academically accurate information about the subject matter
+        
+        For each flashcard:
+        - Front: Ask a clear, focused question about a SPECIFIC academic concept identified in the content
+        - Back: Provide a complete, well-structured explanation that would match what appears in a textbook
+        
+        Example of BAD flashcard (DO NOT create like this):
+        FRONT: Define or explain the concept of here is a particular absence
+        BACK: If there is a particular absence, there will be penalty for that.
+        
+        Example of GOOD flashcard:
+        FRONT: What are the key characteristics of microservices architecture?
+        BACK: Microservices architecture is characterized by: 1) Small, independent services focused on single responsibilities, 2) Loose coupling between services, 3) Independent deployment capabilities, and 4) Service-specific databases and UI management code.
+        """
+
+QUIZ_INSTRUCTIONS = """        
+        CRITICAL INSTRUCTIONS:
+        - First perform a careful ANALYSIS of the content to identify the SPECIFIC ACADEMIC TOPICS being taught
+        - Extract the SPECIFIC SUBJECT MATTER and KEY CONCEPTS that represent the core educational content
+        - Determine the 3-5 most important topics or concepts covered in this content
+        - Focus EXCLUSIVELY on these specific subject matter topics when creating quiz questions
+        - If the content seems to contain irrelevant text or artifacts, IGNORE those completely
+        - Your quiz questions should test understanding of ACTUAL EDUCATIONAL CONCEPTS in the domain
+        - If you're unsure what the main topics are, focus on technical terms, definitions, and formulas you can identify
+        
+        PROCESS:
+        1. Read and analyze the entire content to identify the specific academic subject and topics
+        2. List the 3-5 primary educational concepts or topics being taught
+        3. Create quiz questions ONLY about these specific concepts (not about the lecture itself)
+        4. If you can't identify clear topics, default to general concepts in the apparent subject domain
+        
+        The quiz questions should:
+        - Assess understanding of SPECIFIC technical concepts, theories, methodologies, or frameworks
+        - Test knowledge of precise definitions and applications from the identified domain
+        - Be written as proper educational assessment items that would appear in a formal course exam
+        - Contain academically accurate information about the subject matter
+        
+        For each question:
+        - Create a clear, focused question about a SPECIFIC academic concept identified in the content
+        - Provide exactly 4 options (A, B, C, D) with only one correct answer
+        - Ensure distractors (wrong answers) are plausible but clearly incorrect for experts in the field
+        - All options should be of similar length and detail level
+        
+        Example of BAD question (DO NOT create like this):
+        QUESTION: Which statement about the lecture format is correct?
+        A: The lecture had timestamps
+        B: The professor mentioned deadlines multiple times
+        C: The lecture was structured around administrative topics
+        D: The lecture contained artifacts from the transcript
+        
+        Example of GOOD question:
+        QUESTION: Which characteristic best defines microservices architecture?
+        A: Services with tightly coupled dependencies
+        B: Services with individual responsibilities and independent deployment
+        C: Centralized databases shared by all services
+        D: Services that must be deployed simultaneously
+        """
+
+QUIZ_DIFFICULTY_DESCRIPTIONS = {
+    "easy": "These should be basic, factual questions testing fundamental understanding.",
+    "medium": "These should be moderate difficulty questions requiring application of concepts.",
+    "hard": "These should be challenging questions requiring deep analysis and synthesis of multiple concepts."
+}
+
+# Small sources share one LLM request (instructions sent once) within this prompt budget
+LLM_BATCH_PROMPT_TOKENS = int(os.getenv("LLM_BATCH_PROMPT_TOKENS", "6000"))
+LLM_BATCH_MAX_SOURCES = int(os.getenv("LLM_BATCH_MAX_SOURCES", "4"))
+# Response tokens requested per generated item
+LLM_TOKENS_PER_ITEM = {"notecards": 120, "quiz": 150}
+
+# The RAG API retrieves the most relevant parts of each source for the prompt's
+# {context} placeholder using this query (one "SOURCE: <id>" section per source)
+GENERATION_RETRIEVAL_QUERY = "Key concepts, definitions, formulas, methods and examples taught in this material"
+
+def notecard_prompt(contents, num_cards):
+    """Build the notecard instructions for one source, or a packed prompt for several"""
+    if len(contents) == 1:
+        return f"""
+        Create {num_cards} high-quality educational flashcards based on the following lecture content.
+{NOTECARD_INSTRUCTIONS}
+        Content: {{context}}
+        
+        {json_format_instructions("notecards")}
+        """
+    return f"""
+        Create {num_cards} high-quality educational flashcards for EACH of the {len(contents)} sources below, each based only on its own source's content.
+{NOTECARD_INSTRUCTIONS}
+{{context}}
+        
+        {batch_format_instructions("notecards", [content["id"] for content in contents])}
+        """
+
+def quiz_prompt(contents, num_questions, difficulty):
+    """Build the quiz instructions for one source, or a packed prompt for several"""
+    difficulty_desc = QUIZ_DIFFICULTY_DESCRIPTIONS.get(difficulty, QUIZ_DIFFICULTY_DESCRIPTIONS["hard"])
+    if len(contents) == 1:
+        return f"""
+        Create {num_questions} high-quality multiple-choice quiz questions based on the educational concepts in the following lecture content.
+        Difficulty level: {difficulty.upper()}. {difficulty_desc}
+{QUIZ_INSTRUCTIONS}
+        Content: {{context}}
+        
+        {json_format_instructions("quiz")}
+        """
+    return f"""
+        Create {num_questions} high-quality multiple-choice quiz questions for EACH of the {len(contents)} sources below, each based only on the educational concepts in its own source.
+        Difficulty level: {difficulty.upper()}. {difficulty_desc}
+{QUIZ_INSTRUCTIONS}
+{{context}}
+        
+        {batch_format_instructions("quiz", [content["id"] for content in contents])}
+        """
+
+def query_llm(rag_url, instructions, contents, max_tokens):
+    """
+    Send generation instructions and source content to the RAG API
+
+    The instructions are not embedded; the RAG API fills their {context}
+    placeholder with the sources' most relevant chunks within the model's
+    token budget.
+
+    Returns:
+        The model's response text
+    """
+    payload = {
+        "query": GENERATION_RETRIEVAL_QUERY,
+        "instructions": instructions,
+        "model": "meta-llama/llama-3-8b-instruct",
+        "max_tokens": max_tokens
+    }
+    if len(contents) == 1:
+        payload["content"] = contents[0]["content"]
+    else:
+        payload["sources"] = {str(content["id"]): content["content"] for content in contents}
+    start = time.perf_counter()
+    try:
+        with LLM_REQUESTS_IN_PROGRESS.track(), span("rag.query", KIND_CLIENT, sources=len(contents)) as rag_span:
+            rag_response = post_json(
+                f"{rag_url}/query",
+                payload,
+                timeout=60,  # Increase timeout for content generation
+                headers=outgoing_headers()
+            )
+            rag_span.set_attribute("http.status_code", rag_response.status_code)
+    except Exception:
+        RAG_REQUEST_SECONDS.labels("error").observe(time.perf_counter() - start)
+        raise
+    RAG_REQUEST_SECONDS.labels("ok" if rag_response.status_code == 200 else "error").observe(time.perf_counter() - start)
+    if rag_response.status_code != 200:
+        raise Exception(f"RAG API returned status code: {rag_response.status_code}")
+    result = rag_response.json()
+    if result.get("token_usage"):
+        logging.info(f"RAG prompt for {len(contents)} source(s): {result['token_usage'].get('prompt_tokens')} tokens")
+    if result.get("degraded"):
+        logging.warning(f"RAG context ranked with {result.get('retrieval')} (embeddings unavailable)")
+    return result.get("response", "")
+
+def request_llm_items(rag_url, contents, item_type, num_items, difficulty=None):
+    """
+    Ask the RAG API's LLM for notecards or quiz questions for one or more sources
+
+    Several sources are sent as one packed prompt and answered per source_id.
+
+    Returns:
+        Dict of content id to items; sources that failed map to nothing
+    """
+    try:
+        if item_type == "notecards":
+            prompt = notecard_prompt(contents, num_items)
+        else:
+            prompt = quiz_prompt(contents, num_items, difficulty)
+        generated_text = query_llm(rag_url, prompt, contents, LLM_TOKENS_PER_ITEM[item_type] * num_items * len(contents))
+
+        # JSON per the prompt's schema; truncated JSON and the old block formats still parse
+        with span("llm.parse", item_type=item_type, sources=len(contents)) as parse_span:
+            if len(contents) > 1:
+                results, outcome = parse_batch(generated_text, item_type, [content["id"] for content in contents], num_items)
+            elif item_type == "notecards":
+                cards, outcome = parse_notecards(generated_text, num_items, id_prefix=f"card_{contents[0]['id']}")
+                results = {contents[0]["id"]: cards}
+            else:
+                questions, outcome = parse_quiz(generated_text, num_items)
+                results = {contents[0]["id"]: questions}
+            parse_span.set_attribute("outcome", str(outcome))
+        logging.info(f"Parsed LLM {item_type} for {len(contents)} source(s): "
+                     f"{sum(len(items) for items in results.values())} items ({outcome})")
+        return results
+    except Exception as rag_error:
+        logging.error(f"RAG API error during generation, using fallback: {str(rag_error)}")
+        return {}
+
+def source_result(job, content_id):
+    """Future of one source's items from a (possibly packed) LLM request"""
+    result = Future()
+    job.add_done_callback(
+        lambda done: result.set_result(done.result().get(content_id, []) if not done.exception() else [])
+    )
+    return result
+
+def start_llm_jobs(rag_url, contents, item_type, num_items, difficulty=None, pack=True):
+    """
+    Start the LLM requests for sources, packing small ones into shared prompts
+
+    Args:
+        contents: Sources that need LLM output
+        pack: False sends one request per source
+
+    Returns:
+        Tuple of ({content id: future of its items}, packing report with the
+        estimated prompt tokens saved)
+    """
+    instructions = NOTECARD_INSTRUCTIONS if item_type == "notecards" else QUIZ_INSTRUCTIONS
+    overhead_tokens = estimate_tokens(instructions) + estimate_tokens(json_format_instructions(item_type))
+    groups = pack_sources(contents, overhead_tokens, LLM_BATCH_PROMPT_TOKENS, LLM_BATCH_MAX_SOURCES if pack else 1)
+
+    jobs = {}
+    for group in groups:
+        job = llm_executor.submit(bind(request_llm_items), rag_url, group, item_type, num_items, difficulty)
+        for content in group:
+            jobs[content["id"]] = source_result(job, content["id"])
+
+    report = packing_report(groups, overhead_tokens)
+    if len(groups) < len(contents):
+        logging.info(f"Packed {len(contents)} sources into {len(groups)} LLM requests, "
+                     f"saving ~{report['saved_prompt_tokens']} prompt tokens")
+    return jobs, report
+
 @app.post("/generate/notecards")
 async def generate_notecards(request: NotecardGeneration, user_id: str = Depends(get_current_user_id)):
     """Generate notecards from selected lectures and assignments"""
@@ -1455,16 +1920,11 @@ async def generate_notecards(request: NotecardGeneration, user_id: str = Depends
                 
             lecture = lecture_result.data[0]
             
-            # First check if this lecture has a transcript in the zoom_transcripts table
-            transcript_result = supabase.table("zoom_transcripts").select("*").eq("recording_id", lecture_id).limit(1).execute()
-            
-            # Get content from the lecture - first try to get the transcript content
-            content = ""
-            if transcript_result.data and len(transcript_result.data) > 0:
-                transcript = transcript_result.data[0]
-                raw_content = transcript.get("formatted_text", "")
-                # Clean the transcript text before using it
-                content = clean_transcript_text(raw_content)
+            # First check if this lecture has a transcript in the zoom_transcripts table;
+            # its cleaned text and key terms are computed at ingest (cached per transcript version)
+            enrichment = get_transcript_enrichment(lecture_id) or {}
+            content = enrichment.get("cleaned_text") or ""
+            if content:
                 logging.info(f"Found and cleaned transcript for lecture {lecture_id} with {len(content)} characters")
             
             # If no transcript content, try the formatted_text directly from the recording
@@ -1480,13 +1940,16 @@ async def generate_notecards(request: NotecardGeneration, user_id: str = Depends
                 content += f"Date: {lecture.get('date', '')}\n"
                 content += f"Host: {lecture.get('host', '')}\n"
                 content += f"URL: {lecture.get('url', '')}\n"
+                enrichment = {}
                 
             lecture_contents.append({
                 "id": lecture["id"],
                 "title": lecture.get("title", f"Lecture {lecture.get('recording_id', '')[:8] if lecture.get('recording_id') else ''}"),
                 "content": content,
                 "type": "lecture",
-                "course_id": lecture.get("course_id", "Unknown")
+                "course_id": lecture.get("course_id", "Unknown"),
+                "key_terms": enrichment.get("key_terms") if content == enrichment.get("cleaned_text") else None,
+                "sentence_scores": enrichment.get("sentence_scores") if content == enrichment.get("cleaned_text") else None
             })
             
         # Get assignments content
@@ -1545,9 +2008,21 @@ async def generate_notecards(request: NotecardGeneration, user_id: str = Depends
             logging.warning(f"RAG API unavailable, will use fallback generation: {str(e)}")
             rag_available = False
         
+        num_cards = min(request.cards_per_source, 5)  # Cap at 5 cards per source
+        
+        # Start the LLM requests up front for sources without cached or pending results,
+        # packing small sources into shared prompts
+        llm_jobs, prompt_packing = {}, None
+        if rag_available:
+            needs_llm = [content for content in all_contents
+                         if not get_from_cache(content["id"], num_cards, "notecards")
+                         and not generation_status(content["id"], num_cards, "notecards")["upgrade_pending"]]
+            if needs_llm:
+                llm_jobs, prompt_packing = start_llm_jobs(rag_url, needs_llm, "notecards", num_cards,
+                                                          pack=request.pack_sources)
+        deadline = asyncio.get_running_loop().time() + GENERATION_LATENCY_BUDGET_SECONDS
+        
         for content in all_contents:
-            num_cards = min(request.cards_per_source, 5)  # Cap at 5 cards per source
-            
             # Check cache first
             cached_cards = get_from_cache(content["id"], num_cards, "notecards")
             if cached_cards:
@@ -1559,439 +2034,22 @@ async def generate_notecards(request: NotecardGeneration, user_id: str = Depends
                         "type": content["type"],
                         "course_id": content["course_id"]
                     },
-                    "cards": cached_cards
+                    "cards": cached_cards,
+                    **generation_status(content["id"], num_cards, "notecards")
                 })
                 continue
             
-            cards = []
-            
-            # Try the RAG API only if it's available
-            if rag_available:
-                try:
-                    # Create a prompt that will generate proper flashcards
-                    prompt = f"""
-                    Create {num_cards} high-quality educational flashcards based on the following lecture content.
-                    
-                    CRITICAL INSTRUCTIONS:
-                    - First perform a careful ANALYSIS of the lecture content to identify the SPECIFIC ACADEMIC TOPICS being taught
-                    - Extract the SPECIFIC SUBJECT MATTER and KEY CONCEPTS that represent the core educational content
-                    - Determine the 3-5 most important topics or concepts covered in this content
-                    - Focus EXCLUSIVELY on these specific subject matter topics when creating flashcards
-                    - If the content seems to contain irrelevant text or artifacts, IGNORE those completely
-                    - Your flashcards should represent the ACTUAL EDUCATIONAL CONCEPTS in the domain being taught
-                    - If you're unsure what the main topics are, focus on technical terms, definitions, and formulas you can identify
-                    
-                    PROCESS:
-                    1. Read and analyze the entire content to identify the specific academic subject and topics
-                    2. List the 3-5 primary educational concepts or topics being taught
-                    3. Create flashcards ONLY about these specific concepts (not about the lecture itself)
-                    4. If you can't identify clear topics, default to general concepts in the apparent subject domain
-                    
-                    The flashcards should:
-                    - Cover SPECIFIC technical concepts, theories, methodologies, or frameworks presented
-                    - Include precise definitions, examples, and explanations from the domain
-                    - Be written as proper educational material that would appear in a textbook
-                    - Contain academically accurate information about the subject matter
-                    
-                    For each flashcard:
-                    - Front: Ask a clear, focused question about a SPECIFIC academic concept identified in the content
-                    - Back: Provide a complete, well-structured explanation that would match what appears in a textbook
-                    
-                    Example of BAD flashcard (DO NOT create like this):
-                    FRONT: Define or explain the concept of here is a particular absence
-                    BACK: If there is a particular absence, there will be penalty for that.
-                    
-                    Example of GOOD flashcard:
-                    FRONT: What are the key characteristics of microservices architecture?
-                    BACK: Microservices architecture is characterized by: 1) Small, independent services focused on single responsibilities, 2) Loose coupling between services, 3) Independent deployment capabilities, and 4) Service-specific databases and UI management code.
-                    
-                    Content: {content["content"]}
-                    
-                    Format each flashcard as:
-                    FRONT: [specific educational question about a key concept]
-                    BACK: [complete, textbook-quality explanation of the concept]
-                    """
-                    
-                    rag_response = requests.post(
-                        f"{rag_url}/query",
-                        json={
-                            "query": prompt,
-                            "document_ids": [],  # We're passing content directly
-                            "top_k": 10,
-                            "model": "meta-llama/llama-3-8b-instruct"
-                        },
-                        timeout=60  # Increase timeout for content generation
-                    )
-                    
-                    if rag_response.status_code == 200:
-                        rag_data = rag_response.json()
-                        generated_text = rag_data.get("response", "")
-                        
-                        # Parse the generated flashcards
-                        card_blocks = generated_text.split("FRONT:")
-                        
-                        # Skip the first element if it's empty (usually is)
-                        if card_blocks and not card_blocks[0].strip():
-                            card_blocks = card_blocks[1:]
-                        
-                        for i, block in enumerate(card_blocks[:num_cards]):
-                            # Split block into front and back
-                            parts = block.split("BACK:")
-                            
-                            if len(parts) == 2:
-                                front = parts[0].strip()
-                                back = parts[1].strip()
-                                
-                                # Clean up any remaining sections
-                                if "FRONT:" in back:
-                                    back = back.split("FRONT:")[0].strip()
-                                    
-                                cards.append({
-                                    "id": f"card_{content['id']}_{i}",
-                                    "front": front,
-                                    "back": back
-                                })
-                            else:
-                                # If we can't parse it properly, create a simple version
-                                cards.append({
-                                    "id": f"card_{content['id']}_{i}",
-                                    "front": f"Concept {i+1} from {content['title']}",
-                                    "back": block.strip()
-                                })
-                                
-                        # If we didn't get enough cards, fill in with backup method
-                        if len(cards) < num_cards:
-                            # Let's process the entire response differently
-                            paragraphs = [p for p in generated_text.split("\n\n") if p.strip()]
-                            
-                            for i in range(len(cards), min(len(paragraphs), num_cards)):
-                                paragraph = paragraphs[i].strip()
-                                # Try to extract a question from the paragraph
-                                if "?" in paragraph:
-                                    question_part = paragraph.split("?")[0] + "?"
-                                    answer_part = paragraph[len(question_part):].strip()
-                
-                                    cards.append({
-                                        "id": f"card_{content['id']}_{i}",
-                                        "front": question_part,
-                                        "back": answer_part if answer_part else "See content for details"
-                                    })
-                                else:
-                                    # Split the paragraph roughly in half for a concept and explanation
-                                    words = paragraph.split()
-                                    midpoint = len(words) // 3
-                                    
-                                    concept = " ".join(words[:midpoint]) + "..."
-                                    explanation = paragraph
-                                    
-                                    cards.append({
-                                        "id": f"card_{content['id']}_{i}",
-                                        "front": f"Explain: {concept}",
-                                        "back": explanation
-                                    })
-                    else:
-                        # API call failed with an error status code
-                        logging.error(f"RAG API returned status code: {rag_response.status_code}")
-                except Exception as rag_error:
-                    logging.error(f"RAG API error during generation, using fallback: {str(rag_error)}")
-                    # Will use fallback since cards list is still empty
-            
-            # If RAG API is unavailable or failed, use the fallback generation
-            if not cards:
-                logging.info(f"Using fallback card generation for content {content['id']}")
-                
-                # Extract educational content from cleaned transcript
-                paragraphs = content["content"].split("\n\n")
-                paragraphs = [p for p in paragraphs if len(p) > 30]  # Filter out tiny paragraphs
-                
-                if not paragraphs:
-                    # If no good paragraphs, split by newlines
-                    paragraphs = [p for p in content["content"].split("\n") if len(p) > 30]
-                
-                if not paragraphs:
-                    # If still no good paragraphs, use the whole content as one paragraph
-                    paragraphs = [content["content"]]
-                
-                # Extract key technical terms and concepts that might be important educational content
-                # This helps identify what the lecture is actually teaching about
-                all_text = " ".join(paragraphs)
-                
-                # Advanced key term extraction - look for domain-specific terms and concepts
-                # Look for capitalized terms that might be important concepts
-                capitalized_terms = re.findall(r'\b[A-Z][a-z]{2,}\b', all_text)
-                capitalized_terms = [term for term in capitalized_terms if len(term) > 3 and term not in 
-                                   ["The", "This", "That", "These", "Those", "There", "Their", "They", "When", "Where", "What"]]
-                
-                # Extract technical terms using improved patterns
-                technical_terms = re.findall(r'\b[A-Za-z][a-z]{2,}(?:[A-Z][a-z]*)+\b', all_text)  # CamelCase terms
-                technical_terms += re.findall(r'\b[a-z]+[-_][a-z]+\b', all_text)  # hyphenated or underscored terms
-                
-                # Look for defined terms with patterns like "X is defined as", "X refers to", "X is a"
-                definition_patterns = [
-                    r'([A-Za-z\s]{3,30})\s+is defined as\s+',
-                    r'([A-Za-z\s]{3,30})\s+refers to\s+',
-                    r'([A-Za-z\s]{3,30})\s+is a\s+',
-                    r'([A-Za-z\s]{3,30})\s+means\s+',
-                    r'([A-Za-z\s]{3,30})\s+is considered\s+',
-                    r'the term\s+([A-Za-z\s]{3,30})'
-                ]
-                
-                defined_terms = []
-                for pattern in definition_patterns:
-                    found_terms = re.findall(pattern, all_text, re.IGNORECASE)
-                    defined_terms.extend([term.strip() for term in found_terms if len(term.strip()) > 3])
-                
-                # Count word frequency for additional domain-specific terms
-                words = all_text.split()
-                word_freq = {}
-                
-                # Identify potentially important technical terms by frequency and characteristics
-                for word in words:
-                    word = word.strip(".,;:()[]{}").lower()
-                    if len(word) > 5 and word not in [
-                        "about", "these", "those", "their", "there", "would", "should", 
-                        "could", "which", "where", "when", "what", "that", "this", "because",
-                        "there", "their", "they", "have", "been", "being", "other", "another"
-                    ]:
-                        word_freq[word] = word_freq.get(word, 0) + 1
-                
-                # Get most frequent technical terms
-                frequent_terms = [w for w, c in sorted(word_freq.items(), key=lambda x: x[1], reverse=True) 
-                                if c > 1 and len(w) > 5][:15]
-                
-                # Combine all discovered terms, prioritizing defined terms
-                potential_topics = list(set(defined_terms + capitalized_terms + technical_terms + frequent_terms))
-                potential_topics = [t for t in potential_topics if len(t) > 3][:20]  # Take up to 20 unique terms
-                
-                # Find educational concept categories in content
-                tech_subjects = {
-                    "architecture": ["design", "pattern", "structure", "layer", "component", "architecture", "framework"],
-                    "microservices": ["service", "api", "container", "docker", "orchestration", "choreography", "microservice"],
-                    "database": ["data", "sql", "nosql", "schema", "query", "storage", "database", "table", "record"],
-                    "software development": ["agile", "scrum", "sprint", "development", "coding", "programming", "software"],
-                    "web technologies": ["http", "rest", "api", "client", "server", "request", "response", "web", "frontend"],
-                    "algorithms": ["algorithm", "complexity", "sorting", "searching", "optimization", "efficient"],
-                    "artificial intelligence": ["ai", "machine learning", "neural", "deep learning", "model", "training"],
-                    "mathematics": ["equation", "formula", "calculation", "theorem", "proof", "mathematical"],
-                    "biology": ["cell", "organism", "species", "gene", "protein", "dna", "biological"],
-                    "chemistry": ["reaction", "molecule", "compound", "element", "bond", "atomic"],
-                    "physics": ["force", "energy", "motion", "particle", "quantum", "relativity"],
-                    "economics": ["market", "supply", "demand", "price", "economic", "inflation", "fiscal"]
-                }
-                
-                # Determine what educational topics are covered - improved detection
-                key_topics = []
-                for topic, related_terms in tech_subjects.items():
-                    relevance_score = sum(1 for term in related_terms if term.lower() in all_text.lower())
-                    if relevance_score >= 2:  # At least 2 related terms should appear
-                        key_topics.append(topic)
-                
-                # If no general topics found, use specific terms
-                if not key_topics and potential_topics:
-                    key_topics = potential_topics[:3]  # Use top specific terms as topics
-                
-                # Create cards around the identified topics
-                cards = []
-                
-                # First, create cards from defined terms (highest quality)
-                for term in defined_terms[:min(num_cards, len(defined_terms))]:
-                    # Validate term format (don't use terms that are nonsensical fragments)
-                    term = term.strip()
-                    # Skip terms that contain partial words or don't make grammatical sense
-                    if (len(term.split()) > 5 or  # Skip terms that are too long (likely sentence fragments)
-                        len(term) < 4 or  # Skip terms that are too short 
-                        term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'in', 'on', 'at', 'with', 'by', 'for')) or
-                        not all(len(word) > 1 for word in term.split())): # Skip terms with single-letter words
-                        continue
-                    
-                    # Find the full definition sentence
-                    definition_sentence = ""
-                    for paragraph in paragraphs:
-                        if term in paragraph:
-                            sentences = paragraph.split('.')
-                            for sentence in sentences:
-                                if term in sentence:
-                                    definition_sentence = sentence.strip() + "."
-                                    break
-                            if definition_sentence:
-                                break
-                
-                    if definition_sentence and len(definition_sentence) > 20:
-                        cards.append({
-                            "id": f"card_{content['id']}_{len(cards)}",
-                            "front": f"What is {term}? Define this concept.",
-                            "back": definition_sentence if len(definition_sentence) > 20 else f"A key concept related to {key_topics[0] if key_topics else 'the subject'}."
-                        })
-                
-                # Create a list of validated, high-quality topics
-                validated_topics = []
-                for topic in key_topics:
-                    if len(topic) > 3 and not topic.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as')):
-                        # Look for evidence this is really a topic in the content
-                        topic_found = False
-                        for paragraph in paragraphs:
-                            if topic.lower() in paragraph.lower():
-                                topic_found = True
-                        break
-                        if topic_found:
-                            validated_topics.append(topic)
-                
-                # Then create cards based on validated key topics
-                for topic in validated_topics[:min(num_cards - len(cards), len(validated_topics))]:
-                    # Find a relevant paragraph that mentions this topic
-                    relevant_paragraph = ""
-                    topic_lower = topic.lower()
-                    for paragraph in paragraphs:
-                        if topic_lower in paragraph.lower():
-                            relevant_paragraph = paragraph
-                            break
-                    
-                    if not relevant_paragraph and paragraphs:
-                        # Fall back to first paragraph if no specific mention
-                        relevant_paragraph = paragraphs[0]
-                            
-                    cards.append({
-                        "id": f"card_{content['id']}_{len(cards)}",
-                        "front": f"Explain the key concepts and principles of {topic}:",
-                        "back": relevant_paragraph if relevant_paragraph else f"A fundamental concept in the subject material."
-                    })
-                
-                # Finally, add cards for any remaining specific terms that are of high quality
-                remaining_slots = num_cards - len(cards)
-                if remaining_slots > 0 and potential_topics:
-                    # Filter potential topics to ensure they're proper terms
-                    validated_terms = []
-                    for term in potential_topics:
-                        # Basic validation to ensure term is an actual meaningful term
-                        if (isinstance(term, str) and 
-                            len(term) >= 4 and 
-                            not term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'the', 'in', 'on', 'at')) and
-                            not term.lower().endswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'the')) and
-                            not any(frag in term.lower() for frag in ['ontinue', ' to be ', ' while ', ' that ', ' which ', ' then ']) and
-                            not re.search(r'^[a-z]+ [a-z]+ [a-z]+ [a-z]+$', term)): # Avoid sentence fragments
-                            # Look for evidence this is a real term in the content
-                            term_found = False
-                            for paragraph in paragraphs:
-                                if term.lower() in paragraph.lower():
-                                    term_found = True
-                                break
-                            if term_found:
-                                validated_terms.append(term)
-                    
-                    for term in validated_terms[:remaining_slots]:
-                        # Find relevant content for this term
-                        relevant_text = ""
-                        for paragraph in paragraphs:
-                            if term.lower() in paragraph.lower():
-                                relevant_text = paragraph
-                            break
-                            
-                        if not relevant_text and paragraphs:
-                            # Only use a random paragraph as a last resort, and only if it's high quality
-                            if len(paragraphs) > 0 and any(len(p) > 200 for p in paragraphs):
-                                # Select the longest paragraph as it likely has most content
-                                relevant_text = max(paragraphs, key=len)
-                            
-                        if relevant_text and len(relevant_text) > 50:
-                            cards.append({
-                                "id": f"card_{content['id']}_{len(cards)}",
-                                "front": f"What is the significance of {term} in this subject?",
-                                "back": relevant_text
-                            })
-                
-                # If still no good cards, create some based on sentences with educational keywords
-                if len(cards) < 2:
-                    # Look for sentences that contain educational keywords
-                    educational_keywords = ['defined', 'concept', 'principle', 'theory', 'method', 
-                                          'important', 'significant', 'key', 'fundamental', 
-                                          'framework', 'approach', 'technique', 'model']
-                    educational_sentences = []
-                    
-                    for paragraph in paragraphs:
-                        sentences = [s.strip() + '.' for s in paragraph.split('.') if len(s.strip()) > 30]
-                        for sentence in sentences:
-                            for keyword in educational_keywords:
-                                if keyword in sentence.lower():
-                                    educational_sentences.append(sentence)
-                                    break
-                    
-                    # Select the top educational sentences
-                    educational_sentences = list(set(educational_sentences))  # Remove duplicates
-                    for i, sentence in enumerate(educational_sentences[:min(num_cards - len(cards), len(educational_sentences))]):
-                        # Extract a potential topic from the sentence
-                        words = sentence.split()
-                        topic_phrase = ""
-                        
-                        # Look for capitalized terms or first sentence components
-                        for j, word in enumerate(words[:10]):  # Check first 10 words
-                            if word and word[0].isupper() and len(word) > 3:
-                                if j < len(words) - 1:  # If not the last word
-                                    topic_phrase = f"{word} {words[j+1]}"
-                                else:
-                                    topic_phrase = word
-                                break
-                        
-                        # If no capitalized term, use a generic question
-                        if not topic_phrase:
-                            if sentence.lower().startswith('the '):
-                                topic_phrase = ' '.join(words[1:min(4, len(words))])
-                            else:
-                                topic_phrase = ' '.join(words[:min(3, len(words))])
-                            
-                        cards.append({
-                            "id": f"card_{content['id']}_{len(cards)}",
-                            "front": f"Explain this key concept from the material: '{topic_phrase}'",
-                            "back": sentence
-                        })
-                
-                # Ensure we have at least one card
-                if not cards and paragraphs:
-                    # Find the best paragraph - the one with most educational content
-                    best_paragraph = ""
-                    max_score = 0
-                    
-                    for paragraph in paragraphs:
-                        if len(paragraph) < 50:
-                            continue
-                            
-                        score = 0
-                        # Score based on educational terms
-                        educational_terms = ['defined', 'concept', 'principle', 'theory', 'method', 
-                                           'important', 'significant', 'key', 'fundamental']
-                        for term in educational_terms:
-                            if term in paragraph.lower():
-                                score += 2
-                        
-                        # Score based on paragraph length (but not too long)
-                        if 100 <= len(paragraph) <= 500:
-                            score += 3
-                        
-                        # Score based on sentence structure
-                        sentences = [s for s in paragraph.split('.') if len(s.strip()) > 0]
-                        if 2 <= len(sentences) <= 5:  # Good paragraph size
-                            score += 2
-                            
-                        if score > max_score:
-                            max_score = score
-                            best_paragraph = paragraph
-                    
-                    if best_paragraph:
-                        cards.append({
-                            "id": f"card_{content['id']}_0",
-                            "front": "What are the key concepts covered in this material?",
-                            "back": best_paragraph
-                        })
-                    else:
-                        # Last resort - create a generic card
-                        cards.append({
-                            "id": f"card_{content['id']}_0",
-                            "front": "Summarize the main points from this material:",
-                            "back": "This material covers important concepts in " + 
-                                  (key_topics[0] if key_topics else "the subject area") + "."
-                        })
+            # Extractive cards within the latency budget; the LLM's cards replace them when they arrive
+            cards, tier = await generate_tiered(
+                content["id"], num_cards, "notecards",
+                llm_job=llm_jobs.get(content["id"]),
+                extractive_call=partial(generate_extractive_notecards, content, num_cards, EXTRACTIVE_BUDGET_SECONDS),
+                fallback_call=partial(generate_fallback_notecards, content, num_cards),
+                deadline=deadline
+            )
             
             # Store cards in cache for future requests
-            store_in_cache(content["id"], num_cards, "notecards", cards)
+            store_in_cache(content["id"], num_cards, "notecards", cards, tier=tier)
             
             source_notecards.append({
                 "source": {
@@ -2000,13 +2058,15 @@ async def generate_notecards(request: NotecardGeneration, user_id: str = Depends
                     "type": content["type"],
                     "course_id": content["course_id"]
                 },
-                "cards": cards
+                "cards": cards,
+                **generation_status(content["id"], num_cards, "notecards")
             })
         
         return {
             "status": "success", 
             "notecards": source_notecards,
             "title": request.title,
+            "prompt_packing": prompt_packing,
             "sources": [{
                 "id": content["id"],
                 "title": content["title"],
@@ -2034,16 +2094,11 @@ async def generate_quiz(request: QuizGeneration, user_id: str = Depends(get_curr
                 
             lecture = lecture_result.data[0]
             
-            # First check if this lecture has a transcript in the zoom_transcripts table
-            transcript_result = supabase.table("zoom_transcripts").select("*").eq("recording_id", lecture_id).limit(1).execute()
-            
-            # Get content from the lecture - first try to get the transcript content
-            content = ""
-            if transcript_result.data and len(transcript_result.data) > 0:
-                transcript = transcript_result.data[0]
-                raw_content = transcript.get("formatted_text", "")
-                # Clean the transcript text before using it
-                content = clean_transcript_text(raw_content)
+            # First check if this lecture has a transcript in the zoom_transcripts table;
+            # its cleaned text and key terms are computed at ingest (cached per transcript version)
+            enrichment = get_transcript_enrichment(lecture_id) or {}
+            content = enrichment.get("cleaned_text") or ""
+            if content:
                 logging.info(f"Found and cleaned transcript for lecture {lecture_id} with {len(content)} characters for quiz generation")
             
             # If no transcript content, try the formatted_text directly from the recording
@@ -2059,13 +2114,16 @@ async def generate_quiz(request: QuizGeneration, user_id: str = Depends(get_curr
                 content += f"Date: {lecture.get('date', '')}\n"
                 content += f"Host: {lecture.get('host', '')}\n"
                 content += f"URL: {lecture.get('url', '')}\n"
+                enrichment = {}
                 
             lecture_contents.append({
                 "id": lecture["id"],
                 "title": lecture.get("title", f"Lecture {lecture.get('recording_id', '')[:8] if lecture.get('recording_id') else ''}"),
                 "content": content,
                 "type": "lecture",
-                "course_id": lecture.get("course_id", "Unknown")
+                "course_id": lecture.get("course_id", "Unknown"),
+                "key_terms": enrichment.get("key_terms") if content == enrichment.get("cleaned_text") else None,
+                "sentence_scores": enrichment.get("sentence_scores") if content == enrichment.get("cleaned_text") else None
             })
             
         # Get assignments content
@@ -2124,9 +2182,21 @@ async def generate_quiz(request: QuizGeneration, user_id: str = Depends(get_curr
             logging.warning(f"RAG API unavailable, will use fallback generation: {str(e)}")
             rag_available = False
         
+        num_questions = min(request.questions_per_source, 10)  # Cap at 10 questions per source
+        
+        # Start the LLM requests up front for sources without cached or pending results,
+        # packing small sources into shared prompts
+        llm_jobs, prompt_packing = {}, None
+        if rag_available:
+            needs_llm = [content for content in all_contents
+                         if not get_from_cache(content["id"], num_questions, "quiz", request.difficulty)
+                         and not generation_status(content["id"], num_questions, "quiz", request.difficulty)["upgrade_pending"]]
+            if needs_llm:
+                llm_jobs, prompt_packing = start_llm_jobs(rag_url, needs_llm, "quiz", num_questions, request.difficulty,
+                                                          pack=request.pack_sources)
+        deadline = asyncio.get_running_loop().time() + GENERATION_LATENCY_BUDGET_SECONDS
+        
         for content in all_contents:
-            num_questions = min(request.questions_per_source, 10)  # Cap at 10 questions per source
-            
             # Check cache first
             cached_questions = get_from_cache(content["id"], num_questions, "quiz", request.difficulty)
             if cached_questions:
@@ -2138,630 +2208,24 @@ async def generate_quiz(request: QuizGeneration, user_id: str = Depends(get_curr
                         "type": content["type"],
                         "course_id": content["course_id"]
                     },
-                    "questions": cached_questions
+                    "questions": cached_questions,
+                    **generation_status(content["id"], num_questions, "quiz", request.difficulty)
                 })
                 continue
                 
-            questions = []
-            
-            # Only try RAG API if it's available
-            if rag_available:
-                try:
-                    # Prepare difficulty description
-                    difficulty_desc = ""
-                    if request.difficulty == "easy":
-                        difficulty_desc = "These should be basic, factual questions testing fundamental understanding."
-                    elif request.difficulty == "medium":
-                        difficulty_desc = "These should be moderate difficulty questions requiring application of concepts."
-                    else:  # hard
-                        difficulty_desc = "These should be challenging questions requiring deep analysis and synthesis of multiple concepts."
-                    
-                    # Create a comprehensive prompt for quiz generation
-                    prompt = f"""
-                    Create {num_questions} high-quality multiple-choice quiz questions based on the educational concepts in the following lecture content.
-                    Difficulty level: {request.difficulty.upper()}. {difficulty_desc}
-                    
-                    CRITICAL INSTRUCTIONS:
-                    - First perform a careful ANALYSIS of the content to identify the SPECIFIC ACADEMIC TOPICS being taught
-                    - Extract the SPECIFIC SUBJECT MATTER and KEY CONCEPTS that represent the core educational content
-                    - Determine the 3-5 most important topics or concepts covered in this content
-                    - Focus EXCLUSIVELY on these specific subject matter topics when creating quiz questions
-                    - If the content seems to contain irrelevant text or artifacts, IGNORE those completely
-                    - Your quiz questions should test understanding of ACTUAL EDUCATIONAL CONCEPTS in the domain
-                    - If you're unsure what the main topics are, focus on technical terms, definitions, and formulas you can identify
-                    
-                    PROCESS:
-                    1. Read and analyze the entire content to identify the specific academic subject and topics
-                    2. List the 3-5 primary educational concepts or topics being taught
-                    3. Create quiz questions ONLY about these specific concepts (not about the lecture itself)
-                    4. If you can't identify clear topics, default to general concepts in the apparent subject domain
-                    
-                    The quiz questions should:
-                    - Assess understanding of SPECIFIC technical concepts, theories, methodologies, or frameworks
-                    - Test knowledge of precise definitions and applications from the identified domain
-                    - Be written as proper educational assessment items that would appear in a formal course exam
-                    - Contain academically accurate information about the subject matter
-                    
-                    For each question:
-                    - Create a clear, focused question about a SPECIFIC academic concept identified in the content
-                    - Provide exactly 4 options (A, B, C, D) with only one correct answer
-                    - Ensure distractors (wrong answers) are plausible but clearly incorrect for experts in the field
-                    - All options should be of similar length and detail level
-                    
-                    Example of BAD question (DO NOT create like this):
-                    QUESTION: Which statement about the lecture format is correct?
-                    A: The lecture had timestamps
-                    B: The professor mentioned deadlines multiple times
-                    C: The lecture was structured around administrative topics
-                    D: The lecture contained artifacts from the transcript
-                    
-                    Example of GOOD question:
-                    QUESTION: Which characteristic best defines microservices architecture?
-                    A: Services with tightly coupled dependencies
-                    B: Services with individual responsibilities and independent deployment
-                    C: Centralized databases shared by all services
-                    D: Services that must be deployed simultaneously
-                    
-                    Content: {content["content"]}
-                    
-                    Format each question as:
-                    QUESTION: [clear educational question about a specific concept]
-                    A: [option A]
-                    B: [option B]
-                    C: [option C]
-                    D: [option D]
-                    CORRECT: [letter of correct answer: A, B, C, or D]
-                    """
-                    
-                    rag_response = requests.post(
-                        f"{rag_url}/query",
-                        json={
-                            "query": prompt,
-                            "document_ids": [],  # We're passing content directly
-                            "top_k": 10,
-                            "model": "meta-llama/llama-3-8b-instruct"
-                        },
-                        timeout=60  # Increase timeout for content generation
-                    )
-                    
-                    if rag_response.status_code == 200:
-                        rag_data = rag_response.json()
-                        generated_text = rag_data.get("response", "")
-                        
-                        # Parse the generated quiz questions
-                        question_blocks = generated_text.split("QUESTION:")
-                        
-                        # Skip the first element if it's empty
-                        if question_blocks and not question_blocks[0].strip():
-                            question_blocks = question_blocks[1:]
-                        
-                        for i, block in enumerate(question_blocks[:num_questions]):
-                            # Extract question text
-                            question_text = block.split("A:")[0].strip() if "A:" in block else block.strip()
-                            
-                            # Extract options
-                            options = []
-                            option_parts = {"A:": "B:", "B:": "C:", "C:": "D:", "D:": "CORRECT:"}
-                            
-                            for start_tag, end_tag in option_parts.items():
-                                if start_tag in block:
-                                    start_idx = block.index(start_tag) + len(start_tag)
-                                    end_idx = block.index(end_tag) if end_tag in block else len(block)
-                                    option_text = block[start_idx:end_idx].strip()
-                                    options.append(option_text)
-                            
-                            # If we don't have exactly 4 options, create placeholders
-                            while len(options) < 4:
-                                options.append(f"Option {len(options)+1} for question {i+1}")
-                            
-                            # Extract correct answer
-                            correct_idx = 0  # Default to A
-                            if "CORRECT:" in block:
-                                correct_part = block.split("CORRECT:")[1].strip().upper()
-                                if correct_part.startswith('A'):
-                                    correct_idx = 0
-                                elif correct_part.startswith('B'):
-                                    correct_idx = 1
-                                elif correct_part.startswith('C'):
-                                    correct_idx = 2
-                                elif correct_part.startswith('D'):
-                                    correct_idx = 3
-                            
-                            questions.append({
-                                "question": question_text,
-                                "options": options[:4],  # Ensure we have exactly 4 options
-                                "correctIndex": correct_idx
-                            })
-                            
-                        # If we didn't get enough questions, fill in with backup method
-                        if len(questions) < num_questions:
-                            # Create questions from the content directly
-                            sentences = [s.strip() for s in content["content"].replace('\n', ' ').split('.') if len(s.strip()) > 20]
-                            
-                            for i in range(len(questions), min(len(sentences), num_questions)):
-                                sentence = sentences[i]
-                                words = sentence.split()
-                                blank_idx = min(len(words) - 1, max(3, len(words) // 3))
-                                
-                                correct_word = words[blank_idx] if blank_idx < len(words) else "answer"
-                                question_text = ' '.join(words[:blank_idx] + ['_____'] + words[blank_idx+1:]) if blank_idx < len(words) else sentence
-                                
-                                options = [correct_word]
-                                # Generate 3 alternative options
-                                for j in range(3):
-                                    alt_idx = (blank_idx + (j+1)*3) % max(1, len(words))
-                                    alt_word = words[alt_idx] if alt_idx < len(words) else f"Option {j+1}"
-                                    if alt_word not in options:
-                                        options.append(alt_word)
-                                    else:
-                                        options.append(f"Alternative {j+1}")
-                                
-                                # Shuffle options
-                                import random
-                                random.shuffle(options)
-                                correct_idx = options.index(correct_word)
-                                
-                                questions.append({
-                                    "question": f"Complete the following: {question_text}",
-                                    "options": options,
-                                    "correctIndex": correct_idx
-                                })
-                    else:
-                        # API call failed with an error status code
-                        raise Exception(f"RAG API returned status code: {rag_response.status_code}")
-                except Exception as rag_error:
-                    logging.error(f"RAG API error during generation, using fallback: {str(rag_error)}")
-                    # Will use fallback since questions list is still empty
-            
-            # If RAG API is unavailable or failed, use the fallback generation
-            if not questions:
-                logging.info(f"Using fallback quiz generation for content {content['id']}")
-                
-                # Extract educational content from cleaned transcript
-                paragraphs = content["content"].split("\n\n")
-                paragraphs = [p for p in paragraphs if len(p) > 30]  # Filter out tiny paragraphs
-                
-                if not paragraphs:
-                    # If no good paragraphs, split by newlines
-                    paragraphs = [p for p in content["content"].split("\n") if len(p) > 30]
-                
-                if not paragraphs:
-                    # If still no good paragraphs, use the whole content as one paragraph
-                    paragraphs = [content["content"]]
-                
-                # Advanced key term extraction - look for domain-specific terms and concepts
-                all_text = " ".join(paragraphs)
-                
-                # Look for capitalized terms that might be important concepts
-                capitalized_terms = re.findall(r'\b[A-Z][a-z]{2,}\b', all_text)
-                capitalized_terms = [term for term in capitalized_terms if len(term) > 3 and term not in 
-                                   ["The", "This", "That", "These", "Those", "There", "Their", "They", "When", "Where", "What"]]
-                
-                # Extract technical terms using improved patterns
-                technical_terms = re.findall(r'\b[A-Za-z][a-z]{2,}(?:[A-Z][a-z]*)+\b', all_text)  # CamelCase terms
-                technical_terms += re.findall(r'\b[a-z]+[-_][a-z]+\b', all_text)  # hyphenated or underscored terms
-                
-                # Look for defined terms with patterns like "X is defined as", "X refers to", "X is a"
-                definition_patterns = [
-                    r'([A-Za-z\s]{3,30})\s+is defined as\s+',
-                    r'([A-Za-z\s]{3,30})\s+refers to\s+',
-                    r'([A-Za-z\s]{3,30})\s+is a\s+',
-                    r'([A-Za-z\s]{3,30})\s+means\s+',
-                    r'([A-Za-z\s]{3,30})\s+is considered\s+',
-                    r'the term\s+([A-Za-z\s]{3,30})'
-                ]
-                
-                defined_terms = []
-                for pattern in definition_patterns:
-                    found_terms = re.findall(pattern, all_text, re.IGNORECASE)
-                    defined_terms.extend([term.strip() for term in found_terms if len(term.strip()) > 3])
-                
-                # Count word frequency for additional domain-specific terms
-                words = all_text.split()
-                word_freq = {}
-                
-                # Identify potentially important technical terms by frequency and characteristics
-                for word in words:
-                    word = word.strip(".,;:()[]{}").lower()
-                    if len(word) > 5 and word not in [
-                        "about", "these", "those", "their", "there", "would", "should", 
-                        "could", "which", "where", "when", "what", "that", "this", "because",
-                        "there", "their", "they", "have", "been", "being", "other", "another"
-                    ]:
-                        word_freq[word] = word_freq.get(word, 0) + 1
-                
-                # Get most frequent technical terms
-                frequent_terms = [w for w, c in sorted(word_freq.items(), key=lambda x: x[1], reverse=True) 
-                                if c > 1 and len(w) > 5][:15]
-                
-                # Combine all discovered terms, prioritizing defined terms
-                potential_topics = list(set(defined_terms + capitalized_terms + technical_terms + frequent_terms))
-                potential_topics = [t for t in potential_topics if len(t) > 3][:20]  # Take up to 20 unique terms
-                
-                # Find educational concept categories in content
-                tech_subjects = {
-                    "architecture": ["design", "pattern", "structure", "layer", "component", "architecture", "framework"],
-                    "microservices": ["service", "api", "container", "docker", "orchestration", "choreography", "microservice"],
-                    "database": ["data", "sql", "nosql", "schema", "query", "storage", "database", "table", "record"],
-                    "software development": ["agile", "scrum", "sprint", "development", "coding", "programming", "software"],
-                    "web technologies": ["http", "rest", "api", "client", "server", "request", "response", "web", "frontend"],
-                    "algorithms": ["algorithm", "complexity", "sorting", "searching", "optimization", "efficient"],
-                    "artificial intelligence": ["ai", "machine learning", "neural", "deep learning", "model", "training"],
-                    "mathematics": ["equation", "formula", "calculation", "theorem", "proof", "mathematical"],
-                    "biology": ["cell", "organism", "species", "gene", "protein", "dna", "biological"],
-                    "chemistry": ["reaction", "molecule", "compound", "element", "bond", "atomic"],
-                    "physics": ["force", "energy", "motion", "particle", "quantum", "relativity"],
-                    "economics": ["market", "supply", "demand", "price", "economic", "inflation", "fiscal"]
-                }
-                
-                # Determine what educational topics are covered - improved detection
-                key_topics = []
-                for topic, related_terms in tech_subjects.items():
-                    relevance_score = sum(1 for term in related_terms if term.lower() in all_text.lower())
-                    if relevance_score >= 2:  # At least 2 related terms should appear
-                        key_topics.append(topic)
-                
-                # If no general topics found, use specific terms
-                if not key_topics and potential_topics:
-                    key_topics = potential_topics[:3]  # Use top specific terms as topics
-                
-                # Generate quiz questions based on identified topics and terms
-                questions = []
-                
-                # First, create questions from defined terms (highest quality)
-                for term in defined_terms[:min(num_questions // 2, len(defined_terms))]:
-                    # Validate term format (avoid nonsensical fragments)
-                    term = term.strip()
-                    # Skip terms that contain partial words or don't make grammatical sense
-                    if (len(term.split()) > 5 or  # Skip terms that are too long (likely sentence fragments)
-                        len(term) < 4 or  # Skip terms that are too short 
-                        term.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as', 'in', 'on', 'at', 'with', 'by', 'for')) or
-                        not all(len(word) > 1 for word in term.split())): # Skip terms with single-letter words
-                        continue
-                    
-                    # Find the full definition sentence
-                    definition_sentence = ""
-                    for paragraph in paragraphs:
-                        if term in paragraph:
-                            sentences = paragraph.split('.')
-                            for sentence in sentences:
-                                if term in sentence:
-                                    definition_sentence = sentence.strip() + "."
-                                    break
-                            if definition_sentence:
-                                break
-                    
-                    if definition_sentence and len(definition_sentence) > 20:
-                        # Create a multiple choice question about the definition
-                        options = []
-                        
-                        # The correct answer is the actual definition
-                        correct_option = definition_sentence
-                        options.append(correct_option)
-                        
-                        # Generate plausible but incorrect alternatives
-                        # Option 1: Take a different sentence from the same paragraph
-                        alternative_sentences = [s for s in paragraphs[0].split('.') if len(s) > 25 and s.strip() != definition_sentence]
-                        if alternative_sentences and len(alternative_sentences) > 0:
-                            options.append(alternative_sentences[0].strip() + ".")
-                        else:
-                            # Fallback - invert some meaning
-                            inverted = definition_sentence.replace("is", "is not").replace("can", "cannot")
-                            if inverted == definition_sentence:  # If no change, be more creative
-                                inverted = "This is unrelated to the subject matter."
-                            options.append(inverted)
-                            
-                        # Option 2: Create a definition for a different term
-                        other_term = None
-                        for t in defined_terms:
-                            if t != term:
-                                other_term = t
-                                break
-                        if other_term:
-                            options.append(f"{other_term} is a key concept in this domain.")
-                        else:
-                            options.append(f"None of these concepts are relevant to {term}.")
-                            
-                        # Option 3: Complete distractor
-                        if key_topics:
-                            options.append(f"This relates to an entirely different field of {key_topics[0] if key_topics[0] != topic else 'study'}.")
-                        else:
-                            options.append("This concept is from a different subject area entirely.")
-                        
-                        # Shuffle options and determine correct index
-                        import random
-                        correct_idx = 0  # Correct answer is the first one before shuffling
-                        correct_answer = options[correct_idx]
-                        random.shuffle(options)
-                        correct_idx = options.index(correct_answer)
-                        
-                        question_text = f"Which of the following correctly describes {term}?"
-                        if request.difficulty == "hard":
-                            question_text = f"Which of the following best characterizes the concept of {term} as used in this context?"
-                        elif request.difficulty == "easy":
-                            question_text = f"What is {term}?"
-                        
-                        questions.append({
-                            "question": question_text,
-                            "options": options,
-                            "correctIndex": correct_idx
-                        })
-                
-                # Create a list of validated, high-quality topics
-                validated_topics = []
-                for topic in key_topics:
-                    if len(topic) > 3 and not topic.lower().startswith(('and', 'or', 'but', 'if', 'to', 'be', 'as')):
-                        # Look for evidence this is really a topic in the content
-                        topic_found = False
-                        for paragraph in paragraphs:
-                            if topic.lower() in paragraph.lower():
-                                topic_found = True
-                                break
-                        if topic_found:
-                            validated_topics.append(topic)
-                
-                # Then create questions about validated key topics/concepts
-                for topic in validated_topics[:min(num_questions - len(questions), len(validated_topics))]:
-                    # Find relevant paragraphs for this topic
-                    relevant_paragraphs = []
-                    for paragraph in paragraphs:
-                        if topic.lower() in paragraph.lower():
-                            relevant_paragraphs.append(paragraph)
-                    
-                    if not relevant_paragraphs and paragraphs:
-                        continue  # Skip if no relevant paragraphs - don't default to random
-                    
-                    if relevant_paragraphs:
-                        # Create a question about this topic
-                        if request.difficulty == "easy":
-                            question_text = f"Which of the following relates to {topic}?"
-                        elif request.difficulty == "medium":
-                            question_text = f"Which statement correctly describes a key aspect of {topic}?"
-                        else:  # hard
-                            question_text = f"Which of the following best represents an advanced principle of {topic}?"
-                    
-                        # Create options - the first one is correct
-                        options = []
-                    
-                        # Extract or create a correct statement about the topic
-                        topic_sentences = []
-                        for para in relevant_paragraphs:
-                            sentences = [s.strip() + "." for s in para.split('.') if len(s.strip()) > 20 and topic.lower() in s.lower()]
-                            topic_sentences.extend(sentences)
-                        
-                        if topic_sentences:
-                            correct_option = topic_sentences[0]
-                        else:
-                            # Fall back to first sentence of relevant paragraph
-                            correct_option = relevant_paragraphs[0].split('.')[0] + "."
-                            
-                        if len(correct_option) < 20 or len(correct_option) > 200:  # If too short or too long
-                            continue  # Skip this topic
-                        
-                        options.append(correct_option)
-                        
-                        # Generate plausible but incorrect alternatives
-                        # Option 1: Take content from a different topic if available
-                        other_content = ""
-                        for other_topic in validated_topics:
-                            if other_topic != topic:
-                                for paragraph in paragraphs:
-                                    if other_topic.lower() in paragraph.lower() and len(paragraph) > 30:
-                                        sentences = [s.strip() + "." for s in paragraph.split('.') if len(s.strip()) > 20]
-                                        if sentences:
-                                            other_content = sentences[0]
-                                            break
-                                if other_content:
-                                    break
-                        
-                        if other_content:
-                            options.append(other_content)
-                        else:
-                            # Fallback - create a statement that reverses meaning
-                            reversed_meaning = correct_option.replace("is", "is not").replace("should", "should not")
-                            if reversed_meaning == correct_option:  # If no change
-                                reversed_meaning = f"This topic is unrelated to {topic}."
-                            options.append(reversed_meaning)
-                        
-                        # Option 2 & 3: More challenging distractors
-                        options.append(f"The concept of {topic} is primarily used in fields unrelated to this subject matter.")
-                        options.append(f"None of the material contains substantive information about {topic}.")
-                        
-                        # Shuffle options and track correct answer
-                        import random
-                        correct_idx = 0  # Correct answer is the first one
-                        correct_answer = options[correct_idx]
-                        random.shuffle(options)
-                        correct_idx = options.index(correct_answer)
-                        
-                        questions.append({
-                            "question": question_text,
-                            "options": options,
-                            "correctIndex": correct_idx
-                        })
-                
-                # If we still need more questions, create high-quality fill-in-the-blank questions
-                attempts = 0
-                while len(questions) < num_questions and paragraphs and attempts < 10:
-                    attempts += 1
-                    
-                    # Select a paragraph with sufficient educational content
-                    candidate_paragraphs = []
-                    for paragraph in paragraphs:
-                        # Basic quality check
-                        if len(paragraph) < 100 or len(paragraph) > 1000:
-                            continue
-                        
-                        # Check for educational terms
-                        educational_terms = ['concept', 'principle', 'theory', 'method', 'important', 'key']
-                        education_score = sum(1 for term in educational_terms if term in paragraph.lower())
-                        
-                        if education_score > 0:
-                            candidate_paragraphs.append(paragraph)
-                    
-                    if not candidate_paragraphs:
-                        candidate_paragraphs = [p for p in paragraphs if len(p) >= 100]
-                    
-                    if not candidate_paragraphs:
-                        break  # No suitable paragraphs found
-                        
-                    import random
-                    paragraph = random.choice(candidate_paragraphs)
-                    sentences = [s.strip() for s in paragraph.split('.') if len(s.strip()) > 30]
-                    
-                    if not sentences:
-                        continue
-                    
-                    # Select the longest sentence which likely has more content
-                    sentence = max(sentences, key=len)
-                    words = sentence.split()
-                    
-                    if len(words) < 8:  # Skip very short sentences
-                        continue
-                    
-                    # Choose a word to blank out - prefer nouns or technical terms
-                    candidate_positions = []
-                    for i, word in enumerate(words):
-                        # Skip first and last few words
-                        if i < 2 or i > len(words) - 3:
-                            continue
-                        # Skip common words and very short words
-                        if word.lower() in ["the", "and", "or", "but", "for", "with", "that", "this", "were", "was", "had", "has"] or len(word) < 4:
-                            continue
-                        # Prioritize capitalized words and technical terms
-                        priority = 1
-                        if word[0].isupper():
-                            priority += 2
-                        if word.lower() in [t.lower() for t in potential_topics]:
-                            priority += 3
-                        # Favor words in middle of sentence
-                        middle_position_score = 1 - abs((i / len(words)) - 0.5)  # 0.5 is middle, score higher near middle
-                        priority += middle_position_score * 2
-                        
-                        candidate_positions.append((i, priority))
-                    
-                    # If no good candidates, skip this sentence
-                    if not candidate_positions:
-                        continue
-                    
-                    # Sort by priority
-                    candidate_positions.sort(key=lambda x: x[1], reverse=True)
-                    blank_idx = candidate_positions[0][0]
-                    
-                    # Create the question
-                    correct_word = words[blank_idx]
-                    # Skip very short words or common words after additional validation
-                    if len(correct_word) < 4 or correct_word.lower() in ["from", "that", "with", "have", "this", "what", "when", "where", "which"]:
-                        continue
-                        
-                    words[blank_idx] = "_____"
-                    question_text = "Complete the following statement: " + ' '.join(words)
-                    
-                    # Create options - correct answer + 3 distractors
-                    options = [correct_word]
-                    
-                    # Add distractor options - use other words from the text
-                    distractors = []
-                    for word in all_text.split():
-                        word = word.strip(".,;:()[]{}").lower()
-                        # Look for similar words for more challenging distractors
-                        if (len(word) >= len(correct_word) - 2 and 
-                            len(word) <= len(correct_word) + 2 and 
-                            word != correct_word.lower() and
-                            word not in ["from", "that", "with", "have", "this", "what", "when", "where", "which"] and
-                            len(word) >= 4):
-                            distractors.append(word)
-                    
-                    # If we have enough distractors, use them; otherwise create some
-                    if len(distractors) >= 3:
-                        import random
-                        random.shuffle(distractors)
-                        options.extend(distractors[:3])
-                    else:
-                        # Add some generic alternatives based on the correct word
-                        if correct_word.endswith("ing"):
-                            options.append(correct_word.replace("ing", "ed"))
-                        else:
-                            options.append(correct_word + "ed")
-                            
-                        if correct_word.endswith("s"):
-                            options.append(correct_word[:-1])
-                        else:
-                            options.append(correct_word + "s")
-                            
-                        options.append("none of these")
-                    
-                    # Ensure we have exactly 4 options
-                    options = options[:4]
-                    while len(options) < 4:
-                        options.append(f"Option {len(options)+1}")
-                    
-                    # Ensure options are unique
-                    if len(set(options)) < 4:
-                        continue  # Skip if we can't generate 4 unique options
-                    
-                    # Shuffle options and track the correct answer
-                    correct_idx = 0  # The first option is the correct one
-                    correct_answer = options[correct_idx]
-                    
-                    import random
-                    random.shuffle(options)
-                    correct_idx = options.index(correct_answer)
-                    
-                    questions.append({
-                        "question": question_text,
-                        "options": options,
-                        "correctIndex": correct_idx
-                    })
-                
-                # Ensure we have at least one question
-                if not questions and paragraphs:
-                    # Create a high-quality conceptual question about the material
-                    educational_sentences = []
-                    
-                    # Look for sentences containing educational terms
-                    educational_keywords = ['concept', 'principle', 'theory', 'method', 'important', 'key', 'fundamental']
-                    
-                    for paragraph in paragraphs:
-                        if len(paragraph) < 50:
-                            continue
-                            
-                        sentences = [s.strip() + "." for s in paragraph.split('.') if len(s.strip()) > 30]
-                        for sentence in sentences:
-                            for keyword in educational_keywords:
-                                if keyword in sentence.lower():
-                                    educational_sentences.append(sentence)
-                                    break
-                    
-                    main_topic = key_topics[0] if key_topics else "the subject"
-                    
-                    if educational_sentences:
-                        # Use a good educational sentence as the correct answer
-                        options = [
-                            educational_sentences[0],
-                            f"This material contains no substantive information about {main_topic}.",
-                            f"The content is primarily focused on administrative matters rather than {main_topic}.",
-                            "None of the provided statements accurately reflect the content."
-                        ]
-                    else:
-                        # Generic options as fallback
-                        options = [
-                            f"The material focuses primarily on {main_topic}.",
-                            "The content does not contain any educational material.",
-                            "This material is entirely unrelated to the subject matter.",
-                            "None of the statements correctly describe the content."
-                        ]
-                    
-                    correct_idx = 0  # The first option is the correct one
-                    
-                    questions.append({
-                        "question": "Which statement best characterizes the educational content of this material?",
-                        "options": options,
-                        "correctIndex": correct_idx
-                    })
+            # Extractive questions within the latency budget; the LLM's questions replace them when they arrive
+            questions, tier = await generate_tiered(
+                content["id"], num_questions, "quiz",
+                llm_job=llm_jobs.get(content["id"]),
+                extractive_call=partial(generate_extractive_quiz, content, num_questions, request.difficulty,
+                                        EXTRACTIVE_BUDGET_SECONDS),
+                fallback_call=partial(generate_fallback_quiz, content, num_questions, request.difficulty),
+                difficulty=request.difficulty,
+                deadline=deadline
+            )
             
             # Store questions in cache for future requests
-            store_in_cache(content["id"], num_questions, "quiz", questions, request.difficulty)
+            store_in_cache(content["id"], num_questions, "quiz", questions, request.difficulty, tier=tier)
             
             source_quizzes.append({
                 "source": {
@@ -2770,12 +2234,14 @@ async def generate_quiz(request: QuizGeneration, user_id: str = Depends(get_curr
                     "type": content["type"],
                     "course_id": content["course_id"]
                 },
-                "questions": questions
+                "questions": questions,
+                **generation_status(content["id"], num_questions, "quiz", request.difficulty)
             })
         
         return {
             "status": "success",
             "quizzes": source_quizzes,
+            "prompt_packing": prompt_packing,
             "sources": [{
                 "id": content["id"],
                 "title": content["title"],
@@ -2836,6 +2302,7 @@ async def clear_generation_cache(current_user: dict = Depends(get_current_user))
         global generation_cache
         cache_size = len(generation_cache)
         generation_cache = {}
+        cleaned_transcript_cache.clear()
         
         return {
             "status": "success",
@@ -2881,7 +2348,11 @@ async def get_cache_info(current_user: dict = Depends(get_current_user)):
             "item_counts": counts,
             "oldest_item_age": oldest_age,
             "newest_item_age": newest_age,
-            "expiry_seconds": CACHE_EXPIRY_SECONDS
+            "expiry_seconds": CACHE_EXPIRY_SECONDS,
+            "cleaned_transcripts": len(cleaned_transcript_cache),
+            "pending_llm_upgrades": len(pending_llm_upgrades),
+            "extractive_embeddings": embedding_status(),
+            "llm_parsing": parse_stats()
         }
     except Exception as e:
         logging.error(f"Error getting cache info: {str(e)}")
@@ -2898,187 +2369,7 @@ def clean_transcript_text(text):
     Thoroughly clean and structure lecture transcript text for effective study material generation.
     Aggressively removes timestamps, markers, speaker identifiers, and other non-educational content.
     Focuses on extracting meaningful educational content only.
+
+    The rules are precompiled in transcript_cleaning.py; see that module for details.
     """
-    if not text or len(text.strip()) < 10:
-        return ""
-    
-    # Remove common transcript artifacts
-    
-    # Remove timestamp patterns like [00:01:23], [01], [Minute], etc.
-    text = re.sub(r'\[\d{2}:\d{2}:\d{2}\]', '', text)
-    text = re.sub(r'\[\d{2}:\d{2}\]', '', text)
-    text = re.sub(r'\[\d+\]', '', text)
-    text = re.sub(r'\[Minute\s*\d*\]', '', text)
-    text = re.sub(r'\[minute\s*\d*\]', '', text)
-    
-    # Remove numeric markers at start of lines like "19]"
-    text = re.sub(r'^\s*\d+\]', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s\d+\]', ' ', text)
-    
-    # Remove speaker identifiers that might appear at start of lines
-    text = re.sub(r'^\s*\w+\s*:', '', text, flags=re.MULTILINE)
-    
-    # Remove more common transcript artifacts
-    text = re.sub(r'\(inaudible\)', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\(pause\)', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\(silence\)', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\(background noise\)', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\(laughter\)', '', text, flags=re.IGNORECASE)
-    
-    # Remove URL artifacts that might appear in transcripts
-    text = re.sub(r'https?://\S+', '', text)
-    text = re.sub(r'www\.\S+', '', text)
-    
-    # Remove standard lecture introductions and housekeeping
-    intro_patterns = [
-        r'Hello\s+everyone',
-        r'Welcome to today\'s class',
-        r'So we\'ll now begin our class',
-        r'Let\'s get started',
-        r'Before we start',
-        r'Let me share my screen',
-        r'Can everyone see my screen',
-        r'Is everyone ready',
-        r'Thanks for joining',
-        r'Good morning',
-        r'Good afternoon',
-        r'Let me know if you have any questions',
-        r'I hope you can all hear me',
-        r'Let\'s dive right in',
-        r'Today we\'re going to talk about',
-        r'In today\'s lecture',
-        r'Any questions before we begin',
-        r'Let\'s finish up there for today',
-        r'That\'s all for today',
-        r'See you next time',
-    ]
-    
-    for pattern in intro_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-    
-    # Remove other bracketed content
-    text = re.sub(r'\[.*?\]', '', text)
-    
-    # Remove references to slides, modules, assignments unrelated to content
-    text = re.sub(r'(?i)(today\'s lecture|this week|next week|module \d+|the deadline is|assignment|homework|due date)', '', text)
-    
-    # Keep important educational phrases - preserve common definitional phrases
-    educational_phrases = [
-        r'is defined as',
-        r'refers to',
-        r'is a type of',
-        r'is characterized by',
-        r'is composed of',
-        r'consists of',
-        r'there are \w+ types of',
-        r'the key concept',
-        r'important principles',
-        r'fundamental ideas',
-        r'key characteristics',
-    ]
-    
-    # Mark these phrases to protect them from over-aggressive cleaning
-    for phrase in educational_phrases:
-        marker = f"__PRESERVE_PHRASE_{educational_phrases.index(phrase)}__"
-        text = re.sub(phrase, marker, text, flags=re.IGNORECASE)
-    
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Split by periods and process each sentence
-    sentences = [s.strip() for s in text.split('.') if s.strip()]
-    cleaned_sentences = []
-    
-    # Filter out non-educational sentences - those too short or containing administrative content
-    admin_keywords = ['submit', 'deadline', 'due', 'grading', 'attendance', 'assignment', 'report', 'presentation']
-    
-    for sentence in sentences:
-        # Skip short sentences
-        if len(sentence) < 25:
-            continue
-            
-        # Skip administrative content
-        if any(keyword in sentence.lower() for keyword in admin_keywords):
-            continue
-            
-        # Skip sentences that start with filler or transition phrases
-        if re.match(r'^(so|um|uh|well|now|okay|all right|basically)', sentence.lower()):
-            continue
-
-        # Skip sentences with too many pronouns and vague references
-        pronoun_count = len(re.findall(r'\b(it|this|that|these|those|they|them|we|our|you|your)\b', sentence.lower()))
-        if pronoun_count > 5 and len(sentence) < 100:  # If short sentence with many pronouns, likely not substantive
-            continue
-            
-        # Ensure sentence ends with proper punctuation
-        if not sentence.endswith(('.', '?', '!')):
-            sentence += '.'
-            
-        # Restore preserved educational phrases
-        for i, phrase in enumerate(educational_phrases):
-            marker = f"__PRESERVE_PHRASE_{i}__"
-            sentence = sentence.replace(marker, phrase)
-            
-        cleaned_sentences.append(sentence)
-    
-    # Score sentences by educational value - look for technical terms, definitions, etc.
-    scored_sentences = []
-    for sentence in cleaned_sentences:
-        score = 0
-        
-        # Higher score for sentences that contain educational keywords
-        educational_terms = ['concept', 'principle', 'theory', 'method', 'technique', 'framework', 'model', 'approach', 'definition', 'example']
-        for term in educational_terms:
-            if term in sentence.lower():
-                score += 2
-        
-        # Higher score for sentences with capitalized terms (potentially important concepts)
-        capitalized_terms = re.findall(r'\b[A-Z][a-z]{2,}\b', sentence)
-        score += len(capitalized_terms)
-        
-        # Higher score for definitional sentences
-        if any(phrase in sentence.lower() for phrase in ['is defined as', 'refers to', 'is a', 'means', 'is considered']):
-            score += 5
-            
-        # Higher score for sentences with technical or domain-specific terms
-        if re.search(r'\b[a-z]+[-_][a-z]+\b', sentence) or re.search(r'\b[A-Za-z][a-z]{2,}(?:[A-Z][a-z]*)+\b', sentence):
-            score += 3
-        
-        scored_sentences.append((sentence, score))
-    
-    # Sort sentences by score (higher is better) to prioritize more educational content
-    scored_sentences.sort(key=lambda x: x[1], reverse=True)
-    
-    # Join top-scoring sentences back into paragraphs, maintaining some original order
-    # by grouping related sentences
-    ordered_sentences = [sentence for sentence, _ in scored_sentences]
-    paragraphs = []
-    current_paragraph = []
-    
-    for sentence in ordered_sentences:
-        current_paragraph.append(sentence)
-        
-        # Start a new paragraph after longer sentences or those that end topics
-        if len(sentence) > 100 or re.search(r'(?i)(in summary|to summarize|moving on|next|let\'s discuss)', sentence):
-            if current_paragraph:
-                paragraphs.append(' '.join(current_paragraph))
-                current_paragraph = []
-    
-    # Add the last paragraph if there's content
-    if current_paragraph:
-        paragraphs.append(' '.join(current_paragraph))
-    
-    # Final cleanup
-    cleaned_text = '\n\n'.join(paragraphs)
-    
-    # Remove any remaining obvious transcript artifacts
-    cleaned_text = re.sub(r'(?i)\b(click|screen|slide|button)\b', '', cleaned_text)
-    
-    # Final sanity check - if we've removed too much content
-    if len(cleaned_text) < 100 and len(text) > 500:
-        # Fall back to a simpler cleaning approach
-        simple_cleaned = re.sub(r'\[\d+\]|\[\d{2}:\d{2}(:\d{2})?\]|\[Minute\s*\d*\]', '', text)
-        simple_cleaned = re.sub(r'\s+', ' ', simple_cleaned)
-        return simple_cleaned.strip()
-        
-    return cleaned_text.strip()
\ No newline at end of file
+    return clean_text(text)
@@ -0,0 +1,81 @@
+"""
+Packing of several sources into one LLM generation prompt.
+
+Every selected lecture or assignment used to get its own ``/query`` request
+carrying the full instruction prompt. ``pack_sources`` groups sources so the
+instructions are sent once per group, as long as the group fits the prompt
+token budget; sources too large to share a prompt keep their own request.
+``packing_report`` compares the prompt tokens and round trips against one
+request per source.
+
+Token counts are estimates (about four characters per token, which is close
+to cl100k for English text): the backend has no tokenizer, and the budget
+only needs to keep prompts well inside the model's context.
+"""
+
+from typing import Any, Dict, List
+
+CHARS_PER_TOKEN = 4
+# "SOURCE: <id>" / "Content:" lines wrapped around each packed source
+SOURCE_HEADER_TOKENS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def pack_sources(sources: List[Dict[str, Any]], overhead_tokens: int, budget_tokens: int,
+                 max_sources: int) -> List[List[Dict[str, Any]]]:
+    """
+    Group sources into prompts
+
+    Sources are placed first-fit, in selection order, into the first group
+    with room for them; each group holds at most ``max_sources`` sources and
+    ``overhead_tokens + sum(source tokens)`` stays within ``budget_tokens``.
+
+    Args:
+        sources: Source dicts with ``content``
+        overhead_tokens: Tokens of the instructions sent once per prompt
+        budget_tokens: Prompt token budget of a packed prompt
+        max_sources: Maximum number of sources per prompt
+
+    Returns:
+        List of groups, each a list of sources; single-source groups are sent
+        with the regular prompt
+    """
+    groups = []
+    room = []
+    for source in sources:
+        tokens = estimate_tokens(source["content"]) + SOURCE_HEADER_TOKENS
+        for i, group in enumerate(groups):
+            if len(group) < max_sources and tokens <= room[i]:
+                group.append(source)
+                room[i] -= tokens
+                break
+        else:
+            groups.append([source])
+            room.append(budget_tokens - overhead_tokens - tokens)
+    return groups
+
+
+def packing_report(groups: List[List[Dict[str, Any]]], overhead_tokens: int) -> Dict[str, int]:
+    """
+    Compare packed prompts against one prompt per source
+
+    Returns:
+        Dict with the number of sources, LLM calls with and without packing,
+        estimated prompt tokens with and without packing and the tokens saved
+    """
+    content_tokens = [estimate_tokens(source["content"]) for group in groups for source in group]
+    unpacked = sum(overhead_tokens + tokens for tokens in content_tokens)
+    packed = sum(overhead_tokens + (SOURCE_HEADER_TOKENS * len(group) if len(group) > 1 else 0)
+                 for group in groups) + sum(content_tokens)
+    return {
+        "sources": len(content_tokens),
+        "llm_calls": len(groups),
+        "unpacked_llm_calls": len(content_tokens),
+        "prompt_tokens": packed,
+        "unpacked_prompt_tokens": unpacked,
+        "saved_prompt_tokens": unpacked - packed,
+    }
@@ -0,0 +1,51 @@
+"""
+Response shapes of packed (several sources per prompt) LLM outputs.
+
+Run with: python -m pytest test_llm_output_parser.py
+"""
+
+import json
+
+from llm_output_parser import parse_batch
+
+CARD = {"front": "What is the MSI protocol?", "back": "A cache coherence protocol with three states"}
+
+
+def test_keyed_form_with_source_id_repeated():
+    text = json.dumps({"a1": {"source_id": "a1", "cards": [CARD]}, "t2": {"source_id": "t2", "cards": [CARD, CARD]}})
+    results, outcome = parse_batch(text, "notecards", ["a1", "t2"])
+    assert outcome == "json"
+    assert [card["front"] for card in results["a1"]] == [CARD["front"]]
+    assert [card["id"] for card in results["t2"]] == ["card_t2_0", "card_t2_1"]
+
+
+def test_keyed_form_key_wins_over_misstated_source_id():
+    text = json.dumps({"a1": {"source_id": "t2", "cards": [CARD]}})
+    results, _ = parse_batch(text, "notecards", ["a1", "t2"])
+    assert len(results["a1"]) == 1
+    assert results["t2"] == []
+
+
+def test_keyed_form_with_bare_list():
+    question = {"question": "Which state is dirty?", "options": ["Modified", "Shared", "Invalid", "Exclusive"], "correct": 0}
+    text = json.dumps({"a1": [question]})
+    results, outcome = parse_batch(text, "quiz", ["a1"])
+    assert outcome == "json"
+    assert results["a1"][0]["question"] == "Which state is dirty?"
+    assert results["a1"][0]["correctIndex"] == 0
+
+
+def test_sources_list_form_and_skipped_source():
+    text = json.dumps({"sources": [{"source_id": "a1", "cards": [CARD]}]})
+    results, outcome = parse_batch(text, "notecards", ["a1", "t2"], limit=5)
+    assert outcome == "json"
+    assert len(results["a1"]) == 1
+    assert results["t2"] == []
+
+
+def test_legacy_source_sections():
+    text = f"SOURCE: a1\nFRONT: {CARD['front']}\nBACK: {CARD['back']}\nSOURCE: t2\nFRONT: Term\nBACK: Definition\n"
+    results, outcome = parse_batch(text, "notecards", ["a1", "t2"])
+    assert outcome == "legacy"
+    assert results["a1"][0]["back"] == CARD["back"]
+    assert results["t2"][0]["front"] == "Term"
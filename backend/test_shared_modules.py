@@ -0,0 +1,27 @@
+"""
+The modules both services import are kept as two copies, one per deployable
+directory; they must not drift apart.
+
+Run with: python -m pytest test_shared_modules.py
+"""
+
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SUMMARIZATION_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "summarization")
+
+SHARED_MODULES = ["http_compression.py", "llm_output_parser.py", "metrics.py", "tracing.py", "transcript_codec.py"]
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_copies_are_identical(name):
+    other = os.path.join(SUMMARIZATION_DIR, name)
+    if not os.path.isdir(SUMMARIZATION_DIR):
+        pytest.skip("summarization/ is not checked out next to backend/")
+    with open(os.path.join(BACKEND_DIR, name), "rb") as f:
+        backend_copy = f.read()
+    with open(other, "rb") as f:
+        summarization_copy = f.read()
+    assert backend_copy == summarization_copy, f"backend/{name} and summarization/{name} differ"
@@ -0,0 +1,83 @@
+"""
+Golden outputs of the transcript cleaning engine.
+
+The expected values are what the old ``clean_transcript_text`` (a sequence of
+``re.sub`` passes in main.py) produced, except for its documented bugs: the
+``there are \\w+ types of`` phrase, markers leaking from the short-output
+fallback, and UI words stripped after filtering (which left fragments such as
+``"the  on the ."``).
+
+Run with: python -m pytest test_transcript_cleaning.py
+"""
+
+import pytest
+
+from transcript_cleaning import clean_line, clean_segments, clean_text
+
+GOLDEN_CASES = [
+    ("", ""),
+    ("[00:01] hi", ""),
+    (
+        "[Minute 0]\n\n[00:05] Hello everyone, welcome.\n[00:09] A cache is defined as a small fast memory close to the CPU.\n"
+        "[00:14] Speaker: The Write-Back Policy refers to delaying writes until eviction.\n"
+        "[00:20] Remember the homework due date is Friday.",
+        "The Write-Back Policy refers to delaying writes until eviction. A cache is defined as a small fast memory close to the CPU.",
+    ),
+    (
+        "[00:03] (inaudible) So basically we start now.\n[00:07] There are three types of cache misses: compulsory, capacity and conflict misses.\n"
+        "[00:12] See https://example.com/slides for the slide deck.\n[01:02] Click the button on the screen.",
+        "there are three types of cache misses: compulsory, capacity and conflict misses.",
+    ),
+    (
+        "[00:01] MESI Coherence Protocol is a type of snooping protocol used by Multiprocessor Systems to keep caches consistent. "
+        "Moving on, the Modified state means the line is dirty and exclusive to one core.",
+        "MESI Coherence Protocol is a type of snooping protocol used by Multiprocessor Systems to keep caches consistent.\n\n"
+        "Moving on, the Modified state means the line is dirty and exclusive to one core.",
+    ),
+    (
+        "[00:01] Today the deadline is Friday for the homework and the report.\n"
+        "[00:04] Bob: A TLB is defined as a cache of page table entries used by the MMU.",
+        "A TLB is defined as a cache of page table entries used by the MMU.",
+    ),
+    (
+        "[00:01] There are four types of cache misses in most textbooks, compulsory ones among them.",
+        "there are four types of cache misses in most textbooks, compulsory ones among them.",
+    ),
+]
+
+# Rules apply in the old cleaner's order, so an earlier rule wins where two overlap
+LINE_CASES = [
+    ("so in module 19] and it keeps going", "so in module  and it keeps going"),  # stray marker before "module \d+"
+    ("[a [00:01] b] rest of the line", " rest of the line"),                    # timestamp before brackets
+    ("[a 19] b] rest", " rest"),                                                # stray marker before brackets
+    ("module [x]5 remains", " remains"),                                        # brackets before "module \d+"
+    ("Good (laughter)morning class", " class"),                                 # noise tag before greetings
+    ("Prof: [00:05] Hello everyone, caches", "  , caches"),                     # timestamp before speaker label
+    ("That's all for today we're going to talk about caches", "That's all for  caches"),
+    ("see https://example.com/x and www.example.org now", "see  and  now"),
+    ("Café HELLO   everyone (Inaudible) naïve", "Café   naïve"),                  # non-ASCII: case-insensitive patterns
+]
+
+
+@pytest.mark.parametrize("source,expected", GOLDEN_CASES)
+def test_clean_text_golden(source, expected):
+    assert clean_text(source) == expected
+
+
+@pytest.mark.parametrize("line,expected", LINE_CASES)
+def test_clean_line_rule_order(line, expected):
+    assert clean_line(line) == expected
+
+
+@pytest.mark.parametrize("source,expected", GOLDEN_CASES[2:])
+def test_clean_segments_matches_clean_text(source, expected):
+    assert clean_segments(source.split("\n")) == expected
+
+
+def test_fallback_restores_protected_phrases():
+    # Every sentence is filtered out, so the lightly cleaned text is returned
+    source = "\n".join(f"[00:{i:02d}] Um it is defined as this and that, we do it so you see it." for i in range(12))
+    cleaned = clean_text(source)
+    assert cleaned.startswith("Um it is defined as this and that")
+    assert "__PRESERVE_PHRASE_" not in cleaned
+    assert "[00:" not in cleaned
@@ -0,0 +1,310 @@
+"""
+Transcript cleaning engine used by the notecard and quiz generators.
+
+Cleaning used to be ~40 sequential ``re.sub`` passes over the whole transcript
+(``clean_transcript_text`` in main.py). This module compiles the same rules
+once at import time, in two passes:
+
+1. Artifact pass: the old rules for timestamps, stray ``N]`` markers, speaker
+   labels, noise tags, URLs, lecture housekeeping, brackets and administrative
+   phrases, in their original order. The case-insensitive rules run as
+   lowercase patterns against the lowercased text, which is where the old
+   cleaner spent its time.
+2. Sentence pass: definitional phrases are protected in one scan, the text is
+   split into sentences, filtered, scored and grouped into paragraphs.
+
+``clean_text`` works on a formatted transcript string, ``clean_segments`` on
+any iterable of segment texts (so transcripts can be cleaned without building
+``formatted_text`` first).
+
+The golden outputs are checked by ``test_transcript_cleaning.py``; run
+``python transcript_cleaning.py`` to measure throughput on a synthetic
+3-hour lecture.
+"""
+
+import re
+import time
+from typing import Iterable, List, Tuple
+
+# --- Artifact pass -----------------------------------------------------------
+
+_NOISE_TAGS = ['inaudible', 'pause', 'silence', 'background noise', 'laughter']
+
+INTRO_PHRASES = [
+    r'Hello\s+everyone',
+    r'Welcome to today\'s class',
+    r'So we\'ll now begin our class',
+    r'Let\'s get started',
+    r'Before we start',
+    r'Let me share my screen',
+    r'Can everyone see my screen',
+    r'Is everyone ready',
+    r'Thanks for joining',
+    r'Good morning',
+    r'Good afternoon',
+    r'Let me know if you have any questions',
+    r'I hope you can all hear me',
+    r'Let\'s dive right in',
+    r'Today we\'re going to talk about',
+    r'In today\'s lecture',
+    r'Any questions before we begin',
+    r'Let\'s finish up there for today',
+    r'That\'s all for today',
+    r'See you next time',
+]
+
+ADMIN_PHRASES = [
+    r'today\'s lecture', r'this week', r'next week', r'module \d+',
+    r'the deadline is', r'assignment', r'homework', r'due date',
+]
+
+# The artifact rules, in the order the old cleaner applied them: later rules see
+# the text earlier ones left behind (``module 19]`` loses the stray marker first,
+# ``[a [00:01] b]`` loses the timestamp before the brackets are matched), so the
+# order matters and the rules are applied one after another.
+# (pattern, replacement, case-insensitive)
+_ARTIFACT_RULES = (
+    [
+        (r'\[\d{2}:\d{2}:\d{2}\]', '', False),                 # timestamps
+        (r'\[\d{2}:\d{2}\]', '', False),
+        (r'\[\d+\]', '', False),
+        (r'\[Minute\s*\d*\]', '', False),
+        (r'\[minute\s*\d*\]', '', False),
+        (r'(?m)^\s*\d+\]', '', False),                        # stray "19]" markers
+        (r'\s\d+\]', ' ', False),
+        (r'(?m)^\s*\w+\s*:', '', False),                      # speaker labels
+    ]
+    + [(r'\(' + tag + r'\)', '', True) for tag in _NOISE_TAGS]  # (inaudible), (laughter), ...
+    + [(r'https?://\S+', '', False), (r'www\.\S+', '', False)]  # URLs
+    + [(phrase, '', True) for phrase in INTRO_PHRASES]          # lecture housekeeping
+    + [(r'\[.*?\]', '', False)]                                 # other bracketed content
+    + [('(' + '|'.join(ADMIN_PHRASES) + ')', '', True)]        # administrative references (one alternation)
+)
+
+# Case-insensitive matching is slow in ``re`` (no literal prefix scan), so on
+# ASCII text those rules run as lowercase patterns against the lowercased text;
+# the offsets are the same. Non-ASCII text (lowercasing can change its length)
+# uses the case-insensitive patterns.
+_COMPILED_RULES = [
+    (re.compile(pattern.lower() if ignore_case else pattern), re.compile(pattern, re.IGNORECASE if ignore_case else 0),
+     replacement, ignore_case)
+    for pattern, replacement, ignore_case in _ARTIFACT_RULES
+]
+
+# Removed again before the short-output fallback, as the old cleaner did
+_FALLBACK_MARKERS = re.compile(r'\[\d+\]|\[\d{2}:\d{2}(:\d{2})?\]|\[Minute\s*\d*\]')
+_WHITESPACE = re.compile(r'\s+')
+
+# --- Sentence pass -------------------------------------------------------------
+
+# Definitional phrases protected from filtering and restored (lowercased) afterwards
+EDUCATIONAL_PHRASES = [
+    r'is defined as',
+    r'refers to',
+    r'is a type of',
+    r'is characterized by',
+    r'is composed of',
+    r'consists of',
+    r'there are \w+ types of',
+    r'the key concept',
+    r'important principles',
+    r'fundamental ideas',
+    r'key characteristics',
+]
+_PHRASES = re.compile('|'.join(f'({phrase})' for phrase in EDUCATIONAL_PHRASES))
+_PHRASES_ANY_CASE = re.compile(_PHRASES.pattern, re.IGNORECASE)
+_MARKER = re.compile(r'__PRESERVE_PHRASE_(\d+)__')
+
+ADMIN_KEYWORDS = ['submit', 'deadline', 'due', 'grading', 'attendance', 'assignment', 'report', 'presentation']
+EDUCATIONAL_TERMS = ['concept', 'principle', 'theory', 'method', 'technique', 'framework', 'model', 'approach', 'definition', 'example']
+DEFINITION_CUES = ['is defined as', 'refers to', 'is a', 'means', 'is considered']
+
+_FILLER_START = re.compile(r'^(so|um|uh|well|now|okay|all right|basically)')
+_PRONOUNS = re.compile(r'\b(it|this|that|these|those|they|them|we|our|you|your)\b')
+_CAPITALIZED = re.compile(r'\b[A-Z][a-z]{2,}\b')
+_TECHNICAL = re.compile(r'\b[a-z]+[-_][a-z]+\b|\b[A-Za-z][a-z]{2,}(?:[A-Z][a-z]*)+\b')
+_TOPIC_BREAK = re.compile(r'(?i)(in summary|to summarize|moving on|next|let\'s discuss)')
+_UI_WORDS = re.compile(r'\b(?:click|screen|slide|button)\b')
+_UI_WORDS_ANY_CASE = re.compile(_UI_WORDS.pattern, re.IGNORECASE)
+
+
+def _delete_lowercase(text: str, pattern) -> str:
+    """Delete the matches of a lowercase pattern in ``text.lower()`` from ASCII ``text``"""
+    pieces = []
+    position = 0
+    for match in pattern.finditer(text.lower()):
+        pieces.append(text[position:match.start()])
+        position = match.end()
+    if not pieces:
+        return text
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+
+def _remove_artifacts(text: str) -> str:
+    """Remove timestamps, speaker labels and non-educational artifacts from transcript text."""
+    ascii_only = text.isascii()
+    for lowercase, any_case, replacement, ignore_case in _COMPILED_RULES:
+        if ignore_case and ascii_only:
+            text = _delete_lowercase(text, lowercase)
+        else:
+            text = any_case.sub(replacement, text)
+    return text
+
+
+def clean_line(line: str) -> str:
+    """Remove timestamps, speaker labels and non-educational artifacts from one transcript line."""
+    return _remove_artifacts(line)
+
+
+def _protect(match) -> str:
+    return f"__PRESERVE_PHRASE_{match.lastindex - 1}__"
+
+
+def _restore(sentence: str, phrases: List[str]) -> str:
+    if '__PRESERVE_PHRASE_' not in sentence:
+        return sentence
+    return _MARKER.sub(lambda match: phrases.pop(0), sentence)
+
+
+def score_sentence(sentence: str) -> int:
+    """Score how much educational content a sentence carries (higher is better)."""
+    lowered = sentence.lower()
+    score = 2 * sum(1 for term in EDUCATIONAL_TERMS if term in lowered)
+    score += len(_CAPITALIZED.findall(sentence))
+    if any(cue in lowered for cue in DEFINITION_CUES):
+        score += 5
+    if _TECHNICAL.search(sentence):
+        score += 3
+    return score
+
+
+def _clean_lines(lines: Iterable[str]) -> str:
+    # Artifact pass over the whole text, then phrase protection (one scan)
+    text = _WHITESPACE.sub(' ', _remove_artifacts('\n'.join(lines)))
+    if text.isascii():
+        phrase_matches = list(_PHRASES.finditer(text.lower()))
+    else:
+        phrase_matches = list(_PHRASES_ANY_CASE.finditer(text))
+    phrases = [match.group(0).lower() for match in phrase_matches]
+
+    # Swap each definitional phrase for a marker so filtering can't split it
+    pieces = []
+    position = 0
+    for match in phrase_matches:
+        pieces.append(text[position:match.start()])
+        pieces.append(_protect(match))
+        position = match.end()
+    pieces.append(text[position:])
+    marked = ''.join(pieces)
+
+    sentences: List[Tuple[str, int]] = []
+    for raw_sentence in marked.split('.'):
+        sentence = raw_sentence.strip()
+        if not sentence:
+            continue
+        marker_count = sentence.count('__PRESERVE_PHRASE_')
+
+        lowered = sentence.lower()
+        if _UI_WORDS_ANY_CASE.search(sentence):
+            # Before filtering, so "Click the button on the screen" is dropped rather than left as "the  on the"
+            if sentence.isascii():
+                sentence = ' '.join(_delete_lowercase(sentence, _UI_WORDS).split())
+            else:
+                sentence = ' '.join(_UI_WORDS_ANY_CASE.sub('', sentence).split())
+            lowered = sentence.lower()
+        keep = (
+            len(sentence) >= 25
+            and not any(keyword in lowered for keyword in ADMIN_KEYWORDS)
+            and not _FILLER_START.match(lowered)
+            and not (len(sentence) < 100 and len(_PRONOUNS.findall(lowered)) > 5)
+        )
+        if not keep:
+            del phrases[:marker_count]
+            continue
+
+        if not sentence.endswith(('.', '?', '!')):
+            sentence += '.'
+        sentence = _restore(sentence, phrases)
+        sentences.append((sentence, score_sentence(sentence)))
+
+    # Highest-scoring sentences first (stable, so ties keep transcript order)
+    sentences.sort(key=lambda item: item[1], reverse=True)
+
+    paragraphs = []
+    current_paragraph = []
+    for sentence, _ in sentences:
+        current_paragraph.append(sentence)
+        if len(sentence) > 100 or _TOPIC_BREAK.search(sentence):
+            paragraphs.append(' '.join(current_paragraph))
+            current_paragraph = []
+    if current_paragraph:
+        paragraphs.append(' '.join(current_paragraph))
+
+    cleaned_text = '\n\n'.join(paragraphs)
+
+    # If filtering removed almost everything, fall back to the lightly cleaned text
+    if len(cleaned_text) < 100 and len(marked) > 500:
+        simple_cleaned = _WHITESPACE.sub(' ', _FALLBACK_MARKERS.sub('', marked))
+        return _restore(simple_cleaned, [match.group(0).lower() for match in phrase_matches]).strip()
+
+    return cleaned_text.strip()
+
+
+def clean_text(text: str) -> str:
+    """
+    Clean a formatted transcript (``[Minute N]`` / ``[mm:ss]`` lines) for study material generation
+
+    Returns an empty string for empty or trivially short input.
+    """
+    if not text or len(text.strip()) < 10:
+        return ""
+    return _clean_lines(text.split('\n'))
+
+
+def clean_segments(segments: Iterable[str]) -> str:
+    """
+    Clean a stream of transcript segment texts without building the formatted transcript
+
+    Each segment is treated as one transcript line.
+    """
+    lines = [segment for segment in segments if segment]
+    if sum(len(line.strip()) for line in lines) < 10:
+        return ""
+    return _clean_lines(lines)
+
+
+def benchmark(duration_minutes: int = 180, repeat: int = 3) -> dict:
+    """Measure clean_text throughput on a synthetic lecture with one segment every 4 seconds"""
+    sentences = [
+        "A cache line is the unit of transfer between memory and the cache",
+        "The Write-Back Policy refers to delaying writes until the line is evicted",
+        "So basically we will see how this works in practice today",
+        "There are three types of misses called compulsory, capacity and conflict misses",
+        "Please submit the homework before the deadline",
+        "The MESI protocol keeps every processor's view of memory consistent",
+        "Um you can see it here on the screen and we will click through it",
+        "Spatial locality means nearby addresses are likely to be accessed soon",
+    ]
+    lines = []
+    for i in range(duration_minutes * 15):
+        seconds = i * 4
+        if seconds % 60 == 0:
+            lines.extend(["", f"[Minute {seconds // 60}]", ""])
+        lines.append(f"[{seconds // 60:02d}:{seconds % 60:02d}] {sentences[i % len(sentences)]}.")
+    text = "\n".join(lines)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clean_text(text)
+        best = min(best, time.perf_counter() - start)
+
+    size_mb = len(text.encode("utf-8")) / 1_000_000
+    return {"bytes": len(text.encode("utf-8")), "seconds": best, "mb_per_second": size_mb / best}
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 3-hour lecture: {report['bytes'] / 1024:.1f} KiB cleaned in "
+          f"{report['seconds'] * 1000:.1f} ms ({report['mb_per_second']:.2f} MB/s)")
@@ -0,0 +1,253 @@
+"""
+Compact columnar storage format for Zoom transcript segments.
+
+Transcripts used to be stored as a JSONB list of
+``{timestamp_seconds, timestamp, text}`` dicts plus a second copy of the same
+content in ``formatted_text``. The packed format keeps one text blob and two
+parallel integer arrays instead:
+
+    {
+        "format": "columnar-v1",
+        "t": [0, 4, 3, ...],        # timestamp_seconds, delta encoded
+        "o": [12, 40, 71, ...],     # end offset of each segment in the blob
+        "text": "first segmentsecond segment..."
+    }
+
+When compression is requested the blob is stored as base64 zlib data under
+``"z"`` instead of ``"text"``. The ``timestamp`` strings and the
+``[Minute N]`` formatted text are derived on demand, so they are never stored.
+
+Every reader should go through ``decode_transcript`` / ``format_transcript``,
+which accept both the packed dict and the legacy list-of-dicts format.
+
+The backend packs and the RAG service unpacks, so ``backend/transcript_codec.py``
+and ``summarization/transcript_codec.py`` must be the same file
+(``backend/test_shared_modules.py`` checks it).
+"""
+
+import base64
+import json
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Tuple
+
+PACKED_FORMAT = "columnar-v1"
+
+_TIMESTAMP_PATTERN = re.compile(r'^(?:(\d+):)?(\d+):(\d+)$')
+
+
+def format_timestamp(seconds: int) -> str:
+    """Format seconds as the mm:ss string used in transcripts."""
+    return f"{seconds//60:02d}:{seconds%60:02d}"
+
+
+def parse_timestamp(value: Any) -> int:
+    """Parse an ``mm:ss`` or ``hh:mm:ss`` string into seconds (0 if unparseable)."""
+    if not isinstance(value, str):
+        return 0
+    match = _TIMESTAMP_PATTERN.match(value.strip())
+    if not match:
+        return 0
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def is_packed(data: Any) -> bool:
+    """Return True if data is a transcript in the packed columnar format."""
+    return isinstance(data, dict) and data.get("format") == PACKED_FORMAT
+
+
+def _segment_seconds(item: Dict[str, Any]) -> int:
+    seconds = item.get("timestamp_seconds")
+    if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+        return max(0, int(seconds))
+    if isinstance(seconds, str) and seconds.isdigit():
+        return int(seconds)
+    return parse_timestamp(item.get("timestamp"))
+
+
+def encode_transcript(segments: List[Any], compress: bool = False) -> Dict[str, Any]:
+    """
+    Pack transcript segments into the columnar format
+
+    Args:
+        segments: List of segment dicts (``timestamp_seconds``/``timestamp``/``text``).
+            Non-dict items are stored as text with a zero timestamp.
+        compress: Store the text blob as base64 zlib data
+
+    Returns:
+        JSON-serializable dict suitable for the ``transcript_data`` JSONB column
+    """
+    deltas = []
+    offsets = []
+    parts = []
+    previous = 0
+    end = 0
+
+    for item in segments or []:
+        if isinstance(item, dict):
+            seconds = _segment_seconds(item)
+            text = item.get("text", "")
+            text = text if isinstance(text, str) else str(text)
+        else:
+            seconds = 0
+            text = str(item)
+
+        deltas.append(seconds - previous)
+        previous = seconds
+        end += len(text)
+        offsets.append(end)
+        parts.append(text)
+
+    packed = {"format": PACKED_FORMAT, "t": deltas, "o": offsets}
+    blob = "".join(parts)
+    if compress:
+        packed["z"] = base64.b64encode(zlib.compress(blob.encode("utf-8"), 6)).decode("ascii")
+    else:
+        packed["text"] = blob
+    return packed
+
+
+def _packed_blob(packed: Dict[str, Any]) -> str:
+    if "z" in packed:
+        return zlib.decompress(base64.b64decode(packed["z"])).decode("utf-8")
+    return packed.get("text", "")
+
+
+def iter_segments(data: Any) -> Iterator[Tuple[int, str]]:
+    """
+    Iterate over ``(timestamp_seconds, text)`` pairs of a transcript
+
+    Args:
+        data: Packed transcript, legacy list of segment dicts, or a JSON string of either
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return
+
+    if is_packed(data):
+        blob = _packed_blob(data)
+        seconds = 0
+        start = 0
+        for delta, end in zip(data.get("t", []), data.get("o", [])):
+            seconds += delta
+            yield seconds, blob[start:end]
+            start = end
+        return
+
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                text = item.get("text", "")
+                yield _segment_seconds(item), text if isinstance(text, str) else str(text)
+            elif item is not None:
+                yield 0, str(item)
+
+
+def decode_transcript(data: Any) -> List[Dict[str, Any]]:
+    """
+    Expand a transcript into the legacy list-of-dicts representation
+
+    Args:
+        data: Packed transcript, legacy list of segment dicts, or a JSON string of either
+
+    Returns:
+        List of ``{timestamp_seconds, timestamp, text}`` dicts
+    """
+    return [
+        {"timestamp_seconds": seconds, "timestamp": format_timestamp(seconds), "text": text}
+        for seconds, text in iter_segments(data)
+    ]
+
+
+def format_transcript(data: Any) -> str:
+    """
+    Build the ``[Minute N]`` / ``[mm:ss]`` formatted transcript text on demand
+
+    Produces the same output the scraper used to store in ``formatted_text``.
+    Returns an empty string when there are no segments.
+    """
+    current_minute = -1
+    lines = []
+
+    for seconds, text in iter_segments(data):
+        minute = seconds // 60
+        if minute != current_minute:
+            current_minute = minute
+            lines.extend(["", f"[Minute {minute}]", ""])
+        lines.append(f"[{format_timestamp(seconds)}] {text}")
+
+    return "\n".join(lines).strip()
+
+
+def transcript_text(data: Any) -> str:
+    """Return the plain transcript text, one segment per line, without markers."""
+    return "\n".join(text for _, text in iter_segments(data))
+
+
+def segment_count(data: Any) -> int:
+    """Count the segments of a transcript without expanding it."""
+    if is_packed(data):
+        return len(data.get("o", []))
+    if isinstance(data, list):
+        return len(data)
+    return sum(1 for _ in iter_segments(data))
+
+
+def benchmark(duration_minutes: int = 180, segment_seconds: int = 4, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Compare storage size and parse time of the legacy and packed formats
+
+    A synthetic lecture is generated with one segment every ``segment_seconds``.
+    Sizes are measured on the serialized JSON payload sent to Supabase
+    (legacy: ``transcript_data`` + ``formatted_text``), parse time covers
+    ``json.loads`` plus producing the formatted text.
+    """
+    words = ("cache block associativity replacement policy memory address tag offset "
+             "coherence snooping modified shared invalid processor core bus").split()
+    segments = []
+    for i in range(duration_minutes * 60 // segment_seconds):
+        seconds = i * segment_seconds
+        text = " ".join(words[(i + j) % len(words)] for j in range(8 + i % 7))
+        segments.append({"timestamp_seconds": seconds, "timestamp": format_timestamp(seconds), "text": text})
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    legacy_payload = json.dumps({"transcript_data": segments, "formatted_text": format_transcript(segments)})
+    results = {
+        "segments": len(segments),
+        "legacy": {
+            "bytes": len(legacy_payload.encode("utf-8")),
+            "parse_seconds": timed(lambda: json.loads(legacy_payload)["formatted_text"]),
+        },
+    }
+
+    for name, compress in (("packed", False), ("packed_zlib", True)):
+        payload = json.dumps({"transcript_data": encode_transcript(segments, compress=compress)})
+        results[name] = {
+            "bytes": len(payload.encode("utf-8")),
+            "encode_seconds": timed(lambda: encode_transcript(segments, compress=compress)),
+            "parse_seconds": timed(lambda: format_transcript(json.loads(payload)["transcript_data"])),
+        }
+
+    return results
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 3-hour lecture: {report['segments']} segments")
+    for name in ("legacy", "packed", "packed_zlib"):
+        entry = report[name]
+        line = f"{name:12s} {entry['bytes'] / 1024:9.1f} KiB  parse {entry['parse_seconds'] * 1000:7.2f} ms"
+        if "encode_seconds" in entry:
+            line += f"  encode {entry['encode_seconds'] * 1000:7.2f} ms"
+        print(line)
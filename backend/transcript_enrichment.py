@@ -0,0 +1,212 @@
+"""
+Ingest-time enrichment of lecture transcripts.
+
+Transcripts never change after scraping, so the work the notecard and quiz
+generators used to repeat on every request is done once when a transcript is
+stored (``/zoom/store-transcript`` and the batch extractor):
+
+- ``cleaned_text``: transcript_cleaning output for the transcript segments
+- ``sentence_scores``: the highest scoring sentences of the cleaned text as
+  ``[sentence, score]`` pairs, best first
+- ``key_terms``: the candidate terms the fallback generators derive from the
+  cleaned text (``defined_terms``, ``potential_topics``, ``key_topics``)
+
+The values are stored in the matching ``zoom_transcripts`` columns together
+with ``enrichment_version``. Rows enriched by an older version (or not at all)
+are recomputed and written back the first time a generator reads them.
+"""
+
+import re
+import time
+from typing import Any, Dict, List
+
+from transcript_codec import iter_segments
+from transcript_cleaning import clean_segments, clean_text, score_sentence
+
+# Bump whenever the cleaning rules or the term extraction change
+ENRICHMENT_VERSION = 1
+
+ENRICHMENT_COLUMNS = "cleaned_text,sentence_scores,key_terms,enrichment_version"
+
+# Number of scored sentences kept per transcript
+MAX_SCORED_SENTENCES = 50
+
+_CAPITALIZED = re.compile(r'\b[A-Z][a-z]{2,}\b')
+_CAMEL_CASE = re.compile(r'\b[A-Za-z][a-z]{2,}(?:[A-Z][a-z]*)+\b')
+_JOINED = re.compile(r'\b[a-z]+[-_][a-z]+\b')  # hyphenated or underscored terms
+
+# Patterns like "X is defined as", "X refers to", "X is a", with the literal cue each needs
+DEFINITION_PATTERNS = [
+    ("is defined as", re.compile(r'([A-Za-z\s]{3,30})\s+is defined as\s+', re.IGNORECASE)),
+    ("refers to", re.compile(r'([A-Za-z\s]{3,30})\s+refers to\s+', re.IGNORECASE)),
+    ("is a", re.compile(r'([A-Za-z\s]{3,30})\s+is a\s+', re.IGNORECASE)),
+    ("means", re.compile(r'([A-Za-z\s]{3,30})\s+means\s+', re.IGNORECASE)),
+    ("is considered", re.compile(r'([A-Za-z\s]{3,30})\s+is considered\s+', re.IGNORECASE)),
+    ("the term", re.compile(r'the term\s+([A-Za-z\s]{3,30})', re.IGNORECASE)),
+]
+# Definition matches never cross a character outside [A-Za-z\s], so each pattern
+# only has to scan the runs of those characters that contain its cue
+_WORD_RUN = re.compile(r'[A-Za-z\s]+', re.IGNORECASE)
+
+COMMON_CAPITALIZED = {"The", "This", "That", "These", "Those", "There", "Their", "They", "When", "Where", "What"}
+COMMON_WORDS = {
+    "about", "these", "those", "their", "there", "would", "should",
+    "could", "which", "where", "when", "what", "that", "this", "because",
+    "they", "have", "been", "being", "other", "another"
+}
+
+# Educational concept categories detected in content
+TECH_SUBJECTS = {
+    "architecture": ["design", "pattern", "structure", "layer", "component", "architecture", "framework"],
+    "microservices": ["service", "api", "container", "docker", "orchestration", "choreography", "microservice"],
+    "database": ["data", "sql", "nosql", "schema", "query", "storage", "database", "table", "record"],
+    "software development": ["agile", "scrum", "sprint", "development", "coding", "programming", "software"],
+    "web technologies": ["http", "rest", "api", "client", "server", "request", "response", "web", "frontend"],
+    "algorithms": ["algorithm", "complexity", "sorting", "searching", "optimization", "efficient"],
+    "artificial intelligence": ["ai", "machine learning", "neural", "deep learning", "model", "training"],
+    "mathematics": ["equation", "formula", "calculation", "theorem", "proof", "mathematical"],
+    "biology": ["cell", "organism", "species", "gene", "protein", "dna", "biological"],
+    "chemistry": ["reaction", "molecule", "compound", "element", "bond", "atomic"],
+    "physics": ["force", "energy", "motion", "particle", "quantum", "relativity"],
+    "economics": ["market", "supply", "demand", "price", "economic", "inflation", "fiscal"]
+}
+
+
+def fallback_paragraphs(content: str) -> List[str]:
+    """Split generation content into the paragraphs the fallback generators work on."""
+    paragraphs = [p for p in content.split("\n\n") if len(p) > 30]  # Filter out tiny paragraphs
+    if not paragraphs:
+        # If no good paragraphs, split by newlines
+        paragraphs = [p for p in content.split("\n") if len(p) > 30]
+    if not paragraphs:
+        # If still no good paragraphs, use the whole content as one paragraph
+        paragraphs = [content]
+    return paragraphs
+
+
+def extract_key_terms(paragraphs: List[str]) -> Dict[str, List[str]]:
+    """
+    Find the candidate terms and topics of a lecture
+
+    Args:
+        paragraphs: Paragraphs from ``fallback_paragraphs``
+
+    Returns:
+        Dict with ``defined_terms`` (terms followed by a definition cue, in
+        order), ``potential_topics`` (up to 20 unique terms, defined terms
+        first) and ``key_topics`` (detected subject areas, or the top specific
+        terms if none were detected)
+    """
+    all_text = " ".join(paragraphs)
+
+    capitalized_terms = [term for term in _CAPITALIZED.findall(all_text)
+                         if len(term) > 3 and term not in COMMON_CAPITALIZED]
+    technical_terms = _CAMEL_CASE.findall(all_text) + _JOINED.findall(all_text)
+
+    runs = [(run, run.casefold()) for run in _WORD_RUN.findall(all_text)]
+    defined_terms = []
+    for cue, pattern in DEFINITION_PATTERNS:
+        for run, folded in runs:
+            if cue in folded:
+                defined_terms.extend(term.strip() for term in pattern.findall(run) if len(term.strip()) > 3)
+
+    # Count word frequency for additional domain-specific terms
+    word_freq = {}
+    for word in all_text.split():
+        word = word.strip(".,;:()[]{}").lower()
+        if len(word) > 5 and word not in COMMON_WORDS:
+            word_freq[word] = word_freq.get(word, 0) + 1
+    frequent_terms = [w for w, c in sorted(word_freq.items(), key=lambda x: x[1], reverse=True) if c > 1][:15]
+
+    # Combine all discovered terms, prioritizing defined terms
+    potential_topics = list(dict.fromkeys(defined_terms + capitalized_terms + technical_terms + frequent_terms))
+    potential_topics = [t for t in potential_topics if len(t) > 3][:20]
+
+    lowered = all_text.lower()
+    key_topics = [
+        topic for topic, related_terms in TECH_SUBJECTS.items()
+        if sum(1 for term in related_terms if term in lowered) >= 2  # At least 2 related terms should appear
+    ]
+    if not key_topics and potential_topics:
+        key_topics = potential_topics[:3]
+
+    return {
+        "defined_terms": defined_terms,
+        "potential_topics": potential_topics,
+        "key_topics": key_topics
+    }
+
+
+def score_sentences(paragraphs: List[str], limit: int = MAX_SCORED_SENTENCES) -> List[List[Any]]:
+    """Return the best ``[sentence, score]`` pairs of the paragraphs, best first."""
+    scored = {}
+    for paragraph in paragraphs:
+        for sentence in paragraph.split('.'):
+            sentence = sentence.strip()
+            if len(sentence) > 30 and sentence + '.' not in scored:
+                scored[sentence + '.'] = score_sentence(sentence)
+    ranked = sorted(scored.items(), key=lambda item: item[1], reverse=True)
+    return [[sentence, score] for sentence, score in ranked[:limit]]
+
+
+def enrich_text(cleaned_text: str) -> Dict[str, Any]:
+    """Build the enrichment columns for already cleaned transcript text."""
+    paragraphs = fallback_paragraphs(cleaned_text) if cleaned_text else []
+    return {
+        "cleaned_text": cleaned_text,
+        "sentence_scores": score_sentences(paragraphs),
+        "key_terms": extract_key_terms(paragraphs) if paragraphs else {
+            "defined_terms": [], "potential_topics": [], "key_topics": []
+        },
+        "enrichment_version": ENRICHMENT_VERSION
+    }
+
+
+def enrich_transcript(transcript_data: Any = None, formatted_text: str = "") -> Dict[str, Any]:
+    """
+    Compute the enrichment columns for a transcript
+
+    Args:
+        transcript_data: Packed or legacy transcript segments
+        formatted_text: Formatted transcript, used only when there are no segments
+
+    Returns:
+        Dict with ``cleaned_text``, ``sentence_scores``, ``key_terms`` and
+        ``enrichment_version``, ready to be stored on the ``zoom_transcripts`` row
+    """
+    texts = [text for _, text in iter_segments(transcript_data)]
+    cleaned_text = clean_segments(texts) if texts else clean_text(formatted_text or "")
+    return enrich_text(cleaned_text)
+
+
+def is_enriched(row: Dict[str, Any]) -> bool:
+    """Return True if a transcript row carries enrichment from the current version."""
+    return row.get("enrichment_version") == ENRICHMENT_VERSION and row.get("cleaned_text") is not None
+
+
+def benchmark(duration_minutes: int = 180, repeat: int = 3) -> Dict[str, float]:
+    """Time enrichment of a synthetic lecture (one segment every 4 seconds) against reading stored results"""
+    sentences = [
+        "A cache line is defined as the unit of transfer between memory and the cache.",
+        "The Write-Back Policy refers to delaying writes until the line is evicted.",
+        "So basically we will see how this works in practice today.",
+        "The MESI protocol keeps every processor's view of memory consistent.",
+        "Spatial locality means nearby addresses are likely to be accessed soon.",
+    ]
+    segments = [{"timestamp_seconds": i * 4, "text": sentences[i % len(sentences)]}
+                for i in range(duration_minutes * 15)]
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        enrichment = enrich_transcript(segments)
+        best = min(best, time.perf_counter() - start)
+
+    return {"segments": len(segments), "enrich_seconds": best, "cleaned_chars": len(enrichment["cleaned_text"])}
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"Synthetic 3-hour lecture: {report['segments']} segments enriched in "
+          f"{report['enrich_seconds'] * 1000:.1f} ms ({report['cleaned_chars']} cleaned chars); "
+          f"generation now reads the stored columns instead")
@@ -13,6 +13,8 @@ from functools import wraps
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from transcript_codec import format_timestamp, format_transcript
+
 # Set up logging with a more efficient configuration
 logging.basicConfig(
     level=logging.INFO,
@@ -111,7 +113,7 @@ class ZoomTranscriptScraper:
 
     def format_timestamp(self, seconds: int) -> str:
         """Fast timestamp formatting."""
-        return f"{seconds//60:02d}:{seconds%60:02d}"
+        return format_timestamp(seconds)
 
     def clean_and_format_transcript(self, items: List[object]) -> List[Dict]:
         """Optimized transcript cleaning with parallel processing."""
@@ -166,21 +168,11 @@ class ZoomTranscriptScraper:
         return cleaned_data
 
     def format_for_llm(self, data: List[Dict]) -> str:
-        """Fast transcript formatting."""
+        """Fast transcript formatting (see transcript_codec.format_transcript)."""
         if not data:
             return "No transcript data available."
 
-        current_minute = -1
-        lines = []
-        
-        for entry in data:
-            minute = entry['timestamp_seconds'] // 60
-            if minute != current_minute:
-                current_minute = minute
-                lines.extend(["", f"[Minute {minute}]", ""])
-            lines.append(f"[{entry['timestamp']}] {entry['text']}")
-
-        return "\n".join(lines).strip()
+        return format_transcript(data)
 
     def scrape_transcript(self, url: str) -> Dict:
         """Optimized transcript scraping that returns data instead of saving to files."""
@@ -936,6 +936,22 @@ function injectRecordingScraper(tabId) {
     });
 }
 
+// Serialize a JSON request body, gzip-compressing it when large enough
+// (same as ApiUtils.encodeJsonBody in config.js, which this script can't import)
+async function encodeJsonBody(data, minBytes = 1024) {
+    const json = JSON.stringify(data);
+    const headers = { 'Content-Type': 'application/json' };
+    
+    if (json.length < minBytes || typeof CompressionStream === 'undefined') {
+        return { body: json, headers };
+    }
+    
+    const stream = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+    const body = await new Response(stream).arrayBuffer();
+    headers['Content-Encoding'] = 'gzip';
+    return { body, headers };
+}
+
 // Add a debug log function that helps track script execution
 function debugLog(context, message, data = null) {
     const timestamp = new Date().toISOString();
@@ -1421,14 +1437,15 @@ function directUploadRecordings(recordings, token, courseId) {
                                         url: recording.url
                                     };
                                     
-                                    // Submit transcript
+                                    // Submit transcript (gzip-compressed when large)
+                                    const encoded = await encodeJsonBody(transcriptData);
                                     const transcriptResponse = await fetch(`${apiBaseUrl}/zoom/store-transcript`, {
                                         method: 'POST',
                                         headers: {
-                                            'Content-Type': 'application/json',
+                                            ...encoded.headers,
                                             'Authorization': `Bearer ${token}`
                                         },
-                                        body: JSON.stringify(transcriptData)
+                                        body: encoded.body
                                     });
                                     
                                     if (transcriptResponse.ok) {
@@ -12,6 +12,9 @@ const CONFIG = {
         ME: "/auth/me"
     },
     
+    // Request bodies larger than this (bytes) are sent gzip-compressed
+    COMPRESSION_MIN_BYTES: 1024,
+    
     // Storage keys
     STORAGE: {
         AUTH_TOKEN: "facilitator_auth_token",
@@ -68,6 +71,21 @@ const AuthUtils = {
 
 // API helper functions
 const ApiUtils = {
+    // Serialize a JSON request body, gzip-compressing it when large enough
+    encodeJsonBody: async (data) => {
+        const json = JSON.stringify(data);
+        const headers = { 'Content-Type': 'application/json' };
+        
+        if (json.length < CONFIG.COMPRESSION_MIN_BYTES || typeof CompressionStream === 'undefined') {
+            return { body: json, headers };
+        }
+        
+        const stream = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+        const body = await new Response(stream).arrayBuffer();
+        headers['Content-Encoding'] = 'gzip';
+        return { body, headers };
+    },
+    
     // Make authenticated API request
     authenticatedRequest: async (endpoint, method = 'GET', data = null) => {
         const token = await AuthUtils.getAuthToken();
@@ -85,7 +103,9 @@ const ApiUtils = {
         };
         
         if (data && (method === 'POST' || method === 'PUT')) {
-            options.body = JSON.stringify(data);
+            const { body, headers } = await ApiUtils.encodeJsonBody(data);
+            options.body = body;
+            Object.assign(options.headers, headers);
         }
         
         try {
@@ -14,6 +14,22 @@ if (typeof window.recordingScraperLoaded === 'undefined') {
     let scrapedRecordings = [];
     let shouldAutoUpload = false; // New flag to control automatic upload
 
+    // Serialize a JSON request body, gzip-compressing it when large enough
+    // (same as ApiUtils.encodeJsonBody in config.js, which content scripts can't import)
+    async function encodeJsonBody(data, minBytes = 1024) {
+        const json = JSON.stringify(data);
+        const headers = { 'Content-Type': 'application/json' };
+        
+        if (json.length < minBytes || typeof CompressionStream === 'undefined') {
+            return { body: json, headers };
+        }
+        
+        const stream = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+        const body = await new Response(stream).arrayBuffer();
+        headers['Content-Encoding'] = 'gzip';
+        return { body, headers };
+    }
+
     // Function to get selected course ID from URL
     function getSelectedCourseId() {
         const match = window.location.hash.match(/course=course_(\d+)/);
@@ -516,13 +532,14 @@ if (typeof window.recordingScraperLoaded === 'undefined') {
                                                     
                                                     // Submit transcript to backend
                                                     try {
+                                                        const encoded = await encodeJsonBody(transcriptPayload);
                                                         const transcriptResponse = await fetch(`${apiBaseUrl}/zoom/store-transcript`, {
                                                             method: 'POST',
                                                             headers: {
-                                                                'Content-Type': 'application/json',
+                                                                ...encoded.headers,
                                                                 'Authorization': `Bearer ${token}`
                                                             },
-                                                            body: JSON.stringify(transcriptPayload)
+                                                            body: encoded.body
                                                         });
                                                         
                                                         const transcriptResponseText = await transcriptResponse.text();
@@ -1,18 +1,27 @@
 #app.py
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional, Set
+from typing import List, Dict, Any, Optional, Set, Tuple, Union
 import uuid
 import time
 import os
 import json
 import traceback
+import logging
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from supabase_client import SupabaseClient
+from supabase_client import SupabaseClient, COUNT_METHODS, DEFAULT_PAGE_SIZE, TRANSCRIPT_CONTENT_COLUMNS, ASSIGNMENT_CONTENT_COLUMNS
 from auth_middleware import get_current_user
+from http_compression import CompressionMiddleware
+from metrics import MetricsMiddleware, metrics_response
+from tracing import TracingMiddleware, bind, set_service, span
+from transcript_codec import is_packed, format_transcript
+from llm_output_parser import json_format_instructions, parse_notecards, parse_quiz, parse_stats
 
 # Initialize Supabase client
 supabase_client = SupabaseClient()
@@ -24,7 +33,7 @@ from logging_config import setup_logging
 logger = setup_logging("rag_api")
 
 # Import our RAG implementation
-from rag_system import RAGSystem
+from rag_system import RAGSystem, STAGE_SECONDS, close_embeddings, document_index_stats, embedding_stats, local_embedder
 
 # Initialize the app
 app = FastAPI(
@@ -35,6 +44,14 @@ app = FastAPI(
 
 logger.info("Starting RAG API Service")
 
+# A trace span per request, continuing the caller's traceparent / X-Request-ID (added first, so it
+# runs inside the others and sees the matched route)
+set_service("rag-api")
+app.add_middleware(TracingMiddleware)
+
+# Request count and latency per route for GET /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Add CORS middleware for browser access
 app.add_middleware(
     CORSMiddleware,
@@ -44,11 +61,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Accept gzip/zstd request bodies (backend RAG client) and compress large responses
+app.add_middleware(CompressionMiddleware)
+
+FETCH_SECONDS = STAGE_SECONDS.labels("fetch")
+
 # Initialize RAG system
 logger.info("Initializing RAG system")
 rag_system = RAGSystem()
 logger.info("RAG system initialized")
 
+@app.on_event("startup")
+async def start_embedding_model():
+    """Load the local embedding model (worker processes) without delaying startup"""
+    threading.Thread(target=local_embedder, name="embedding-startup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def stop_embedding_service():
+    """Stop the embedding worker processes"""
+    close_embeddings()
+
 # Pydantic models for request/response validation
 class DocumentRequest(BaseModel):
     content: str
@@ -63,95 +95,173 @@ class DocumentResponse(BaseModel):
     created_at: str
 
 class QueryRequest(BaseModel):
-    query: str
+    query: str  # retrieval query; also the question when no instructions are given
     document_ids: List[str] = Field(default_factory=list)
     document_types: Optional[List[str]] = None
     exclude_ids: Optional[List[str]] = None
-    top_k: int = 5
+    top_k: Optional[int] = None  # cap on context chunks; by default the context fills the model's token budget
     model: str = "meta-llama/llama-3-8b-instruct"
+    max_tokens: Optional[int] = None  # response length limit; packed multi-source prompts need more
+    instructions: Optional[str] = None  # task prompt sent instead of the query, context at "{context}"
+    content: Optional[str] = None  # inline document text, used with any document_ids
+    sources: Optional[Dict[str, str]] = None  # inline texts by source id, one context section each
+    fetch_timeout_seconds: Optional[float] = None  # limit on fetching the documents (default DOCUMENT_FETCH_TIMEOUT_SECONDS)
 
 class QueryResponse(BaseModel):
     query: str
     response: str
     retrieved_chunks: List[str] = Field(default_factory=list)
+    chunk_sources: List[Dict[str, Any]] = Field(default_factory=list)  # source id and character offsets per retrieved chunk
     processing_time: float
     document_count: int
     success: bool
     error: Optional[str] = None
+    token_usage: Optional[Dict[str, int]] = None
+    retrieval: Optional[str] = None  # "full", "hybrid", "vector", or "bm25" when embeddings are unavailable
+    degraded: bool = False
+    timings: Optional[Dict[str, float]] = None  # seconds per stage: fetch, chunking, embedding, retrieval, response, total
+    timestamp: str
+
+class BatchQuery(BaseModel):
+    query: str
+    top_k: Optional[int] = None
+    max_tokens: Optional[int] = None
+    instructions: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQuery]  # answered over the same documents
+    document_ids: List[str] = Field(default_factory=list)
+    document_types: Optional[List[str]] = None
+    exclude_ids: Optional[List[str]] = None
+    model: str = "meta-llama/llama-3-8b-instruct"
+    content: Optional[str] = None
+    sources: Optional[Dict[str, str]] = None
+    stream: bool = False  # one JSON line per query as it finishes, with its "index"
+    fetch_timeout_seconds: Optional[float] = None  # limit on fetching the documents
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+    processing_time: float
+    document_count: int
     timestamp: str
 
 # Database helper functions
 def get_document(document_id: str):
-    """Get a document from Supabase by ID, checking relevant tables (transcripts and assignments)"""
+    """Get a document from Supabase by ID, resolving its table through the document catalog"""
     logger.debug(f"Fetching document: {document_id}")
     try:
-        # Check transcripts table
-        transcript_response = supabase_client.client.table('zoom_transcripts').select('*').eq('id', document_id).execute()
-        if transcript_response.data and len(transcript_response.data) > 0:
-            data = transcript_response.data[0]
-            
-            # Format transcript data - handle both JSON and string formats
-            transcript_content = ""
-            if data.get("transcript_data"):
-                if isinstance(data["transcript_data"], dict):
-                    # If it's already a dictionary (parsed JSON)
-                    transcript_content = json.dumps(data["transcript_data"])
-                elif isinstance(data["transcript_data"], str):
-                    # If it's a string, use it directly
-                    transcript_content = data["transcript_data"]
-                else:
-                    # Try to convert to string
-                    transcript_content = str(data["transcript_data"])
-            
-            # Use formatted_text if available and transcript_data is empty/None
-            if not transcript_content and data.get("formatted_text"):
-                transcript_content = data["formatted_text"]
-            
-            return {
-                "id": data["id"],
-                "title": f"Transcript {data.get('recording_id', '')[:8] if data.get('recording_id') else ''}",
-                "document_type": "transcript",
-                "content": transcript_content,
-                "content_length": len(transcript_content),
-                "created_at": data.get("created_at", datetime.now().isoformat())
-            }
+        entry = supabase_client.lookup_document(document_id)
+        if not entry:
+            logger.warning(f"Document not found: {document_id}")
+            return None
         
-        # Try assignments
-        assignment_response = supabase_client.client.table('assignments').select('*').eq('id', document_id).execute()
-        if assignment_response.data and len(assignment_response.data) > 0:
-            data = assignment_response.data[0]
-            
-            # Get the description content
-            description_content = data.get("description", "")
-            
-            # If description is empty, create a summary from other fields
-            if not description_content:
-                description_content = f"Assignment title: {data.get('title', '')}\n"
-                description_content += f"Points: {data.get('points', '0')}\n"
-                description_content += f"Due date: {data.get('due_date', 'Not specified')}\n"
-                description_content += f"Status: {data.get('status', 'Not specified')}\n"
-            
-            return {
-                "id": data["id"],
-                "title": data.get("title", ""),
-                "document_type": "assignment",
-                "content": description_content,
-                "content_length": len(description_content),
-                "course_id": data.get("course_id"),
-                "points": data.get("points"),
-                "due_date": data.get("due_date"),
-                "status": data.get("status"),
-                "created_at": data.get("created_at", datetime.now().isoformat())
-            }
-                
-        logger.warning(f"Document not found: {document_id}")
-        return None
+        response = supabase_client.client.table(entry["source_table"]).select('*').eq('id', document_id).execute()
+        if not response.data:
+            # Catalog cache entry outlived the row (deleted by another service)
+            supabase_client.forget_document(document_id)
+            logger.warning(f"Document not found: {document_id}")
+            return None
+        return build_document(entry, response.data[0])
         
     except Exception as e:
         logger.error(f"Error fetching document {document_id}: {e}")
         logger.debug(traceback.format_exc())
         return None
 
+def build_document(entry: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Document dict of a transcript or assignment row, given its catalog entry"""
+    if entry["document_type"] == "transcript":
+        # Use stored formatted_text if present, otherwise build it from transcript_data
+        transcript_content = data.get("formatted_text") or extract_transcript_content(data.get("transcript_data"))
+        
+        return {
+            "id": data["id"],
+            "title": f"Transcript {data.get('recording_id', '')[:8] if data.get('recording_id') else ''}",
+            "document_type": "transcript",
+            "content": transcript_content,
+            "content_length": len(transcript_content),
+            "content_hash": entry.get("content_hash"),
+            "user_id": data.get("user_id"),
+            "created_at": data.get("created_at", datetime.now().isoformat())
+        }
+    
+    # Get the description content
+    description_content = data.get("description", "")
+    
+    # If description is empty, create a summary from other fields
+    if not description_content:
+        description_content = f"Assignment title: {data.get('title', '')}\n"
+        description_content += f"Points: {data.get('points', '0')}\n"
+        description_content += f"Due date: {data.get('due_date', 'Not specified')}\n"
+        description_content += f"Status: {data.get('status', 'Not specified')}\n"
+    
+    return {
+        "id": data["id"],
+        "title": data.get("title", ""),
+        "document_type": "assignment",
+        "content": description_content,
+        "content_length": len(description_content),
+        "content_hash": entry.get("content_hash"),
+        "user_id": data.get("user_id"),
+        "course_id": data.get("course_id"),
+        "points": data.get("points"),
+        "due_date": data.get("due_date"),
+        "status": data.get("status"),
+        "created_at": data.get("created_at", datetime.now().isoformat())
+    }
+
+# Columns each table's rows need for build_document
+DOCUMENT_CONTENT_COLUMNS = {"zoom_transcripts": TRANSCRIPT_CONTENT_COLUMNS, "assignments": ASSIGNMENT_CONTENT_COLUMNS}
+# Seconds a query may spend fetching its documents when it sets no fetch timeout of its own
+# (embedding and the LLM call are bounded by their own retries and timeouts)
+DOCUMENT_FETCH_TIMEOUT_SECONDS = float(os.getenv("DOCUMENT_FETCH_TIMEOUT_SECONDS", "60"))
+document_fetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="document-fetch")
+
+def fetch_documents(document_ids: List[str], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch several documents: a catalog lookup, then ``in_`` queries per table, run concurrently
+    
+    Args:
+        document_ids: Document IDs, in the order the documents are returned
+        deadline: time.monotonic() value by which the fetch must finish
+    
+    Returns:
+        The documents found (missing IDs are logged and skipped)
+    
+    Raises:
+        TimeoutError: if the deadline passes before the tables answer
+    """
+    entries = supabase_client.lookup_documents(document_ids)
+    by_table: Dict[str, List[str]] = {}
+    for document_id, entry in entries.items():
+        by_table.setdefault(entry["source_table"], []).append(document_id)
+    
+    futures = {document_fetch_executor.submit(bind(supabase_client.get_rows), table, ids,
+                                              DOCUMENT_CONTENT_COLUMNS.get(table, '*')): table
+               for table, ids in by_table.items()}
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    done, pending = wait(futures, timeout=timeout)
+    if pending:
+        for future in pending:
+            future.cancel()
+        raise TimeoutError(f"Document fetch exceeded its timeout ({', '.join(futures[f] for f in pending)} pending)")
+    rows: Dict[str, Dict[str, Any]] = {}
+    for future in done:
+        rows.update(future.result())
+    
+    documents = []
+    for document_id in document_ids:
+        if document_id not in rows:
+            if document_id in entries:
+                # Catalog cache entry outlived the row (deleted by another service)
+                supabase_client.forget_document(document_id)
+            logger.warning(f"Document not found: {document_id}")
+            continue
+        document = build_document(entries[document_id], rows[document_id])
+        logger.debug("Document found: %s, length: %d chars", document_id, len(document["content"]))
+        documents.append(document)
+    return documents
+
 def get_documents(document_types: Optional[Set[str]] = None, exclude_ids: Optional[Set[str]] = None):
     """
     Get all documents from Supabase
@@ -172,24 +282,12 @@ def get_documents(document_types: Optional[Set[str]] = None, exclude_ids: Option
         if exclude_ids is None:
             exclude_ids = set()
         
-        # Get transcripts if requested
+        # Get transcripts if requested (paged, only the columns needed for content)
         if "transcript" in document_types:
-            transcripts = supabase_client.get_transcripts()
-            for transcript in transcripts:
+            for transcript in supabase_client.iter_transcripts(columns=TRANSCRIPT_CONTENT_COLUMNS):
                 if transcript["id"] not in exclude_ids:
-                    # Format transcript data
-                    transcript_content = ""
-                    if transcript.get("transcript_data"):
-                        if isinstance(transcript["transcript_data"], dict):
-                            transcript_content = json.dumps(transcript["transcript_data"])
-                        elif isinstance(transcript["transcript_data"], str):
-                            transcript_content = transcript["transcript_data"]
-                        else:
-                            transcript_content = str(transcript["transcript_data"])
-                    
-                    # Use formatted_text if available and transcript_data is empty/None
-                    if not transcript_content and transcript.get("formatted_text"):
-                        transcript_content = transcript["formatted_text"]
+                    # Use stored formatted_text if present, otherwise build it from transcript_data
+                    transcript_content = transcript.get("formatted_text") or extract_transcript_content(transcript.get("transcript_data"))
                     
                     all_documents.append({
                         "id": transcript["id"],
@@ -205,10 +303,9 @@ def get_documents(document_types: Optional[Set[str]] = None, exclude_ids: Option
                         "created_at": transcript.get("created_at")
                     })
         
-        # Get assignments if requested
+        # Get assignments if requested (paged, only the columns needed for content)
         if "assignment" in document_types:
-            assignments = supabase_client.get_assignments()
-            for assignment in assignments:
+            for assignment in supabase_client.iter_assignments(columns=ASSIGNMENT_CONTENT_COLUMNS):
                 if assignment["id"] not in exclude_ids:
                     # Get the description content
                     description_content = assignment.get("description", "")
@@ -244,6 +341,25 @@ def get_documents(document_types: Optional[Set[str]] = None, exclude_ids: Option
         logger.debug(traceback.format_exc())
         return []
 
+def get_document_ids(document_types: Optional[Set[str]] = None, exclude_ids: Optional[Set[str]] = None) -> List[str]:
+    """
+    Get the IDs of all documents matching the filters without downloading their content
+    
+    Args:
+        document_types: Optional set of document types to include ("transcript", "assignment")
+        exclude_ids: Optional set of document IDs to exclude
+    """
+    document_types = document_types or {"transcript", "assignment"}
+    exclude_ids = exclude_ids or set()
+    
+    document_ids = []
+    if "transcript" in document_types:
+        document_ids.extend(row["id"] for row in supabase_client.iter_transcripts(columns="id"))
+    if "assignment" in document_types:
+        document_ids.extend(row["id"] for row in supabase_client.iter_assignments(columns="id"))
+    
+    return [document_id for document_id in document_ids if document_id not in exclude_ids]
+
 def extract_transcript_content(transcript_data):
     """
     Extract readable text content from transcript data, handling different formats
@@ -261,6 +377,10 @@ def extract_transcript_content(transcript_data):
     if isinstance(transcript_data, str):
         return transcript_data
     
+    # Columnar transcript (see transcript_codec): build the formatted text on demand
+    if is_packed(transcript_data):
+        return format_transcript(transcript_data)
+    
     # If it's a dictionary
     if isinstance(transcript_data, dict):
         # Try common transcript JSON formats
@@ -283,9 +403,9 @@ def extract_transcript_content(transcript_data):
     
     # If it's a list
     if isinstance(transcript_data, list):
-        # Try to extract text from each item if they're dictionaries
+        # Segment dicts from the scraper: format them the same way as packed transcripts
         if all(isinstance(item, dict) for item in transcript_data):
-            return "\n".join([item.get("text", "") for item in transcript_data if "text" in item])
+            return format_transcript(transcript_data)
         
         # Otherwise, just join the items as strings
         return "\n".join([str(item) for item in transcript_data])
@@ -421,15 +541,21 @@ async def supabase_auth_status(current_user: Optional[Dict] = Depends(get_curren
 async def root():
     """Root endpoint providing basic service information"""
     logger.debug("Root endpoint accessed")
-    embeddings_type = "local" if hasattr(rag_system, 'sentence_transformer') and rag_system.sentence_transformer else "openai"
     return {
         "message": "RAG API Service", 
         "status": "running",
         "version": "1.0.0",
         "docs": "/docs",
-        "embeddings": embeddings_type
+        "embeddings": embedding_stats(),
+        "query_embedding_cache": rag_system.query_cache_stats(),
+        "document_indexes": document_index_stats()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Pipeline stage latency, cache and fallback counters and requests in flight, in the Prometheus text format"""
+    return metrics_response()
+
 @app.post("/documents/upload")
 async def upload_document(
     file: UploadFile = File(...),
@@ -471,7 +597,8 @@ async def upload_document(
                 "id": document_id,
                 "user_id": user_id,
                 "transcript_data": text_content,
-                "formatted_text": text_content,
+                "formatted_text": "",  # Built on demand from transcript_data
+                "content_length": len(text_content),
                 "url": "",
                 "created_at": datetime.now().isoformat()
             }
@@ -499,6 +626,7 @@ async def upload_document(
         if not response.data:
             logger.error(f"Failed to insert document into {table_name}")
             raise HTTPException(status_code=500, detail=f"Failed to create document in {table_name}")
+        supabase_client.clear_count_cache()
             
         logger.info(f"File uploaded successfully: {file.filename}, document ID: {document_id}")
         return {
@@ -516,12 +644,39 @@ async def upload_document(
         logger.debug(f"Error traceback: {error_trace}")
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
+# Projections used by the document listing; content_length is stored server-side
+LIST_COLUMNS = {
+    "zoom_transcripts": "id,recording_id,content_length,created_at",
+    "assignments": "id,title,content_length,created_at",
+}
+
+def transcript_content_lengths(transcript_ids: List[str]) -> Dict[str, int]:
+    """Compute content lengths for transcripts stored before content_length was recorded"""
+    if not transcript_ids:
+        return {}
+    rows = supabase_client.client.table('zoom_transcripts').select('id,formatted_text,transcript_data').in_('id', transcript_ids).execute().data or []
+    return {
+        row["id"]: len(row.get("formatted_text") or extract_transcript_content(row.get("transcript_data")))
+        for row in rows
+    }
+
 @app.get("/documents", response_model=List[DocumentResponse])
-async def list_documents(document_type: Optional[str] = None, course_id: Optional[str] = None):
+async def list_documents(response: Response,
+                         document_type: Optional[str] = None,
+                         course_id: Optional[str] = None,
+                         limit: Optional[int] = None,
+                         cursor: Optional[str] = None):
     """
     List all documents stored in the system, optionally filtered by type and course
+    
+    Without ``limit`` every document is returned (fetched page by page). With
+    ``limit`` a single page is returned and the cursor for the next page, if
+    any, is sent in the ``X-Next-Cursor`` response header.
     """
-    logger.info(f"List documents endpoint called, type: {document_type}, course: {course_id}")
+    logger.info(f"List documents endpoint called, type: {document_type}, course: {course_id}, limit: {limit}, cursor: {cursor}")
+    
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
     
     try:
         all_documents = []
@@ -533,41 +688,97 @@ async def list_documents(document_type: Optional[str] = None, course_id: Optiona
         if document_type == "assignment" or document_type is None:
             tables_to_query.append("assignments")
         
-        # Query each table
+        # Cursors look like "<table>:<last id>"; skip tables already fully listed
+        table_cursor = None
+        if cursor:
+            cursor_table, _, table_cursor = cursor.partition(":")
+            if cursor_table not in tables_to_query:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            tables_to_query = tables_to_query[tables_to_query.index(cursor_table):]
+        
+        next_cursor = None
+        remaining = limit
+        
+        # Query each table page by page, selecting only the listed columns
         for table in tables_to_query:
-            query = supabase_client.client.table(table).select('*')
+            filters = {"course_id": course_id} if table == "assignments" else None
+            page_size = min(remaining, DEFAULT_PAGE_SIZE) if remaining is not None else DEFAULT_PAGE_SIZE
             
-            if course_id and table == "assignments":
-                query = query.eq('course_id', course_id)
+            for page in supabase_client.iter_pages(table, LIST_COLUMNS[table], filters, table_cursor, page_size):
+                if remaining is not None:
+                    page = page[:remaining]
+                    remaining -= len(page)
+                
+                # Rows written before content_length existed need their length computed once
+                missing_lengths = [item["id"] for item in page if item.get("content_length") is None]
+                computed_lengths = transcript_content_lengths(missing_lengths) if table == "zoom_transcripts" else {}
                 
-            data = query.execute().data
+                for item in page:
+                    content_length = item.get("content_length")
+                    if content_length is None:
+                        content_length = computed_lengths.get(item["id"], 0)
+                    
+                    if table == "zoom_transcripts":
+                        all_documents.append({
+                            "document_id": item["id"],
+                            "title": f"Transcript {(item.get('recording_id') or '')[:8]}",
+                            "document_type": "transcript",
+                            "content_length": content_length,
+                            "created_at": item.get("created_at", "")
+                        })
+                    elif table == "assignments":
+                        all_documents.append({
+                            "document_id": item["id"],
+                            "title": item.get("title", ""),
+                            "document_type": "assignment",
+                            "content_length": content_length,
+                            "created_at": item.get("created_at", "")
+                        })
+                
+                if remaining == 0:
+                    next_cursor = f"{table}:{page[-1]['id']}"
+                    break
             
-            for item in data:
-                if table == "zoom_transcripts":
-                    all_documents.append({
-                        "document_id": item["id"],
-                        "title": f"Transcript {item.get('recording_id', '')[:8]}",
-                        "document_type": "transcript",
-                        "content_length": len(str(item.get("transcript_data", ""))),
-                        "created_at": item.get("created_at", "")
-                    })
-                elif table == "assignments":
-                    all_documents.append({
-                        "document_id": item["id"],
-                        "title": item.get("title", ""),
-                        "document_type": "assignment",
-                        "content_length": len(item.get("description", "")),
-                        "created_at": item.get("created_at", "")
-                    })
+            table_cursor = None
+            if remaining == 0:
+                break
+        
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
         logger.debug(f"Found {len(all_documents)} documents")
         return all_documents
+    except HTTPException:
+        raise
     except Exception as e:
         error_trace = traceback.format_exc()
         logger.error(f"Error listing documents: {str(e)}")
         logger.debug(f"Error traceback: {error_trace}")
         raise HTTPException(status_code=500, detail=f"Error listing documents: {str(e)}")
 
+@app.get("/documents/count")
+async def count_documents(user_id: Optional[str] = None,
+                          course_id: Optional[str] = None,
+                          method: str = "exact",
+                          group_by: Optional[str] = None):
+    """
+    Count documents without listing them (cached for COUNT_CACHE_TTL seconds)
+    
+    ``method`` is "exact", "planned" or "estimated"; ``group_by`` ("user" or
+    "course") adds a per-user or per-course breakdown.
+    """
+    logger.info(f"Count documents endpoint called, user: {user_id}, course: {course_id}, method: {method}, group_by: {group_by}")
+    
+    if method not in COUNT_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(COUNT_METHODS)}")
+    if group_by not in (None, "user", "course"):
+        raise HTTPException(status_code=400, detail="group_by must be 'user' or 'course'")
+    
+    result = supabase_client.count_documents(user_id=user_id, course_id=course_id, method=method)
+    if group_by:
+        result["breakdown"] = supabase_client.count_documents_by(group_by, user_id=user_id)
+    return result
+
 @app.get("/documents/{document_id}")
 async def get_document_endpoint(document_id: str):
     """
@@ -619,30 +830,18 @@ async def delete_document_endpoint(document_id: str, current_user: Dict = Depend
     logger.info(f"Delete document endpoint called: {document_id}")
     
     try:
-        # Try to delete from zoom_transcripts
-        transcript_query = supabase_client.client.table('zoom_transcripts').select('user_id').eq('id', document_id).execute()
-        if transcript_query.data and len(transcript_query.data) > 0:
-            # Check if current user owns the document
-            doc_user_id = transcript_query.data[0].get('user_id')
-            if doc_user_id != user_id:
-                raise HTTPException(status_code=403, detail="You don't have permission to delete this document")
-                
-            response = supabase_client.client.table('zoom_transcripts').delete().eq('id', document_id).execute()
-            if response.data and len(response.data) > 0:
-                logger.info(f"Document deleted from zoom_transcripts: {document_id}")
-                return {"message": f"Document {document_id} deleted"}
-        
-        # Try assignments
-        assignment_query = supabase_client.client.table('assignments').select('user_id').eq('id', document_id).execute()
-        if assignment_query.data and len(assignment_query.data) > 0:
-            # Check if current user owns the document
-            doc_user_id = assignment_query.data[0].get('user_id')
-            if doc_user_id != user_id:
+        # One catalog read (usually cached) gives the table and the owner
+        entry = supabase_client.lookup_document(document_id)
+        if entry:
+            if str(entry.get("user_id")) != str(user_id):
                 raise HTTPException(status_code=403, detail="You don't have permission to delete this document")
-                
-            response = supabase_client.client.table('assignments').delete().eq('id', document_id).execute()
+            
+            table = entry["source_table"]
+            response = supabase_client.client.table(table).delete().eq('id', document_id).execute()
+            supabase_client.forget_document(document_id)
             if response.data and len(response.data) > 0:
-                logger.info(f"Document deleted from assignments: {document_id}")
+                logger.info(f"Document deleted from {table}: {document_id}")
+                supabase_client.clear_count_cache()
                 return {"message": f"Document {document_id} deleted"}
         
         logger.warning(f"Document not found for deletion: {document_id}")
@@ -655,79 +854,129 @@ async def delete_document_endpoint(document_id: str, current_user: Dict = Depend
         logger.debug(f"Error traceback: {error_trace}")
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
 
+def load_query_document(query_request: Union[QueryRequest, BatchQueryRequest],
+                        deadline: Optional[float] = None) -> Tuple[Union[str, Dict[str, str]], List[Dict[str, Any]], Optional[str]]:
+    """
+    Assemble the RAG document of a query request from stored documents and inline content
+    
+    Args:
+        deadline: time.monotonic() value by which the documents must be fetched
+    
+    Returns:
+        (document text or dict of source id to text, documents found, error message or None)
+    """
+    # Set up document filtering
+    document_types = set(query_request.document_types) if query_request.document_types else None
+    exclude_ids = set(query_request.exclude_ids) if query_request.exclude_ids else None
+    
+    # If no specific document IDs are provided but filters are set,
+    # get document IDs based on filters
+    if not query_request.document_ids and (document_types or exclude_ids):
+        document_ids = get_document_ids(document_types, exclude_ids)
+    else:
+        document_ids = query_request.document_ids
+        
+    # Log document selection info
+    logger.info("Query will use %d documents", len(document_ids))
+    
+    # Get documents content
+    logger.debug("Retrieving %d documents", len(document_ids))
+    try:
+        retrieved_docs = []
+        if document_ids:
+            with span("db.fetch_documents", documents=len(document_ids)):
+                retrieved_docs = fetch_documents(document_ids, deadline)
+    except TimeoutError as e:
+        logger.warning(str(e))
+        return "", [], str(e)
+    # One source per document, so chunks never span two documents and each retrieved
+    # chunk can be attributed to its document
+    rag_document = {document["id"]: document["content"] for document in retrieved_docs if document["content"]}
+    
+    # Inline content from the caller (e.g. the backend's generators) needs no lookup
+    if query_request.sources:
+        rag_document.update(query_request.sources)
+    elif query_request.content:
+        rag_document["content"] = query_request.content
+    
+    if not rag_document and document_ids:
+        logger.warning("No valid documents found")
+        return rag_document, retrieved_docs, "No valid documents found"
+    return rag_document, retrieved_docs, None
+
 @app.post("/query", response_model=QueryResponse)
 async def query(query_request: QueryRequest):
     """
     Process a query with document filtering
     """
     logger.info("Query endpoint called")
-    logger.debug(f"Query details: {query_request.dict()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        # Without inline content: it can be megabytes, and the length is logged below
+        logger.debug("Query details: %s", query_request.dict(exclude={"content", "sources"}))
     
     start_time = time.time()
-    
-    # Set up document filtering
-    document_types = set(query_request.document_types) if query_request.document_types else None
-    exclude_ids = set(query_request.exclude_ids) if query_request.exclude_ids else None
+    fetch_deadline = time.monotonic() + (query_request.fetch_timeout_seconds or DOCUMENT_FETCH_TIMEOUT_SECONDS)
+    timings = {"fetch": 0.0}
     
     try:
-        # If no specific document IDs are provided but filters are set,
-        # get document IDs based on filters
-        if not query_request.document_ids and (document_types or exclude_ids):
-            filtered_docs = get_documents(document_types, exclude_ids)
-            document_ids = [doc["id"] for doc in filtered_docs]
-        else:
-            document_ids = query_request.document_ids
-            
-        # Log document selection info
-        logger.info(f"Query will use {len(document_ids)} documents")
-        
-        # Get documents content
-        logger.debug(f"Retrieving {len(document_ids)} documents")
-        all_docs_content = ""
-        retrieved_docs = []
-        
-        for doc_id in document_ids:
-            document = get_document(doc_id)
-            if document:
-                logger.debug(f"Document found: {doc_id}, length: {len(document['content'])} chars")
-                all_docs_content += document["content"] + "\n\n"
-                retrieved_docs.append(document)
-            else:
-                logger.warning(f"Document not found: {doc_id}")
-        
-        if not all_docs_content and document_ids:
-            logger.warning("No valid documents found")
+        # Stage 1: fetch the documents (blocking Supabase calls, off the event loop)
+        fetch_start = time.time()
+        rag_document, retrieved_docs, error = await run_in_threadpool(load_query_document, query_request, fetch_deadline)
+        timings["fetch"] = time.time() - fetch_start
+        FETCH_SECONDS.observe(timings["fetch"])
+        if not error and time.monotonic() >= fetch_deadline:
+            error = "Document fetch exceeded its timeout"
+        if error:
+            timings["total"] = time.time() - start_time
             return QueryResponse(
                 query=query_request.query,
                 response="",
                 retrieved_chunks=[],
-                processing_time=time.time() - start_time,
+                processing_time=timings["total"],
                 document_count=0,
                 success=False,
-                error="No valid documents found",
+                error=error,
+                timings=timings,
                 timestamp=datetime.now().isoformat()
             )
         
         # Process through RAG
-        logger.info(f"Processing through RAG, document length: {len(all_docs_content)} chars")
+        logger.info("Processing through RAG, document length: %d chars",
+                    len(rag_document) if isinstance(rag_document, str) else sum(map(len, rag_document.values())))
         
-        result = rag_system.process_document(
-            document=all_docs_content,
+        # CPU-bound (chunking, embedding) and blocking (LLM call): keep it off the event loop
+        result = await run_in_threadpool(
+            rag_system.process_document,
+            document=rag_document,
             query=query_request.query,
-            chunks_to_retrieve=query_request.top_k
+            chunks_to_retrieve=query_request.top_k,
+            max_tokens=query_request.max_tokens,
+            instructions=query_request.instructions,
+            model=query_request.model,
+            # Inline sources each need an answer; stored documents compete on relevance
+            interleave_sources=bool(query_request.sources)
         )
         
         processing_time = time.time() - start_time
-        logger.info(f"RAG processing complete in {processing_time:.2f}s, success: {result['success']}")
+        timings.update({stage: seconds for stage, seconds in result["timings"].items() if stage != "total"})
+        timings["total"] = processing_time
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("RAG processing complete in %.2fs, success: %s, stages: %s", processing_time, result["success"],
+                        ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
         
         return QueryResponse(
             query=query_request.query,
             response=result["response"] if result["success"] else "",
             retrieved_chunks=result["retrieved_chunks"] if "retrieved_chunks" in result else [],
+            chunk_sources=result.get("chunk_sources", []),
             processing_time=processing_time,
             document_count=len(retrieved_docs),
             success=result["success"],
             error=result["error"] if not result["success"] else None,
+            token_usage=result.get("token_usage"),
+            retrieval=result.get("retrieval"),
+            degraded=result.get("degraded", False),
+            timings=timings,
             timestamp=datetime.now().isoformat()
         )
         
@@ -747,6 +996,83 @@ async def query(query_request: QueryRequest):
             timestamp=datetime.now().isoformat()
         )
 
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(batch_request: BatchQueryRequest):
+    """
+    Answer many queries over one shared set of documents
+    
+    The documents are loaded, chunked and embedded once, the queries are
+    embedded in one batch and scored with one matrix product, and the LLM
+    calls run concurrently. With "stream": true, results are sent as
+    newline-delimited JSON in completion order, each with its "index".
+    """
+    logger.info("Batch query endpoint called with %d queries", len(batch_request.queries))
+    start_time = time.time()
+    
+    def query_response(spec: BatchQuery, result: Dict[str, Any], document_count: int) -> QueryResponse:
+        timings = {"fetch": fetch_time, **result.get("timings", {})}
+        # Pipeline results time from the end of the shared fetch
+        timings["total"] = result["processing_time"] + (fetch_time if "timings" in result else 0.0)
+        return QueryResponse(
+            query=spec.query,
+            response=result["response"] if result["success"] else "",
+            retrieved_chunks=result.get("retrieved_chunks", []),
+            chunk_sources=result.get("chunk_sources", []),
+            processing_time=result["processing_time"],
+            document_count=document_count,
+            success=result["success"],
+            error=result["error"] if not result["success"] else None,
+            token_usage=result.get("token_usage"),
+            retrieval=result.get("retrieval"),
+            degraded=result.get("degraded", False),
+            timings=timings,
+            timestamp=datetime.now().isoformat()
+        )
+    
+    fetch_deadline = time.monotonic() + (batch_request.fetch_timeout_seconds or DOCUMENT_FETCH_TIMEOUT_SECONDS)
+    try:
+        rag_document, retrieved_docs, error = await run_in_threadpool(load_query_document, batch_request, fetch_deadline)
+    except Exception as e:
+        logger.error(f"Error loading batch query documents: {e}")
+        logger.debug(traceback.format_exc())
+        rag_document, retrieved_docs, error = "", [], str(e)
+    fetch_time = time.time() - start_time
+    FETCH_SECONDS.observe(fetch_time)
+    specs = [{"query": spec.query, "chunks_to_retrieve": spec.top_k, "max_tokens": spec.max_tokens,
+              "instructions": spec.instructions} for spec in batch_request.queries]
+    
+    def results():
+        """(index, QueryResponse) as queries finish"""
+        if error or not specs:
+            for index, spec in enumerate(batch_request.queries):
+                yield index, query_response(spec, {"success": False, "response": "", "error": error,
+                                                   "processing_time": time.time() - start_time}, 0)
+            return
+        for index, result in rag_system.iter_queries(rag_document, specs, model=batch_request.model,
+                                                     interleave_sources=bool(batch_request.sources)):
+            yield index, query_response(batch_request.queries[index], result, len(retrieved_docs))
+    
+    if batch_request.stream:
+        def lines():
+            for index, response in results():
+                yield json.dumps({"index": index, **response.dict()}) + "\n"
+            logger.info("Batch of %d queries streamed in %.2fs", len(specs), time.time() - start_time)
+        # Starlette iterates the generator in a thread pool, off the event loop
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    responses: List[Optional[QueryResponse]] = [None] * len(specs)
+    for index, response in await run_in_threadpool(lambda: list(results())):
+        responses[index] = response
+    processing_time = time.time() - start_time
+    logger.info("Batch of %d queries complete in %.2fs, %d succeeded", len(specs), processing_time,
+                sum(response.success for response in responses))
+    return BatchQueryResponse(
+        results=responses,
+        processing_time=processing_time,
+        document_count=len(retrieved_docs),
+        timestamp=datetime.now().isoformat()
+    )
+
 @app.get("/test")
 async def test_endpoint():
     """Test endpoint to check if the server is working properly"""
@@ -760,7 +1086,8 @@ async def test_endpoint():
         "status": "ok", 
         "message": "Server is running correctly",
         "test_id": test_id,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "llm_parsing": parse_stats()
     }
 
 @app.post("/test/generate")
@@ -869,7 +1196,8 @@ async def test_full_pipeline(document_id: str, query: str = "Summarize the main
             relevant_chunks = rag_system.retrieve_chunks(
                 query_embedding,
                 indexed_chunks,
-                k=5
+                k=5,
+                query=query
             )
             results["steps"]["retrieval"] = {
                 "success": True,
@@ -918,6 +1246,12 @@ async def test_full_pipeline(document_id: str, query: str = "Summarize the main
         results["error"] = f"Full pipeline failed: {str(e)}"
         return results
 
+# The educational prompts go to the LLM as instructions; retrieval ranks chunks by this query
+EDUCATIONAL_RETRIEVAL_QUERY = "Key concepts, definitions, formulas, methods and examples taught in this material"
+NOTECARD_RESPONSE_TOKENS = 120  # response tokens per requested notecard
+QUIZ_RESPONSE_TOKENS = 150  # response tokens per requested quiz question
+rag_system.pin_queries([EDUCATIONAL_RETRIEVAL_QUERY])
+
 @app.post("/educational/notecards")
 async def generate_notecards(request: Dict[str, Any]):
     """
@@ -973,48 +1307,29 @@ async def generate_notecards(request: Dict[str, Any]):
         FRONT: What are the key characteristics of microservices architecture?
         BACK: Microservices architecture is characterized by: 1) Small, independent services focused on single responsibilities, 2) Loose coupling between services, 3) Independent deployment capabilities, and 4) Service-specific databases and UI management code.
         
-        Content: {content}
+        Content: {{context}}
         
-        Format each flashcard as:
-        FRONT: [specific educational question about a key concept]
-        BACK: [complete, textbook-quality explanation of the concept]
+        {json_format_instructions("notecards")}
         """
             
         # Process the document
         rag_system = RAGSystem()
-        result = rag_system.process_document(content, prompt)
+        result = await run_in_threadpool(rag_system.process_document, content, EDUCATIONAL_RETRIEVAL_QUERY,
+                                         instructions=prompt, max_tokens=NOTECARD_RESPONSE_TOKENS * num_cards)
         
         if result["success"]:
-            # Parse the generated flashcards
-            generated_text = result["response"]
-            card_blocks = generated_text.split("FRONT:")
-            
-            # Skip the first element if it's empty (usually is)
-            if card_blocks and not card_blocks[0].strip():
-                card_blocks = card_blocks[1:]
-            
-            cards = []
-            for i, block in enumerate(card_blocks[:num_cards]):
-                # Split block into front and back
-                parts = block.split("BACK:")
-                
-                if len(parts) == 2:
-                    front = parts[0].strip()
-                    back = parts[1].strip()
-                    
-                    # Clean up any remaining sections
-                    if "FRONT:" in back:
-                        back = back.split("FRONT:")[0].strip()
-                        
-                    cards.append({
-                        "id": f"card_{i}",
-                        "front": front,
-                        "back": back
-                    })
+            # JSON per the prompt's schema; truncated JSON and FRONT:/BACK: blocks still parse
+            with span("llm.parse", item_type="notecards"):
+                cards, outcome = parse_notecards(result["response"], num_cards)
+            logger.info(f"Parsed {len(cards)} notecards ({outcome})")
             
             return {
                 "success": True,
                 "cards": cards,
+                "parse_outcome": outcome,
+                "token_usage": result["token_usage"],
+                "retrieval": result["retrieval"],
+                "degraded": result["degraded"],
                 "processing_time": result["processing_time"]
             }
         else:
@@ -1109,72 +1424,29 @@ async def generate_quiz(request: Dict[str, Any]):
         C: Centralized databases shared by all services
         D: Services that must be deployed simultaneously
         
-        Content: {content}
+        Content: {{context}}
         
-        Format each question as:
-        QUESTION: [clear educational question about a specific concept]
-        A: [option A]
-        B: [option B]
-        C: [option C]
-        D: [option D]
-        CORRECT: [letter of correct answer: A, B, C, or D]
+        {json_format_instructions("quiz")}
         """
             
         # Process the document
         rag_system = RAGSystem()
-        result = rag_system.process_document(content, prompt)
+        result = await run_in_threadpool(rag_system.process_document, content, EDUCATIONAL_RETRIEVAL_QUERY,
+                                         instructions=prompt, max_tokens=QUIZ_RESPONSE_TOKENS * num_questions)
         
         if result["success"]:
-            # Parse the generated quiz questions
-            generated_text = result["response"]
-            question_blocks = generated_text.split("QUESTION:")
-            
-            # Skip the first element if it's empty
-            if question_blocks and not question_blocks[0].strip():
-                question_blocks = question_blocks[1:]
-            
-            questions = []
-            for i, block in enumerate(question_blocks[:num_questions]):
-                # Extract question text
-                question_text = block.split("A:")[0].strip() if "A:" in block else block.strip()
-                
-                # Extract options
-                options = []
-                option_parts = {"A:": "B:", "B:": "C:", "C:": "D:", "D:": "CORRECT:"}
-                
-                for start_tag, end_tag in option_parts.items():
-                    if start_tag in block:
-                        start_idx = block.index(start_tag) + len(start_tag)
-                        end_idx = block.index(end_tag) if end_tag in block else len(block)
-                        option_text = block[start_idx:end_idx].strip()
-                        options.append(option_text)
-                
-                # If we don't have exactly 4 options, create placeholders
-                while len(options) < 4:
-                    options.append(f"Option {len(options)+1} for question {i+1}")
-                
-                # Extract correct answer
-                correct_idx = 0  # Default to A
-                if "CORRECT:" in block:
-                    correct_part = block.split("CORRECT:")[1].strip().upper()
-                    if correct_part.startswith('A'):
-                        correct_idx = 0
-                    elif correct_part.startswith('B'):
-                        correct_idx = 1
-                    elif correct_part.startswith('C'):
-                        correct_idx = 2
-                    elif correct_part.startswith('D'):
-                        correct_idx = 3
-                
-                questions.append({
-                    "question": question_text,
-                    "options": options[:4],  # Ensure we have exactly 4 options
-                    "correctIndex": correct_idx
-                })
+            # JSON per the prompt's schema; truncated JSON and QUESTION:/CORRECT: blocks still parse
+            with span("llm.parse", item_type="quiz"):
+                questions, outcome = parse_quiz(result["response"], num_questions)
+            logger.info(f"Parsed {len(questions)} quiz questions ({outcome})")
             
             return {
                 "success": True,
                 "questions": questions,
+                "parse_outcome": outcome,
+                "token_usage": result["token_usage"],
+                "retrieval": result["retrieval"],
+                "degraded": result["degraded"],
                 "processing_time": result["processing_time"]
             }
         else:
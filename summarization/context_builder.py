@@ -0,0 +1,188 @@
+#context_builder.py
+"""
+Token-budgeted context assembly for the RAG pipeline.
+
+``process_document`` used to join the top-k chunks with blank lines and send
+them without counting tokens. This module fills the context instead: chunks
+are taken in relevance order until the model's token budget is used, chunks
+that nearly duplicate one already taken are skipped, and neighbouring chunks
+are merged in reading order so the tokens they overlap by are sent once.
+
+A chunk is a dict with ``source`` (document or source id, ``None`` for a
+single document), ``position`` (index within its source) and ``tokens``
+(tiktoken ids). Budgets come from ``MODEL_CONTEXT_TOKENS``; all counts use
+the same cl100k encoder as the chunker.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Context window per model (prompt + response)
+MODEL_CONTEXT_TOKENS = {
+    "meta-llama/llama-3-8b-instruct": 8192,
+    "meta-llama/llama-3-70b-instruct": 8192,
+    "meta-llama/llama-3.1-8b-instruct": 131072,
+    "mistralai/mistral-7b-instruct": 32768,
+    "openai/gpt-3.5-turbo": 16385,
+    "openai/gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# Cap on the context sent to long-context models, to keep requests cheap
+MAX_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "6000"))
+# Headroom for chat formatting and tokenizer differences between models
+PROMPT_MARGIN_TOKENS = 128
+# Chunks whose token 3-gram Jaccard similarity with a chunk already taken
+# reaches this are near-duplicates
+DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 3
+
+
+def context_budget(model: str, prompt_tokens: int, max_response_tokens: int) -> int:
+    """
+    Tokens available for retrieved context
+
+    Args:
+        model: OpenRouter model name
+        prompt_tokens: Tokens of the prompt without context (instructions, query, template)
+        max_response_tokens: Tokens reserved for the response
+
+    Returns:
+        Context token budget (0 if the prompt alone fills the window)
+    """
+    window = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    available = window - prompt_tokens - max_response_tokens - PROMPT_MARGIN_TOKENS
+    return max(0, min(available, MAX_CONTEXT_TOKENS))
+
+
+def _shingles(tokens: List[int]) -> set:
+    """Token n-grams of a chunk"""
+    if len(tokens) < SHINGLE_SIZE:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def _overlap(first: List[int], second: List[int], overlap_tokens: int) -> int:
+    """Tokens that the next chunk of a source repeats from the one before it"""
+    return min(overlap_tokens, len(first), len(second))
+
+
+def _interleave(ranking: List[int], chunks: List[Dict[str, Any]]) -> List[int]:
+    """Alternate sources in the ranking so every source gets context (each keeps its own relevance order)"""
+    queues: Dict[Any, List[int]] = {}
+    for index in ranking:
+        queues.setdefault(chunks[index]["source"], []).append(index)
+    if len(queues) < 2:
+        return ranking
+
+    order = []
+    rounds = max(len(queue) for queue in queues.values())
+    for depth in range(rounds):
+        order.extend(queue[depth] for queue in queues.values() if depth < len(queue))
+    return order
+
+
+def build_context(encoder, chunks: List[Dict[str, Any]], ranking: Optional[List[int]], budget_tokens: int,
+                  overlap_tokens: int = 0, max_chunks: Optional[int] = None,
+                  interleave: bool = False) -> Tuple[str, List[int], Dict[str, int]]:
+    """
+    Assemble the context for a prompt within a token budget
+
+    Args:
+        encoder: tiktoken encoding used to chunk the documents
+        chunks: Chunk dicts (``source``, ``position``, ``tokens``)
+        ranking: Chunk indices in relevance order; None takes chunks in reading order
+        budget_tokens: Context token budget
+        overlap_tokens: Tokens consecutive chunks of a source share
+        max_chunks: Optional cap on the number of chunks
+        interleave: Take the sources' chunks in turn, for sources that each need
+            an answer (packed prompts); otherwise every chunk competes on relevance
+
+    Returns:
+        Tuple of (context text, indices of the chunks used in relevance order,
+        token report). With several sources the context is one
+        ``SOURCE: <id>`` / ``Content:`` section per source.
+    """
+    if ranking is None:
+        ranking = list(range(len(chunks)))
+    if interleave:
+        ranking = _interleave(ranking, chunks)
+    by_position = {(chunk["source"], chunk["position"]): index for index, chunk in enumerate(chunks)}
+
+    selected: List[int] = []
+    taken = set()
+    taken_shingles: List[set] = []
+    used = 0
+    duplicates = over_budget = merged_overlap = 0
+    for index in ranking:
+        if max_chunks is not None and len(selected) >= max_chunks:
+            break
+        chunk = chunks[index]
+        shingles = _shingles(chunk["tokens"])
+        if any(len(shingles & other) >= DUPLICATE_THRESHOLD * len(shingles | other) for other in taken_shingles):
+            duplicates += 1
+            continue
+
+        # Tokens shared with a neighbour already in the context are not sent twice
+        shared = 0
+        for neighbour_position in (chunk["position"] - 1, chunk["position"] + 1):
+            neighbour = by_position.get((chunk["source"], neighbour_position))
+            if neighbour in taken:
+                first, second = sorted((index, neighbour), key=lambda i: chunks[i]["position"])
+                shared += _overlap(chunks[first]["tokens"], chunks[second]["tokens"], overlap_tokens)
+        cost = len(chunk["tokens"]) - shared
+        if used + cost > budget_tokens:
+            over_budget += 1
+            continue
+
+        selected.append(index)
+        taken.add(index)
+        taken_shingles.append(shingles)
+        used += cost
+        merged_overlap += shared
+
+    # Render each source's chunks in reading order, merging consecutive runs
+    sections = []
+    sources = list(dict.fromkeys(chunk["source"] for chunk in chunks))
+    for source in sources:
+        indices = sorted((i for i in selected if chunks[i]["source"] == source), key=lambda i: chunks[i]["position"])
+        runs: List[List[int]] = []
+        previous = None
+        for index in indices:
+            if previous is not None and chunks[index]["position"] == chunks[previous]["position"] + 1:
+                skip = _overlap(chunks[previous]["tokens"], chunks[index]["tokens"], overlap_tokens)
+                runs[-1].extend(chunks[index]["tokens"][skip:])
+            else:
+                runs.append(list(chunks[index]["tokens"]))
+            previous = index
+        if not runs:
+            continue
+        text = "\n\n".join(encoder.decode(run) for run in runs)
+        sections.append(text if len(sources) == 1 else f"SOURCE: {source}\nContent: {text}")
+
+    context = "\n\n".join(sections)
+    report = {
+        "context_budget": budget_tokens,
+        "context_tokens": len(encoder.encode(context)),
+        "chunks_available": len(chunks),
+        "chunks_used": len(selected),
+        "duplicate_chunks_dropped": duplicates,
+        "chunks_over_budget": over_budget,
+        "overlap_tokens_merged": merged_overlap,
+    }
+    return context, selected, report
+
+
+if __name__ == "__main__":
+    import tiktoken
+
+    encoding = tiktoken.get_encoding("cl100k_base")
+    paragraph = ("A cache line is the unit of transfer between main memory and the cache. "
+                 "Write-back caches delay writes until a line is evicted. ")
+    text = paragraph * 6 + "The TLB caches page table entries for the memory management unit. " * 3
+    tokens = encoding.encode(text)
+    size, overlap = 40, 8
+    sample = [{"source": None, "position": p, "tokens": tokens[i:i + size]}
+              for p, i in enumerate(range(0, len(tokens), size - overlap))]
+    for budget in (60, 200, 1000):
+        context, used, report = build_context(encoding, sample, None, budget, overlap)
+        print(budget, used, report)
@@ -0,0 +1,122 @@
+#document_index.py
+"""
+Per-document retrieval indexes for the RAG pipeline.
+
+``/query`` used to join every requested document into one string, so chunks
+could span two documents, nothing could be attributed to a source, and the
+whole text was chunked and embedded again on every request. Documents are now
+chunked one by one, and each document's chunks (with their character offsets)
+and chunk embeddings are kept in ``DocumentIndexCache``, keyed by a hash of
+the document text, so a lecture queried again is neither re-tokenized nor
+re-embedded. The key is the content, not the document id, so an edited
+document gets a fresh index and inline texts benefit too.
+
+The BM25 postings of a document's chunks are kept with them too, built the
+first time the document is ranked; a request searches the postings of its
+documents together (``lexical_retrieval.JoinedLexicalIndex``), so the corpus
+statistics still cover whichever documents are combined.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from lexical_retrieval import LexicalIndex
+
+logger = logging.getLogger("rag_system")
+
+DOCUMENT_INDEX_CACHE_SIZE = int(os.getenv("DOCUMENT_INDEX_CACHE_SIZE", "128"))  # documents
+
+
+def content_key(text: str) -> str:
+    """Cache key of a document's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentIndex:
+    """A document's chunks, their BM25 postings and, per embedding model, their embeddings"""
+
+    def __init__(self, chunks: List[Dict[str, Any]]):
+        """
+        Args:
+            chunks: Dicts with position, tokens, text, start and end (character offsets in the document)
+        """
+        self.chunks = chunks
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self.lexical: Optional[LexicalIndex] = None
+
+
+class DocumentIndexCache:
+    def __init__(self, capacity: int = DOCUMENT_INDEX_CACHE_SIZE):
+        """
+        Args:
+            capacity: Documents kept (least recently used are dropped)
+        """
+        self.capacity = capacity
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "embedding_hits": 0, "embedding_misses": 0, "lexical_builds": 0}
+
+    def get(self, text: str, build: Callable[[str], List[Dict[str, Any]]]) -> DocumentIndex:
+        """
+        The index of a document, chunking it with ``build`` if it isn't cached
+        """
+        key = content_key(text)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self._stats["hits"] += 1
+                return index
+            self._stats["misses"] += 1
+
+        index = DocumentIndex(build(text))
+        with self._lock:
+            # Another request may have built it meanwhile; keep the first (it may already have embeddings)
+            index = self._indexes.setdefault(key, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.capacity:
+                self._indexes.popitem(last=False)
+        return index
+
+    def embeddings(self, index: DocumentIndex, model: str) -> Optional[np.ndarray]:
+        """Cached chunk embeddings of a document for a model, or None"""
+        with self._lock:
+            vectors = index.embeddings.get(model)
+            self._stats["embedding_hits" if vectors is not None else "embedding_misses"] += 1
+        return vectors
+
+    def put_embeddings(self, index: DocumentIndex, model: str, vectors: np.ndarray):
+        with self._lock:
+            index.embeddings[model] = vectors
+
+    def lexical(self, index: DocumentIndex, deadline: Optional[float] = None) -> LexicalIndex:
+        """
+        The BM25 index of a document's chunks, built on first use
+
+        Raises:
+            TimeoutError: if the deadline (a time.monotonic() value) passes while building it
+        """
+        lexical = index.lexical
+        if lexical is None:
+            lexical = LexicalIndex([chunk["text"] for chunk in index.chunks], deadline)
+            with self._lock:
+                if index.lexical is None:
+                    index.lexical = lexical
+                    self._stats["lexical_builds"] += 1
+                lexical = index.lexical
+        return lexical
+
+    def stats(self) -> Dict[str, Any]:
+        """Documents cached, and chunking, embedding and BM25 index counts"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["documents"] = len(self._indexes)
+            stats["chunks"] = sum(len(index.chunks) for index in self._indexes.values())
+        stats["capacity"] = self.capacity
+        return stats
@@ -0,0 +1,277 @@
+#embedding_backends.py
+"""
+Local embedding backends for all-MiniLM-L6-v2.
+
+``create_backend`` returns the backend named by ``EMBEDDING_BACKEND``:
+
+- ``sentence-transformers``: the PyTorch model (default, previous behaviour)
+- ``onnx``: the same weights exported to ONNX and run with ONNX Runtime
+- ``onnx-int8``: the ONNX export with dynamically quantized int8 weights
+
+All backends mean-pool and L2-normalize like the sentence-transformers model,
+so their vectors are interchangeable (the int8 model to about 0.99 cosine;
+run this module to check). ONNX models are exported once into
+``EMBEDDING_ONNX_DIR``. ``EMBEDDING_THREADS`` sets the CPU threads used for
+inference and ``EMBEDDING_BATCH_SIZE`` the texts per forward pass.
+
+ONNX Runtime is optional (``pip install onnxruntime onnx``); without it the
+PyTorch backend is used.
+"""
+
+import inspect
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("rag_system")
+
+try:
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except ImportError:
+    onnxruntime = None
+    ONNX_AVAILABLE = False
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")  # hub name or local path
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps the runtime's default
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("cache", "onnx"))
+MAX_SEQUENCE_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+
+class EmbeddingBackend:
+    """Interface of a local embedding backend"""
+
+    name = "base"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 threads: int = EMBEDDING_THREADS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this backend produces (used in cache keys)"""
+        return self.model_name if self.name == "sentence-transformers" else f"{self.model_name}:{self.name}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a (len(texts), dimension) float32 array of unit vectors"""
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The sentence-transformers PyTorch model"""
+
+    name = "sentence-transformers"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from sentence_transformers import SentenceTransformer
+        import torch
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        self.model = SentenceTransformer(self.model_name)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime inference of the exported transformer, optionally int8-quantized"""
+
+    name = "onnx"
+
+    def __init__(self, *args, quantized: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime is not installed")
+        from transformers import AutoTokenizer
+
+        self.quantized = quantized
+        if quantized:
+            self.name = "onnx-int8"
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        path = export_onnx(self.model_name, quantized)
+
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=MAX_SEQUENCE_LENGTH, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            # Mean pooling over real tokens, then L2 normalization (as the sentence-transformers model)
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for row, index in enumerate(batch):
+                vectors[index] = pooled[row]
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL_NAME, quantized: bool = False) -> str:
+    """
+    Export the transformer to ONNX (and quantize it) unless already done
+
+    Returns:
+        Path of the .onnx file
+    """
+    directory = os.path.join(EMBEDDING_ONNX_DIR, model_name.replace("/", "__"))
+    fp32_path = os.path.join(directory, "model.onnx")
+    int8_path = os.path.join(directory, "model-int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info(f"Exporting {model_name} to ONNX in {directory}")
+        os.makedirs(directory, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        transformer = AutoModel.from_pretrained(model_name).eval()
+
+        class HiddenStates(torch.nn.Module):
+            """Keyword call of the transformer (positional forward arguments differ across versions)"""
+
+            def __init__(self):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                        token_type_ids=token_type_ids).last_hidden_state
+
+        model = HiddenStates().eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        names = ["input_ids", "attention_mask", "token_type_ids"]
+        axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+        # Newer torch defaults to the dynamo exporter (needs onnxscript); the TorchScript one is enough here
+        legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(sample[name] for name in names), fp32_path,
+                              input_names=names, output_names=["last_hidden_state"],
+                              dynamic_axes=axes, opset_version=14, **legacy)
+
+    if quantized and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {fp32_path} to int8")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    return int8_path if quantized else fp32_path
+
+
+def create_backend(name: str = EMBEDDING_BACKEND, **kwargs) -> Optional[EmbeddingBackend]:
+    """
+    Create a local embedding backend, falling back to sentence-transformers
+
+    Returns:
+        The backend, or None if no local embedding model can be loaded
+    """
+    if name not in BACKENDS:
+        logger.warning(f"Unknown EMBEDDING_BACKEND {name!r}, using sentence-transformers")
+        name = "sentence-transformers"
+
+    if name != "sentence-transformers":
+        try:
+            backend = OnnxBackend(quantized=name == "onnx-int8", **kwargs)
+            logger.info(f"Embedding backend: {backend.name} ({backend.model_name})")
+            return backend
+        except Exception as e:
+            logger.warning(f"ONNX embedding backend unavailable, using sentence-transformers: {e}")
+
+    try:
+        backend = SentenceTransformerBackend(**kwargs)
+        logger.info(f"Embedding backend: {backend.name} ({backend.model_name})")
+        return backend
+    except ImportError:
+        logger.warning("Sentence Transformers not installed. Run 'pip install sentence-transformers'")
+    except Exception as e:
+        logger.error(f"Error loading Sentence Transformers model: {e}")
+    return None
+
+
+def accuracy_check(reference: EmbeddingBackend, candidate: EmbeddingBackend, texts: List[str],
+                   k: int = 5) -> Dict[str, float]:
+    """
+    Compare a backend's embeddings with the reference backend's
+
+    Returns:
+        Dict with the mean and minimum cosine similarity between the two
+        embeddings of each text, and the mean overlap of each text's top-k
+        nearest neighbours (the retrieval results the backends would give)
+    """
+    expected = reference.encode(texts)
+    actual = candidate.encode(texts)
+    cosines = (expected * actual).sum(axis=1)
+
+    def neighbours(vectors):
+        similarity = vectors @ vectors.T
+        np.fill_diagonal(similarity, -np.inf)
+        return np.argsort(-similarity, axis=1)[:, :k]
+
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(neighbours(expected), neighbours(actual))]
+    return {
+        "mean_cosine": round(float(cosines.mean()), 4),
+        "min_cosine": round(float(cosines.min()), 4),
+        f"top{k}_overlap": round(float(np.mean(overlap)), 4),
+    }
+
+
+def benchmark(backend: EmbeddingBackend, texts: List[str], repeats: int = 3) -> float:
+    """Throughput of a backend in chunks per second (best of ``repeats`` after a warm-up)"""
+    backend.encode(texts[:backend.batch_size])
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.encode(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+if __name__ == "__main__":
+    import random
+
+    logging.basicConfig(level=logging.INFO)
+    random.seed(0)
+    words = ("cache memory processor block offset index tag associativity write back policy eviction "
+             "virtual page table translation lookaside buffer latency bandwidth pipeline hazard branch "
+             "prediction register instruction exam homework deadline lecture question answer").split()
+    # ~100-token chunks like chunk_text produces
+    chunks = [" ".join(random.choice(words) for _ in range(75)) for _ in range(256)]
+
+    reference = create_backend("sentence-transformers")
+    if reference is None:
+        raise SystemExit("sentence-transformers is required as the accuracy reference")
+    results = {"sentence-transformers": (None, benchmark(reference, chunks))}
+    for name in ("onnx", "onnx-int8"):
+        try:
+            candidate = OnnxBackend(quantized=name == "onnx-int8")
+        except Exception as e:
+            print(f"{name}: unavailable ({e})")
+            continue
+        results[name] = (accuracy_check(reference, candidate, chunks), benchmark(candidate, chunks))
+
+    print(f"\n{len(chunks)} chunks, batch size {EMBEDDING_BATCH_SIZE}, threads {EMBEDDING_THREADS or 'default'}")
+    for name, (accuracy, rate) in results.items():
+        print(f"{name:22s} {rate:8.1f} chunks/s  {accuracy or 'reference'}")
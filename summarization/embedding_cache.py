@@ -0,0 +1,182 @@
+#embedding_cache.py
+"""
+Query embedding cache for the RAG pipeline.
+
+Retrieval queries repeat: the educational endpoints and the backend's
+generators all retrieve with the same canned query, and clients re-ask the
+same questions. ``QueryEmbeddingCache`` keeps query vectors keyed by a hash of
+the embedding model and the whitespace-normalized query, in two tiers:
+
+- an in-process LRU (``QUERY_EMBEDDING_CACHE_SIZE`` entries)
+- a SQLite file (``QUERY_EMBEDDING_CACHE_PATH``) shared by every worker
+  process and kept across restarts, trimmed to ``QUERY_EMBEDDING_DISK_SIZE``
+  least recently used rows
+
+Pinned queries (see ``pin``) are never evicted from either tier.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("rag_system")
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_DISK_SIZE = int(os.getenv("QUERY_EMBEDDING_DISK_SIZE", "50000"))
+# Empty disables the shared tier
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", os.path.join("cache", "query_embeddings.db"))
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace so reformatted copies of a query share an entry"""
+    return " ".join(text.split())
+
+
+def query_key(model: str, text: str) -> str:
+    """Cache key of a query for an embedding model"""
+    return hashlib.sha256(f"{model}\n{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, capacity: int = QUERY_EMBEDDING_CACHE_SIZE, path: Optional[str] = QUERY_EMBEDDING_CACHE_PATH,
+                 disk_capacity: int = QUERY_EMBEDDING_DISK_SIZE):
+        """
+        Args:
+            capacity: Entries kept in process
+            path: SQLite file shared between workers, or None/"" for memory only
+            disk_capacity: Rows kept in the SQLite file
+        """
+        self.capacity = capacity
+        self.disk_capacity = disk_capacity
+        self.path = path or None
+        # key -> vector, least recently used first
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with self._connect() as db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                        "key TEXT PRIMARY KEY, vector BLOB NOT NULL, pinned INTEGER NOT NULL DEFAULT 0, "
+                        "last_used REAL NOT NULL)"
+                    )
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Query embedding disk cache unavailable, using memory only: {e}")
+                self.path = None
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection per operation (safe across threads and worker processes), committed on success"""
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def pin(self, model: str, texts: Iterable[str]):
+        """Keep these queries for a model cached for good"""
+        keys = [query_key(model, text) for text in texts]
+        with self._lock:
+            self._pinned.update(keys)
+        if self.path:
+            try:
+                with self._connect() as db:
+                    db.executemany("UPDATE query_embeddings SET pinned = 1 WHERE key = ?", [(key,) for key in keys])
+            except sqlite3.Error as e:
+                logger.warning(f"Could not pin query embeddings on disk: {e}")
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Cached embedding of a query, or None"""
+        key = query_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+
+        if self.path:
+            try:
+                with self._connect() as db:
+                    row = db.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        db.execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                logger.warning(f"Query embedding disk cache read failed: {e}")
+                row = None
+            if row:
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, vector)
+                return vector
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        """Store the embedding of a query in both tiers"""
+        key = query_key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            pinned = key in self._pinned
+
+        if self.path:
+            try:
+                with self._connect() as db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, vector, pinned, last_used) VALUES (?, ?, ?, ?)",
+                        (key, np.asarray(vector, dtype=np.float32).tobytes(), int(pinned), time.time())
+                    )
+                    db.execute(
+                        "DELETE FROM query_embeddings WHERE pinned = 0 AND key IN ("
+                        "SELECT key FROM query_embeddings WHERE pinned = 0 ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_capacity,)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Query embedding disk cache write failed: {e}")
+
+    def _remember(self, key: str, vector: List[float]):
+        """Add to the in-process LRU (caller holds the lock), evicting unpinned entries"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.capacity:
+            for old_key in list(self._memory):
+                if len(self._memory) <= self.capacity:
+                    break
+                if old_key not in self._pinned:
+                    del self._memory[old_key]
+
+    def stats(self) -> Dict[str, object]:
+        """Hit counts and hit ratio since startup (this process)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["pinned"] = len(self._pinned)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+        stats["disk"] = self.path
+        if self.path:
+            try:
+                with self._connect() as db:
+                    stats["disk_entries"] = db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            except sqlite3.Error:
+                stats["disk_entries"] = None
+        return stats
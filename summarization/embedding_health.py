@@ -0,0 +1,96 @@
+#embedding_health.py
+"""
+Embedding health for the RAG pipeline.
+
+Embeddings come from the local model or, failing that, OpenAI. When neither
+works, ``EmbeddingUnavailableError`` is raised instead of handing out
+placeholder vectors, so callers can fall back to lexical retrieval (see
+lexical_retrieval) and mark their result as degraded rather than spend an LLM
+call on randomly chosen context.
+
+``EmbeddingHealth`` records the outcome of each embedding path. A path that
+just failed is skipped for ``EMBEDDING_RETRY_SECONDS`` so a dead model or an
+exhausted API key does not add a failed attempt to every request.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+EMBEDDING_RETRY_SECONDS = float(os.getenv("EMBEDDING_RETRY_SECONDS", "30"))
+
+
+class EmbeddingUnavailableError(RuntimeError):
+    """No embedding path could embed the texts"""
+
+    def __init__(self, errors: Dict[str, str]):
+        """
+        Args:
+            errors: Failure reason of each embedding path tried (or why it was skipped)
+        """
+        self.errors = errors
+        reasons = "; ".join(f"{path}: {reason}" for path, reason in errors.items()) or "no embedding path configured"
+        super().__init__(f"Embeddings unavailable ({reasons})")
+
+
+class EmbeddingHealth:
+    def __init__(self, retry_seconds: float = EMBEDDING_RETRY_SECONDS):
+        """
+        Args:
+            retry_seconds: How long a failed path is skipped before it is tried again
+        """
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._paths: Dict[str, Dict[str, object]] = {}
+        self._degraded = 0
+
+    def _path(self, path: str) -> Dict[str, object]:
+        """State of a path (caller holds the lock)"""
+        return self._paths.setdefault(path, {"successes": 0, "failures": 0, "consecutive_failures": 0,
+                                             "last_error": None, "last_failure": None})
+
+    def available(self, path: str) -> bool:
+        """Whether a path should be tried (it has not failed within the retry interval)"""
+        with self._lock:
+            state = self._path(path)
+            if not state["consecutive_failures"]:
+                return True
+            return time.time() - state["last_failure"] >= self.retry_seconds
+
+    def skip_reason(self, path: str) -> str:
+        """Why a path is being skipped"""
+        with self._lock:
+            state = self._path(path)
+            retry_in = self.retry_seconds - (time.time() - (state["last_failure"] or 0))
+            return f"failed recently ({state['last_error']}), retrying in {max(0.0, retry_in):.0f}s"
+
+    def record_success(self, path: str):
+        with self._lock:
+            state = self._path(path)
+            state["successes"] += 1
+            state["consecutive_failures"] = 0
+
+    def record_failure(self, path: str, error: Exception):
+        with self._lock:
+            state = self._path(path)
+            state["failures"] += 1
+            state["consecutive_failures"] += 1
+            state["last_error"] = str(error) or type(error).__name__
+            state["last_failure"] = time.time()
+
+    def record_degraded(self):
+        """Count a request answered with lexical retrieval because embeddings were unavailable"""
+        with self._lock:
+            self._degraded += 1
+
+    def stats(self, path: Optional[str] = None) -> Dict[str, object]:
+        """Per-path status ("ok" or "failing"), counts and last error, plus degraded requests"""
+        with self._lock:
+            paths = {name: dict(state, status="failing" if state["consecutive_failures"] else "ok")
+                     for name, state in self._paths.items() if path is None or name == path}
+            degraded = self._degraded
+        for state in paths.values():
+            if state["last_failure"]:
+                state["last_failure"] = round(time.time() - state["last_failure"], 1)  # seconds ago
+        return {"paths": paths, "degraded_requests": degraded}
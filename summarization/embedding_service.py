@@ -0,0 +1,263 @@
+#embedding_service.py
+"""
+Embedding worker processes with dynamic batching.
+
+Encoding chunks is CPU-bound; done inside the API process it holds the GIL
+and one long lecture stalls every other request on that worker.
+``EmbeddingService`` moves inference into ``EMBEDDING_WORKERS`` processes
+that each own a copy of the embedding backend (see embedding_backends) and
+read requests from a shared queue.
+
+Each worker coalesces queued requests into one batch: after taking a request
+it keeps taking more for up to ``EMBEDDING_MAX_WAIT_MS`` or until
+``EMBEDDING_MAX_BATCH`` texts are collected, so query embeddings from
+concurrent users share forward passes. Large requests are split into pieces of
+``EMBEDDING_MAX_BATCH`` texts with at most ``PIECES_IN_FLIGHT`` queued at a
+time, so a long document never sits in front of other users' queries.
+
+``stats`` reports queue latency (submit to batch start), batch fill and the
+number of requests sharing a batch.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS, create_backend
+
+logger = logging.getLogger("rag_system")
+
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "10"))
+# Model loading (and a first ONNX export) can take a while
+EMBEDDING_START_TIMEOUT = float(os.getenv("EMBEDDING_START_TIMEOUT", "300"))
+PIECES_IN_FLIGHT = 2
+STATS_WINDOW = 1000  # recent requests/batches the latency and fill figures cover
+
+
+def _worker_main(worker_id: int, backend_name: str, batch_size: int, threads: int,
+                 requests, results, max_batch: int, max_wait: float):
+    """Worker process: load the backend, then encode coalesced batches until told to stop"""
+    backend = create_backend(backend_name, batch_size=batch_size, threads=threads)
+    if backend is None:
+        results.put(("error", worker_id, "no local embedding model could be loaded"))
+        return
+    results.put(("ready", worker_id, backend.model_id))
+
+    stopping = False
+    while not stopping:
+        item = requests.get()
+        if item is None:
+            break
+        batch = [item]
+        count = len(item[1])
+        deadline = time.monotonic() + max_wait
+        while count < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+            count += len(item[1])
+
+        started = time.time()
+        try:
+            vectors = backend.encode([text for _, texts, _ in batch for text in texts])
+        except Exception as e:
+            for piece_id, _, _ in batch:
+                results.put(("failed", piece_id, str(e)))
+            continue
+        results.put(("batch", worker_id, count, len(batch), time.time() - started))
+
+        offset = 0
+        for piece_id, texts, submitted in batch:
+            results.put(("done", piece_id, vectors[offset:offset + len(texts)], started - submitted))
+            offset += len(texts)
+
+
+class _Job:
+    """One embed() call, split into pieces of at most max_batch texts"""
+
+    def __init__(self, texts: List[str], max_batch: int):
+        self.pieces = [texts[i:i + max_batch] for i in range(0, len(texts), max_batch)]
+        self.results: List[Optional[np.ndarray]] = [None] * len(self.pieces)
+        self.next_piece = 0
+        self.remaining = len(self.pieces)
+        self.future: Future = Future()
+
+
+class EmbeddingService:
+    name = "embedding-service"
+
+    def __init__(self, backend_name: str = EMBEDDING_BACKEND, workers: int = EMBEDDING_WORKERS,
+                 max_batch: int = EMBEDDING_MAX_BATCH, max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS,
+                 request_timeout: Optional[float] = None):
+        """
+        Start the worker processes and wait until their models are loaded
+
+        Args:
+            request_timeout: Seconds encode() waits for a result (None waits forever)
+
+        Raises:
+            RuntimeError: if no worker could load a model
+        """
+        self.max_batch = max_batch
+        self.request_timeout = request_timeout
+        self.model_id: Optional[str] = None
+        context = multiprocessing.get_context("spawn")
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(target=_worker_main, name=f"embedding-worker-{i}", daemon=True,
+                            args=(i, backend_name, batch_size, threads, self._requests, self._results,
+                                  max_batch, max_wait_ms / 1000))
+            for i in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        ready = 0
+        errors = []
+        deadline = time.monotonic() + EMBEDDING_START_TIMEOUT
+        while ready + len(errors) < workers:
+            try:
+                message = self._results.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                errors.append("timed out loading the model")
+                break
+            if message[0] == "ready":
+                ready += 1
+                self.model_id = message[2]
+            else:
+                errors.append(message[2])
+        if not ready:
+            self.close()
+            raise RuntimeError(f"Embedding workers failed to start: {'; '.join(errors)}")
+        logger.info(f"Embedding service started: {ready} worker(s), {self.model_id}")
+
+        self._piece_ids = itertools.count()
+        self._pending: Dict[int, tuple] = {}  # piece id -> (job, piece index)
+        self._lock = threading.Lock()
+        self._queue_waits = deque(maxlen=STATS_WINDOW)
+        self._batches = deque(maxlen=STATS_WINDOW)  # (texts, requests, encode seconds)
+        self._counts = {"requests": 0, "texts": 0, "batches": 0, "failed": 0}
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name="embedding-results", daemon=True)
+        self._dispatcher.start()
+
+    def embed_future(self, texts: List[str]) -> Future:
+        """Queue texts for embedding; the future resolves to a (len(texts), dimension) array"""
+        job = _Job(texts, self.max_batch)
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["texts"] += len(texts)
+        if not job.pieces:
+            job.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return job.future
+        for _ in range(min(PIECES_IN_FLIGHT, len(job.pieces))):
+            self._submit_next(job)
+        return job.future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, blocking the calling thread (same interface as an EmbeddingBackend)"""
+        return self.embed_future(texts).result(self.request_timeout)
+
+    def _submit_next(self, job: _Job):
+        """Queue the job's next piece, if any is left"""
+        with self._lock:
+            index = job.next_piece
+            if index >= len(job.pieces):
+                return
+            job.next_piece += 1
+            piece_id = next(self._piece_ids)
+            self._pending[piece_id] = (job, index)
+        self._requests.put((piece_id, job.pieces[index], time.time()))
+
+    def _dispatch(self):
+        """Route worker results to their jobs (runs in a thread)"""
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            kind = message[0]
+            if kind == "batch":
+                with self._lock:
+                    self._counts["batches"] += 1
+                    self._batches.append(message[2:])
+                continue
+            if kind not in ("done", "failed"):
+                continue
+
+            with self._lock:
+                entry = self._pending.pop(message[1], None)
+            if entry is None:
+                continue
+            job, index = entry
+            if job.future.done():
+                continue
+            if kind == "failed":
+                with self._lock:
+                    self._counts["failed"] += 1
+                job.future.set_exception(RuntimeError(f"Embedding worker failed: {message[2]}"))
+                continue
+
+            with self._lock:
+                self._queue_waits.append(message[3])
+            job.results[index] = message[2]
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.future.set_result(np.vstack(job.results))
+            else:
+                self._submit_next(job)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue latency, batch fill and throughput counters"""
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            batches = list(self._batches)
+            stats: Dict[str, Any] = dict(self._counts)
+            stats["pending_pieces"] = len(self._pending)
+        stats.update({
+            "mode": "process",
+            "model": self.model_id,
+            "workers": sum(process.is_alive() for process in self._processes),
+            "max_batch": self.max_batch,
+            "queue_wait_ms": {
+                "mean": round(1000 * sum(waits) / len(waits), 2) if waits else None,
+                "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 2) if waits else None,
+            },
+            "mean_batch_texts": round(sum(b[0] for b in batches) / len(batches), 2) if batches else None,
+            "mean_batch_fill": round(sum(min(1.0, b[0] / self.max_batch) for b in batches) / len(batches), 3) if batches else None,
+            "mean_requests_per_batch": round(sum(b[1] for b in batches) / len(batches), 2) if batches else None,
+        })
+        return stats
+
+    def close(self):
+        """Stop the workers"""
+        if getattr(self, "_closed", False):
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._requests.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
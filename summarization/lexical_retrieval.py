@@ -0,0 +1,230 @@
+#lexical_retrieval.py
+"""
+BM25 lexical retrieval over chunks and fusion with vector rankings.
+
+Lecture questions often hinge on exact terms ("MSI", "snooping", "LRU") that
+MiniLM cosine similarity ranks poorly. ``LexicalIndex`` is an inverted index
+(term -> postings of chunk and term frequency) scored with Okapi BM25, so a
+query only touches the chunks containing its words. ``reciprocal_rank_fusion``
+merges its ranking with the vector ranking; ``RAGSystem.rank_chunks`` uses the
+fused order when given the query text.
+
+Each document's ``LexicalIndex`` is built once and kept with its chunks
+(``document_index.DocumentIndex``); ``JoinedLexicalIndex`` searches the
+indexes of the documents in a request as one, with BM25 statistics over all
+of them, without copying their postings.
+
+``LexicalIndex.rank`` and ``bm25_rank`` rank every chunk and need no model, so
+they also stand in for vector ranking when embeddings are unavailable.
+
+Run this module for recall@k of vector-only, BM25-only and hybrid retrieval
+on questions about the sample lecture in rag_system.py, with hand-labelled
+answering chunks.
+"""
+
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # rank constant of reciprocal rank fusion
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our "
+    "she so that the their them then there these they this to was we were what when where which who why will "
+    "with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words without stop words"""
+    return [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+class LexicalIndex:
+    def __init__(self, texts: List[str], deadline: Optional[float] = None):
+        """
+        Build the inverted index
+
+        Args:
+            texts: Chunk texts
+            deadline: time.monotonic() value by which indexing must finish
+
+        Raises:
+            TimeoutError: if the deadline passes while indexing
+        """
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for i, text in enumerate(texts):
+            if deadline is not None and i % 64 == 0 and time.monotonic() > deadline:
+                raise TimeoutError(f"lexical indexing exceeded its budget after {i}/{len(texts)} chunks")
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+            self.lengths.append(sum(counts.values()))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def _parts(self) -> List[Tuple[int, "LexicalIndex"]]:
+        """(offset of its first chunk, index) of the indexes searched"""
+        return [(0, self)]
+
+    def search(self, query: str, k1: float = BM25_K1, b: float = BM25_B) -> List[Tuple[int, float]]:
+        """(index, BM25 score) of the chunks sharing a word with the query, best first"""
+        count = len(self)
+        parts = self._parts()
+        scores: Dict[int, float] = defaultdict(float)
+        average_length = self.average_length or 1.0
+        for term in set(tokenize(query)):
+            matching = [(offset, index) for offset, index in parts if term in index.postings]
+            frequency = sum(len(index.postings[term]) for _, index in matching)
+            if not frequency:
+                continue
+            idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for offset, index in matching:
+                for i, tf in index.postings[term]:
+                    scores[offset + i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * index.lengths[i] / average_length))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def rank(self, query: str, k1: float = BM25_K1, b: float = BM25_B) -> List[Tuple[int, float]]:
+        """
+        (index, score) for every chunk, highest score first; chunks sharing no
+        word with the query score 0 and keep their document order
+        """
+        matches = self.search(query, k1, b)
+        matched = {i for i, _ in matches}
+        return matches + [(i, 0.0) for i in range(len(self)) if i not in matched]
+
+
+class JoinedLexicalIndex(LexicalIndex):
+    """Several documents' indexes searched as one, the chunks of each numbered on from the previous"""
+
+    def __init__(self, indexes: List[LexicalIndex]):
+        self.parts: List[Tuple[int, LexicalIndex]] = []
+        count = 0
+        for index in indexes:
+            self.parts.append((count, index))
+            count += len(index)
+        self.count = count
+        self.average_length = sum(sum(index.lengths) for index in indexes) / count if count else 0.0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _parts(self) -> List[Tuple[int, LexicalIndex]]:
+        return self.parts
+
+
+def bm25_rank(query: str, texts: List[str], k1: float = BM25_K1, b: float = BM25_B) -> List[Tuple[int, float]]:
+    """
+    Rank texts against a query with BM25
+
+    Returns:
+        (index, score) for every text, highest score first; texts sharing no
+        word with the query score 0 and keep their document order
+    """
+    return LexicalIndex(texts).rank(query, k1, b)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fuse rankings by summing 1 / (k + rank) over the rankings each item appears in
+
+    Args:
+        rankings: Lists of (index, score), best first; only the order is used
+
+    Returns:
+        (index, fused score), best first
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, (i, _) in enumerate(ranking, start=1):
+            fused[i] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+# Questions about the sample lecture in rag_system.py, each with the chunks that answer it,
+# labelled by reading them (75-word chunks every 68 words, as the benchmark below makes them),
+# not by which chunks contain the question's words
+SAMPLE_CHUNK_WORDS, SAMPLE_CHUNK_STEP, SAMPLE_CHUNKS = 75, 68, 77
+LABELLED_QUERIES = [
+    ("What is the MSI protocol?", {52, 53, 54, 55, 56}),
+    ("How does a cache find out another core wrote to its block?", {57, 58, 59, 60, 63}),
+    ("When is the cache simulation project due?", {4, 5}),
+    ("Should LRU or FIFO replacement give the better hit rate?", {12, 13, 25, 38}),
+    ("What does it mean when a line is in the I state?", {54, 55, 56}),
+    ("How does the hit rate change with associativity?", {10, 11, 24, 37}),
+    ("Is everything in an L1 cache also in the L2 cache?", {45}),
+    ("What does cache coherence require when a CPU overwrites a block?", {48, 49, 50, 51}),
+    ("What bits mark a line in the S state?", {53}),
+    ("What is plotted on the axes of the hit rate graphs?", {29, 30}),
+]
+
+
+def _sample_lecture() -> str:
+    """The sample transcript of rag_system.py's demo (read from its source without importing it)"""
+    import ast
+    import os
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_system.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+                and any(getattr(target, "id", None) == "document" for target in node.targets)):
+            return node.value.value
+    raise ValueError("sample lecture not found in rag_system.py")
+
+
+def recall_at_k(ranking: List[Tuple[int, float]], relevant: set, k: int) -> float:
+    """Share of the relevant chunks (at most k) found in the top k"""
+    found = sum(1 for i, _ in ranking[:k] if i in relevant)
+    return found / min(len(relevant), k)
+
+
+if __name__ == "__main__":
+    import logging
+
+    import numpy as np
+
+    from embedding_backends import create_backend
+
+    logging.basicConfig(level=logging.WARNING)
+    # ~100-token chunks with overlap, as RAGSystem.chunk_tokens makes them
+    words = _sample_lecture().split()
+    chunks = [" ".join(words[i:i + SAMPLE_CHUNK_WORDS]) for i in range(0, len(words), SAMPLE_CHUNK_STEP)]
+    if len(chunks) != SAMPLE_CHUNKS:
+        raise SystemExit(f"The sample lecture changed ({len(chunks)} chunks): relabel LABELLED_QUERIES")
+    labelled = LABELLED_QUERIES
+
+    start = time.perf_counter()
+    index = LexicalIndex(chunks)
+    lexical = {query: index.search(query) for query, _ in labelled}
+    lexical_ms = 1000 * (time.perf_counter() - start)
+
+    methods = {"bm25": lexical}
+    backend = create_backend()
+    if backend is None:
+        print("No local embedding model: reporting BM25 only")
+    else:
+        chunk_vectors = backend.encode(chunks)
+        query_vectors = backend.encode([query for query, _ in labelled])
+        vector = {}
+        for (query, _), query_vector in zip(labelled, query_vectors):
+            similarities = chunk_vectors @ query_vector
+            vector[query] = [(int(i), float(similarities[i])) for i in np.argsort(-similarities)]
+        methods = {"vector": vector, "bm25": lexical,
+                   "hybrid": {query: reciprocal_rank_fusion([vector[query], lexical[query]]) for query in vector}}
+
+    print(f"{len(chunks)} chunks, {len(labelled)} labelled queries; "
+          f"BM25 indexing and search took {lexical_ms:.1f} ms in total")
+    for k in (3, 5, 10):
+        scores = {name: np.mean([recall_at_k(rankings[query], relevant, k) for query, relevant in labelled])
+                  for name, rankings in methods.items()}
+        print(f"recall@{k:<2d} " + "  ".join(f"{name} {score:.3f}" for name, score in scores.items()))
@@ -0,0 +1,470 @@
+"""
+Parsing of LLM notecard and quiz responses.
+
+The generation prompts ask for JSON matching ``NOTECARD_SCHEMA`` /
+``QUIZ_SCHEMA`` (see ``json_format_instructions``). ``parse_notecards`` and
+``parse_quiz`` read a response in a single pass and fall through three modes:
+
+1. ``json``: the first JSON value in the response; code fences and prose
+   around it are ignored.
+2. ``repaired``: JSON cut off by the token limit, or with trailing commas, is
+   closed after the last complete item, so one truncated card does not throw
+   away the ones before it.
+3. ``legacy``: ``FRONT:``/``BACK:`` and ``QUESTION:``/``A:``-``D:``/``CORRECT:``
+   blocks, for models that ignore the JSON instructions.
+
+A response that yields no items counts as ``failed``. Outcomes are counted
+per kind; ``parse_stats`` reports them with the failure rate.
+
+``parse_batch`` reads responses to packed prompts covering several sources
+(``batch_format_instructions``), keyed by ``source_id``; the legacy mode
+there expects a ``SOURCE: <id>`` line before each source's blocks.
+
+Both services parse with this module. ``backend/llm_output_parser.py`` and
+``summarization/llm_output_parser.py`` are identical copies; edit both
+(``backend/test_shared_modules.py`` compares them).
+"""
+
+import json
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+NOTECARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "cards": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "front": {"type": "string"},
+                    "back": {"type": "string"}
+                },
+                "required": ["front", "back"]
+            }
+        }
+    },
+    "required": ["cards"]
+}
+
+QUIZ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+                    "correct_index": {"type": "integer", "minimum": 0, "maximum": 3}
+                },
+                "required": ["question", "options", "correct_index"]
+            }
+        }
+    },
+    "required": ["questions"]
+}
+
+_EXAMPLES = {
+    "notecards": {"cards": [{"front": "What are the key characteristics of microservices architecture?",
+                             "back": "Small, independently deployable services with a single responsibility each."}]},
+    "quiz": {"questions": [{"question": "Which characteristic best defines microservices architecture?",
+                            "options": ["Tightly coupled services", "Independently deployable services",
+                                        "One shared database", "Simultaneous deployment"],
+                            "correct_index": 1}]},
+}
+
+_ITEM_KEYS = {"notecards": "cards", "quiz": "questions"}
+
+OUTCOMES = ("json", "repaired", "legacy", "failed")
+_stats = {"notecards": Counter(), "quiz": Counter()}
+_stats_lock = threading.Lock()
+
+_FENCE = re.compile(r'```(?:json)?', re.IGNORECASE)
+_CARD_BLOCK = re.compile(r'FRONT:\s*(.*?)\s*BACK:\s*(.*?)\s*(?=FRONT:|\Z)', re.DOTALL)
+_QUESTION_BLOCK = re.compile(r'QUESTION:\s*(.*?)(?=QUESTION:|\Z)', re.DOTALL)
+_OPTION = re.compile(r'(?:^|\n)\s*\(?([A-D])[:.)]\s*(.*?)\s*(?=\n\s*\(?[A-D][:.)]|\n\s*CORRECT:|\Z)', re.DOTALL)
+_CORRECT = re.compile(r'CORRECT:\s*\(?([A-D])', re.IGNORECASE)
+_LETTER = re.compile(r'^\s*(?:option\s+)?\(?([A-Da-d])\)?(?:[:.)\s]|$)')
+_SOURCE_LINE = re.compile(r'^\s*SOURCE(?:_ID)?:\s*"?([^"\s]+)"?\s*$', re.MULTILINE)
+
+
+def json_format_instructions(kind: str) -> str:
+    """
+    Output format section for a generation prompt
+
+    Args:
+        kind: ``"notecards"`` or ``"quiz"``
+
+    Returns:
+        Instructions asking for JSON that matches the kind's schema, with an example
+    """
+    schema = NOTECARD_SCHEMA if kind == "notecards" else QUIZ_SCHEMA
+    return (
+        "Respond with ONLY a JSON object, no other text, matching this JSON schema:\n"
+        f"{json.dumps(schema)}\n"
+        f"Example: {json.dumps(_EXAMPLES[kind])}"
+    )
+
+
+def batch_schema(kind: str) -> Dict[str, Any]:
+    """Schema of a packed response: one entry per source with that source's items"""
+    schema = NOTECARD_SCHEMA if kind == "notecards" else QUIZ_SCHEMA
+    key = _ITEM_KEYS[kind]
+    return {
+        "type": "object",
+        "properties": {
+            "sources": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"source_id": {"type": "string"}, key: schema["properties"][key]},
+                    "required": ["source_id", key]
+                }
+            }
+        },
+        "required": ["sources"]
+    }
+
+
+def batch_format_instructions(kind: str, source_ids: List[str]) -> str:
+    """
+    Output format section for a prompt that packs several sources
+
+    Args:
+        kind: ``"notecards"`` or ``"quiz"``
+        source_ids: Ids of the packed sources, in prompt order
+
+    Returns:
+        Instructions asking for one JSON entry per source, keyed by ``source_id``
+    """
+    example = {"sources": [dict(source_id=source_ids[0], **_EXAMPLES[kind])]}
+    return (
+        "Respond with ONLY a JSON object, no other text, matching this JSON schema:\n"
+        f"{json.dumps(batch_schema(kind))}\n"
+        f"Include exactly one entry per source, with source_id exactly as given: {json.dumps(source_ids)}\n"
+        f"Example: {json.dumps(example)}"
+    )
+
+
+def _scan(text: str, start: int) -> Tuple[str, Optional[str]]:
+    """
+    Read the JSON value starting at ``start`` in one pass
+
+    Returns the value's text with trailing commas dropped, and a repaired
+    version closed after the last complete item if the value is cut off
+    (None when it is complete).
+    """
+    out = []
+    stack = []
+    in_string = escaped = False
+    last_item_end = None  # (length of out, open brackets) after the last complete object inside an array
+    pending_comma = None
+
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch in ' \t\r\n':
+            if pending_comma is None:
+                out.append(ch)
+            continue
+        if ch in '}]':
+            pending_comma = None  # trailing comma before a closing bracket
+            if not stack:
+                break
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out), None
+            if ch == '}' and stack[-1] == ']':
+                last_item_end = (len(out), list(stack))
+            continue
+        if pending_comma is not None:
+            out.append(',')
+            pending_comma = None
+        if ch == ',':
+            pending_comma = True
+            continue
+        out.append(ch)
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+
+    if last_item_end is None:
+        return "".join(out), None
+    length, open_brackets = last_item_end
+    return "".join(out), "".join(out[:length]) + "".join(reversed(open_brackets))
+
+
+def _load_json(text: str) -> Tuple[Any, Optional[str]]:
+    """Return the first JSON value in the text and the mode it was read with"""
+    text = _FENCE.sub('', text)
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return None, None
+    start = min(starts)
+
+    try:
+        return json.JSONDecoder().raw_decode(text, start)[0], "json"
+    except ValueError:
+        pass
+
+    cleaned, repaired = _scan(text, start)
+    for candidate in (cleaned, repaired):
+        if candidate:
+            try:
+                return json.loads(candidate), "repaired"
+            except ValueError:
+                continue
+    return None, None
+
+
+def _items(value: Any, keys: Tuple[str, ...]) -> List[Any]:
+    """Find the list of items in a parsed response"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        for key in keys:
+            if isinstance(value.get(key), list):
+                return value[key]
+        for item in value.values():
+            if isinstance(item, list):
+                return item
+        if any(key in value for key in ("front", "question")):
+            return [value]
+    return []
+
+
+def _text(item: Dict[str, Any], *keys: str) -> str:
+    for key in keys:
+        value = item.get(key)
+        if isinstance(value, (str, int, float)) and str(value).strip():
+            return str(value).strip()
+    return ""
+
+
+def _record(kind: str, outcome: str, text: str):
+    with _stats_lock:
+        _stats[kind][outcome] += 1
+    if outcome == "failed":
+        logging.warning(f"Could not parse LLM {kind} response: {text[:200]!r}")
+
+
+def parse_notecards(text: str, limit: Optional[int] = None, id_prefix: str = "card") -> Tuple[List[Dict[str, str]], str]:
+    """
+    Parse notecards from an LLM response
+
+    Args:
+        text: Model response
+        limit: Maximum number of cards to return
+        id_prefix: Cards get ids ``f"{id_prefix}_{i}"``
+
+    Returns:
+        Tuple of (cards with ``id``, ``front`` and ``back``, outcome)
+    """
+    text = text or ""
+    value, mode = _load_json(text)
+    pairs = _json_cards(value) if mode else []
+    if not pairs:
+        mode = "legacy"
+        pairs = _legacy_cards(text)
+
+    outcome = mode if pairs else "failed"
+    _record("notecards", outcome, text)
+    return _numbered_cards(pairs, limit, id_prefix), outcome
+
+
+def _json_cards(value: Any) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in _items(value, ("cards", "notecards", "flashcards")):
+        if isinstance(item, dict):
+            front = _text(item, "front", "question", "term")
+            back = _text(item, "back", "answer", "definition", "explanation")
+            if front and back:
+                pairs.append((front, back))
+    return pairs
+
+
+def _legacy_cards(text: str) -> List[Tuple[str, str]]:
+    return [(front, back) for front, back in _CARD_BLOCK.findall(text) if front and back]
+
+
+def _numbered_cards(pairs: List[Tuple[str, str]], limit: Optional[int], id_prefix: str) -> List[Dict[str, str]]:
+    pairs = pairs[:limit] if limit is not None else pairs
+    return [{"id": f"{id_prefix}_{i}", "front": front, "back": back} for i, (front, back) in enumerate(pairs)]
+
+
+def _correct_index(item: Dict[str, Any], options: List[str]) -> int:
+    """Read the correct option from an index, a letter or the option text (default 0)"""
+    for key in ("correct_index", "correctIndex", "correct", "answer", "correct_answer"):
+        value = item.get(key)
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, int):
+            return value if 0 <= value < len(options) else 0
+        if isinstance(value, str):
+            if value.strip() in options:
+                return options.index(value.strip())
+            letter = _LETTER.match(value)
+            if letter:
+                index = ord(letter.group(1).upper()) - ord('A')
+                return index if index < len(options) else 0
+            if value.strip().isdigit() and int(value) < len(options):
+                return int(value)
+    return 0
+
+
+def _question(question: str, options: List[str], correct_idx: int, number: int) -> Dict[str, Any]:
+    # Always exactly 4 options, like the frontend expects
+    options = options[:4]
+    while len(options) < 4:
+        options.append(f"Option {len(options)+1} for question {number}")
+    return {"question": question, "options": options, "correctIndex": correct_idx if correct_idx < 4 else 0}
+
+
+def parse_quiz(text: str, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Parse multiple-choice questions from an LLM response
+
+    Args:
+        text: Model response
+        limit: Maximum number of questions to return
+
+    Returns:
+        Tuple of (questions with ``question``, ``options`` and ``correctIndex``, outcome)
+    """
+    text = text or ""
+    value, mode = _load_json(text)
+    questions = _json_questions(value) if mode else []
+    if not questions:
+        mode = "legacy"
+        questions = _legacy_questions(text)
+
+    outcome = mode if questions else "failed"
+    _record("quiz", outcome, text)
+    return (questions[:limit] if limit is not None else questions), outcome
+
+
+def _json_questions(value: Any) -> List[Dict[str, Any]]:
+    questions = []
+    for item in _items(value, ("questions", "quiz")):
+        if not isinstance(item, dict):
+            continue
+        question = _text(item, "question", "prompt", "text")
+        options = item.get("options") or item.get("choices") or []
+        if isinstance(options, dict):
+            options = [options[key] for key in sorted(options)]
+        options = [str(option).strip() for option in options if str(option).strip()]
+        if question and len(options) >= 2:
+            questions.append(_question(question, options, _correct_index(item, options), len(questions) + 1))
+    return questions
+
+
+def _legacy_questions(text: str) -> List[Dict[str, Any]]:
+    questions = []
+    for block in _QUESTION_BLOCK.findall(text):
+        options = [option for _, option in _OPTION.findall(block)]
+        question = _OPTION.split(block, maxsplit=1)[0].strip()
+        if not question or not options:
+            continue
+        correct = _CORRECT.search(block)
+        correct_idx = ord(correct.group(1).upper()) - ord('A') if correct else 0
+        questions.append(_question(question, options, correct_idx, len(questions) + 1))
+    return questions
+
+
+def parse_batch(text: str, kind: str, source_ids: List[str], limit: Optional[int] = None,
+                id_prefix: str = "card") -> Tuple[Dict[str, List[Dict[str, Any]]], str]:
+    """
+    Parse the response to a packed prompt into per-source items
+
+    Args:
+        text: Model response
+        kind: ``"notecards"`` or ``"quiz"``
+        source_ids: Ids of the packed sources
+        limit: Maximum number of items per source
+        id_prefix: Cards get ids ``f"{id_prefix}_{source_id}_{i}"``
+
+    Returns:
+        Tuple of ({source_id: items} for every source, outcome). Sources the
+        model skipped map to an empty list.
+    """
+    text = text or ""
+    json_items = _json_cards if kind == "notecards" else _json_questions
+    legacy_items = _legacy_cards if kind == "notecards" else _legacy_questions
+    wanted = {str(source_id) for source_id in source_ids}
+
+    value, mode = _load_json(text)
+    found = {}
+    if mode:
+        if isinstance(value, dict) and wanted & set(value):
+            # The key names the source, even if the entry repeats (or misstates) its source_id
+            entries = [{**(item if isinstance(item, dict) else {_ITEM_KEYS[kind]: item}), "source_id": key}
+                       for key, item in value.items() if key in wanted]
+        else:
+            entries = _items(value, ("sources", "results"))
+        for entry in entries:
+            if isinstance(entry, dict):
+                source_id = str(entry.get("source_id") or entry.get("id") or "")
+                if source_id in wanted and source_id not in found:
+                    found[source_id] = json_items(entry)
+    if not any(found.values()):
+        mode = "legacy"
+        parts = _SOURCE_LINE.split(text)
+        found = {source_id: legacy_items(section) for source_id, section in zip(parts[1::2], parts[2::2])
+                 if source_id in wanted}
+
+    outcome = mode if any(found.values()) else "failed"
+    _record(kind, outcome, text)
+    results = {}
+    for source_id in source_ids:
+        items = found.get(str(source_id), [])
+        if kind == "notecards":
+            results[source_id] = _numbered_cards(items, limit, f"{id_prefix}_{source_id}")
+        else:
+            results[source_id] = items[:limit] if limit is not None else items
+    return results, outcome
+
+
+def parse_stats() -> Dict[str, Dict[str, Any]]:
+    """Parse outcome counts and failure rate per kind since startup"""
+    with _stats_lock:
+        report = {}
+        for kind, counts in _stats.items():
+            total = sum(counts.values())
+            report[kind] = {outcome: counts[outcome] for outcome in OUTCOMES}
+            report[kind]["total"] = total
+            report[kind]["failure_rate"] = counts["failed"] / total if total else 0.0
+        return report
+
+
+if __name__ == "__main__":
+    samples = [
+        ("notecards", '```json\n{"cards": [{"front": "What is a cache?", "back": "Fast memory."}]}\n```'),
+        ("notecards", '{"cards": [{"front": "A?", "back": "a",}, {"front": "B?", "back": "b"}, {"front": "C?", "ba'),
+        ("notecards", "FRONT: What is a TLB?\nBACK: A cache of page table entries.\nFRONT: What is MESI?\nBACK: A coherence protocol."),
+        ("quiz", '{"questions": [{"question": "Q1?", "options": ["a", "b", "c", "d"], "correct_index": 2}, {"question": "Q2?", "opt'),
+        ("quiz", "QUESTION: Which is fastest?\nA: Disk\nB: Cache\nC: Network\nD: Tape\nCORRECT: B"),
+        ("quiz", "Sorry, I cannot help with that."),
+    ]
+    for kind, sample in samples:
+        items, outcome = parse_notecards(sample) if kind == "notecards" else parse_quiz(sample)
+        print(f"{kind:9s} {outcome:8s} {items}")
+
+    packed = ('{"sources": [{"source_id": "a1", "cards": [{"front": "A?", "back": "a"}]}, '
+              '{"source_id": "a2", "cards": [{"front": "B?", "back": "b"}, {"front": "C?"')
+    print("batch    ", *parse_batch(packed, "notecards", ["a1", "a2", "a3"]))
+    print(parse_stats())
@@ -0,0 +1,356 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Stage timings used to be logged or returned in one response and then lost.
+This module keeps them: ``counter``, ``gauge`` and ``histogram`` register
+metrics in ``REGISTRY``, and ``GET /metrics`` renders it in the Prometheus
+text exposition format (version 0.0.4), so any Prometheus-compatible scraper
+can aggregate latency percentiles, cache hit ratios and fallback rates.
+
+The hot path stays cheap: ``metric.labels(...)`` returns a child that can be
+kept in a module constant, and recording a value is a bisect over the bucket
+bounds plus two additions under a per-child lock (about a microsecond; run
+this module to measure it). Values that components already count (cache
+statistics, for instance) are not counted twice: ``REGISTRY.collect`` takes a
+callable that reads them when ``/metrics`` is scraped.
+
+``MetricsMiddleware`` is a plain ASGI middleware recording requests in
+flight and request latency per route template (``/lectures/{recording_id}``,
+not the raw path, to keep the number of series bounded).
+
+Each process has its own registry; with several uvicorn workers, scrape each
+worker or run one.
+
+The backend and the RAG service each ship a copy (``backend/metrics.py``,
+``summarization/metrics.py``); ``backend/test_shared_modules.py`` checks
+that they are identical.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from cache lookups to LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (name, type, help, [(labels, value)]) as returned by collectors
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    @contextmanager
+    def track(self):
+        """Count the enclosed block as in progress"""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # per bucket, not cumulative; the last is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Metric:
+    """A metric family: one child per combination of label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._unlabelled = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """
+        The child for these label values (positional, or by name)
+
+        Raises:
+            ValueError: if the values don't match the metric's label names
+        """
+        if labels:
+            if values or set(labels) != set(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+            values = tuple(labels[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, values)), child) for values, child in self._children.items()]
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(sample name, labels, value) of every child"""
+        return [(self.name, labels, child.value) for labels, child in self._items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled.dec(amount)
+
+    def set(self, value: float):
+        self._unlabelled.set(value)
+
+    def track(self):
+        return self._unlabelled.track()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def time(self):
+        return self._unlabelled.time()
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, child in self._items():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, or return the one already registered under its name"""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def collect(self, collector: Callable[[], Iterable[Family]]):
+        """Add a callable returning (name, type, help, [(labels, value)]) families, read at scrape time"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                         for name, labels, value in metric.samples())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:  # a broken collector must not take /metrics down
+                lines.append(f"# collector {getattr(collector, '__name__', collector)} failed: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {_escape(help)}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                             for labels, value in samples if value is not None)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+HTTP_IN_PROGRESS = gauge("http_requests_in_progress", "HTTP requests being handled")
+HTTP_DURATION = histogram("http_request_duration_seconds", "HTTP request latency until the last body byte",
+                          ("method", "route", "status"))
+
+
+def route_template(scope) -> str:
+    """The matched route with its path parameters as placeholders, e.g. /lectures/{recording_id}"""
+    if "endpoint" not in scope:
+        return "unmatched"
+    path = scope.get("root_path", "") + scope["path"]
+    for name, value in (scope.get("path_params") or {}).items():
+        path = path.replace(str(value), "{" + name + "}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording requests in flight and their latency
+
+    Add it before the other middlewares (so it runs innermost and sees the
+    routing result in the scope).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            HTTP_DURATION.labels(scope["method"], route_template(scope), status[0]).observe(time.perf_counter() - start)
+
+
+def metrics_response():
+    """``GET /metrics`` response of the registry"""
+    from starlette.responses import Response
+
+    # As a header: older Starlette appends a second charset to text media types
+    return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+if __name__ == "__main__":
+    # Hot-path overhead, then a sample of the output
+    stage = histogram("demo_stage_seconds", "Demo stage latency", ("stage",))
+    hits = counter("demo_cache_hits_total", "Demo cache hits")
+    child = stage.labels("chunking")
+    runs = 200_000
+    for name, record in (("histogram child observe", lambda: child.observe(0.042)),
+                         ("histogram labels().observe", lambda: stage.labels("embedding").observe(0.3)),
+                         ("counter inc", hits.inc)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            record()
+        print(f"{name:28s} {1e9 * (time.perf_counter() - start) / runs:6.0f} ns per call")
+
+    threads = [threading.Thread(target=lambda: [child.observe(0.01) for _ in range(10_000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert child.counts[1] == 80_000  # no lost updates across threads
+    REGISTRY.collect(lambda: [("demo_queue_depth", "gauge", "Demo collector", [({}, 3)])])
+    print(REGISTRY.render())
@@ -5,7 +5,7 @@ RAG System CLI - A command-line interface for interacting with your RAG API.
 Usage:
   rag_cli.py upload <file_path> [--title=<title>] [--type=<type>] [--course-id=<course_id>]
   rag_cli.py list-docs [--type=<type>] [--course-id=<course_id>]
-  rag_cli.py query <query_text> [--doc-id=<id>]... [--top-k=<num>]
+  rag_cli.py query <query_text>... [--doc-id=<id>]... [--top-k=<num>]
   rag_cli.py delete-doc <doc_id>
   rag_cli.py auth login [--email=<email>] [--password=<password>]
   rag_cli.py auth token
@@ -265,8 +265,8 @@ def list_documents(doc_type=None, course_id=None):
         console.print(f"[bold red]Error:[/bold red] {str(e)}")
         return False
 
-def submit_query(query_text, doc_ids, top_k):
-    """Submit a query to the RAG system."""
+def submit_query(query_texts, doc_ids, top_k):
+    """Submit queries to the RAG system (several go in one /query/batch call over the same documents)."""
     # Check if doc_ids is empty
     if not doc_ids:
         console.print("[bold yellow]Warning:[/bold yellow] No document IDs provided. You should specify at least one document with --doc-id")
@@ -298,6 +298,10 @@ def submit_query(query_text, doc_ids, top_k):
             console.print(f"[bold red]Error:[/bold red] {str(e)}")
             return False
     
+    if len(query_texts) > 1:
+        return submit_query_batch(query_texts, doc_ids, top_k)
+    query_text = query_texts[0]
+    
     payload = {
         "query": query_text,
         "document_ids": doc_ids,
@@ -361,6 +365,47 @@ def submit_query(query_text, doc_ids, top_k):
         console.print(f"[bold red]Error:[/bold red] {str(e)}")
         return False
 
+def submit_query_batch(query_texts, doc_ids, top_k):
+    """Submit several queries over the same documents in one request."""
+    payload = {
+        "queries": [{"query": query_text, "top_k": int(top_k)} for query_text in query_texts],
+        "document_ids": doc_ids
+    }
+    
+    logger.info(f"Submitting {len(query_texts)} queries in one batch")
+    
+    try:
+        with Progress() as progress:
+            task = progress.add_task(f"[cyan]Processing {len(query_texts)} queries...", total=1)
+            response = requests.post(
+                f"{API_BASE_URL}/query/batch",
+                json=payload,
+                headers={"Content-Type": "application/json", **get_auth_headers()},
+                timeout=120
+            )
+            progress.update(task, advance=1)
+        
+        if response.status_code != 200:
+            logger.error(f"Batch query submission failed: HTTP {response.status_code} - {response.text}")
+            console.print(f"[bold red]Error:[/bold red] {response.status_code} - {response.text}")
+            return False
+        
+        batch = response.json()
+        for result in batch["results"]:
+            display_query_result(result)
+        console.print(f"[bold]Batch processing time:[/bold] {batch['processing_time']:.2f} seconds")
+        return all(result.get("success") for result in batch["results"])
+    
+    except requests.exceptions.Timeout:
+        logger.error("Batch request timed out")
+        console.print("[bold red]Error:[/bold red] Request timed out")
+        return False
+        
+    except Exception as e:
+        logger.error(f"Batch query error: {str(e)}", exc_info=True)
+        console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        return False
+
 def display_query_result(result):
     """Display the results of a query in a nicely formatted way."""
     # Header section
@@ -464,7 +509,7 @@ def main():
                 arguments["--course-id"]
             )
         elif arguments["query"]:
-            logger.info(f"Command: query '{arguments['<query_text>']}'")
+            logger.info(f"Command: query {arguments['<query_text>']}")
             success = submit_query(
                 arguments["<query_text>"],
                 arguments["--doc-id"],
@@ -5,13 +5,25 @@ import requests
 import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Callable, Iterator, Optional, Union
 import logging
 import json
 import tiktoken
 import backoff
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from supabase_client import SupabaseClient
+from context_builder import build_context, context_budget
+from document_index import DocumentIndex, DocumentIndexCache
+from embedding_cache import QueryEmbeddingCache
+from embedding_backends import EMBEDDING_MODEL_NAME, create_backend
+from embedding_health import EmbeddingHealth, EmbeddingUnavailableError
+from embedding_service import EmbeddingService
+from lexical_retrieval import JoinedLexicalIndex, LexicalIndex, reciprocal_rank_fusion
+from metrics import REGISTRY, counter, gauge, histogram
+from tracing import bind, record_span, span
+from remote_embeddings import RemoteEmbedder
 
 # Import our custom logging configuration
 from logging_config import setup_logging
@@ -31,32 +43,153 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 logger.info(f"OpenAI API Key loaded: {'Yes' if OPENAI_API_KEY else 'No'}")
 logger.info(f"OpenRouter API Key loaded: {'Yes' if OPENROUTER_API_KEY else 'No'}")
 
-# Initialize OpenAI client for embeddings
+# Embedding models (also part of the query embedding cache key)
+LOCAL_EMBEDDING_MODEL = EMBEDDING_MODEL_NAME
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Initialize OpenAI client for embeddings (sent in concurrent batches paced by the
+# API's rate-limit headers, see remote_embeddings)
 openai_client = None
+remote_embedder = None
 if OPENAI_API_KEY:
     try:
         openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        remote_embedder = RemoteEmbedder(openai_client, OPENAI_EMBEDDING_MODEL)
         logger.info("OpenAI client initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {e}")
 
-# Initialize Sentence Transformers for local embeddings
-sentence_transformer = None
-try:
-    from sentence_transformers import SentenceTransformer
-    sentence_transformer = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    logger.info("Sentence Transformers model loaded successfully")
-except ImportError:
-    logger.warning("Sentence Transformers not installed. Run 'pip install sentence-transformers'")
-except Exception as e:
-    logger.error(f"Error loading Sentence Transformers model: {e}")
+# Local embeddings run in worker processes (EMBEDDING_SERVICE=process, see embedding_service)
+# or in this process (inline); EMBEDDING_BACKEND picks the model runtime
+EMBEDDING_SERVICE = os.getenv("EMBEDDING_SERVICE", "process")
+EMBEDDING_REQUEST_TIMEOUT = float(os.getenv("EMBEDDING_REQUEST_TIMEOUT", "120"))
+_local_embedder = None  # EmbeddingService or EmbeddingBackend, created on first use
+_local_embedder_loaded = False
+_local_embedder_lock = threading.Lock()
 
 # Define constants
 EMBEDDING_DIMENSION = 384  # Matches Sentence Transformers model dimension
 CHUNK_SIZE = 100
 CHUNK_OVERLAP = 10
 MAX_RETRIES = 3
+DEFAULT_MAX_TOKENS = 500  # response length limit for generate_response
+DEFAULT_MODEL = "meta-llama/llama-3-8b-instruct"
+LLM_CONCURRENCY = int(os.getenv("RAG_LLM_CONCURRENCY", "4"))  # LLM calls in flight for a query batch
 USE_LOCAL_EMBEDDINGS = True  # Set to False to use OpenAI embeddings instead
+# Fuse BM25 with vector similarity (reciprocal rank fusion) when ranking chunks for a query;
+# the lexical side is dropped if indexing the chunks takes longer than its budget
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+LEXICAL_BUDGET_MS = float(os.getenv("LEXICAL_BUDGET_MS", "50"))
+
+# Canned summarization prompt (see the demo below); recurring queries like this are
+# pinned in the query embedding cache
+LECTURE_SUMMARY_QUERY = "Please concisely summarize this lecture including key points and important updates if there are any. Avoid using headers, section breaks, or any areas of your response that don’t have any added information in addition to headers such as: “Here is a concise summary of the lecture:”. Include key dates, exam information, anything mentioned as important or necessary, and skip over anything that is not important or repeated if applicable. This should be well formatted in a concise manner that discusses key points and additionally lists more info for key details and main points under them. All details of the lecture should be covered and it is imperative that you don't miss any details. If there are any details that you can not parse or ideas that aren’t clear, advise the user to review the lecture or check to make sure that the information is correct. You should avoid listing any information that is not relevant or where you have no info to share."
+
+# Query vectors shared by every RAGSystem in the process and, through SQLite, across workers
+query_embedding_cache = QueryEmbeddingCache()
+pinned_queries = [LECTURE_SUMMARY_QUERY]
+query_embedding_cache.pin(OPENAI_EMBEDDING_MODEL, pinned_queries)
+
+# Chunks and chunk embeddings of recently queried documents, keyed by content
+document_indexes = DocumentIndexCache()
+
+# Outcome of the local and OpenAI embedding paths; when both fail, retrieval falls back to BM25
+embedding_health = EmbeddingHealth()
+
+# Pipeline metrics (GET /metrics). Stages shared by a query batch are observed once per batch.
+STAGE_SECONDS = histogram("rag_stage_seconds", "RAG pipeline stage latency", ("stage",))
+CHUNKING_SECONDS, EMBEDDING_SECONDS, RANKING_SECONDS, CONTEXT_SECONDS, RESPONSE_SECONDS, QUERY_SECONDS = (
+    STAGE_SECONDS.labels(stage) for stage in ("chunking", "embedding", "retrieval", "context", "response", "total"))
+QUERIES = counter("rag_queries_total", "RAG queries by retrieval mode and outcome", ("retrieval", "outcome"))
+EMBEDDING_CALLS = counter("rag_embedding_calls_total",
+                          "Embedding calls per path and outcome; an openai call after a local failure or skip is a fallback",
+                          ("path", "outcome"))
+PIPELINES_IN_PROGRESS = gauge("rag_pipelines_in_progress", "Documents being processed (a query batch counts once)")
+LLM_IN_PROGRESS = gauge("rag_llm_calls_in_progress", "LLM calls in flight")
+
+def _collect_metrics():
+    """Counters kept by the caches and embedding paths, read at scrape time"""
+    query_cache = query_embedding_cache.stats()
+    index = document_indexes.stats()
+    families = [
+        ("rag_query_embedding_cache_lookups_total", "counter", "Query embedding cache lookups by result",
+         [({"result": result}, query_cache[key]) for result, key in
+          (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))]),
+        ("rag_document_index_lookups_total", "counter", "Per-document index cache lookups by result",
+         [({"result": "hit"}, index["hits"]), ({"result": "miss"}, index["misses"])]),
+        ("rag_document_index_embedding_lookups_total", "counter", "Cached chunk embedding lookups by result",
+         [({"result": "hit"}, index["embedding_hits"]), ({"result": "miss"}, index["embedding_misses"])]),
+        ("rag_document_index_documents", "gauge", "Documents in the per-document index cache", [({}, index["documents"])]),
+        ("rag_document_index_lexical_builds_total", "counter", "Per-document BM25 indexes built", [({}, index["lexical_builds"])]),
+        ("rag_degraded_requests_total", "counter", "Requests ranked with BM25 because embeddings were unavailable",
+         [({}, embedding_health.stats()["degraded_requests"])]),
+    ]
+    if remote_embedder:
+        remote = remote_embedder.stats()
+        families += [
+            ("rag_openai_embedding_requests_total", "counter", "OpenAI embedding requests sent", [({}, remote["requests"])]),
+            ("rag_openai_embedding_rate_limited_total", "counter", "OpenAI embedding 429 responses", [({}, remote["rate_limited"])]),
+            ("rag_openai_embedding_rate_limit_wait_seconds_total", "counter", "Time spent waiting for the rate limit",
+             [({}, remote["rate_limit_wait_seconds"])]),
+        ]
+    if isinstance(_local_embedder, EmbeddingService):
+        service = _local_embedder.stats()
+        families.append(("rag_embedding_service_pending_pieces", "gauge", "Embedding work queued for the worker processes",
+                         [({}, service["pending_pieces"])]))
+    return families
+
+REGISTRY.collect(_collect_metrics)
+
+def local_embedder():
+    """
+    The local embedding service or in-process backend, loaded on first use.
+    
+    Starting worker processes at import time would also run in spawned children,
+    so the model is loaded here (app.py starts it in the background at startup).
+    
+    Returns:
+        Object with encode(texts) and model_id, or None if no local model is available
+    """
+    global _local_embedder, _local_embedder_loaded
+    with _local_embedder_lock:
+        if not _local_embedder_loaded:
+            _local_embedder_loaded = True
+            if EMBEDDING_SERVICE == "process":
+                try:
+                    _local_embedder = EmbeddingService(request_timeout=EMBEDDING_REQUEST_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Embedding worker processes unavailable, embedding in process: {e}")
+            if _local_embedder is None:
+                _local_embedder = create_backend()
+            if _local_embedder is not None:
+                query_embedding_cache.pin(_local_embedder.model_id, pinned_queries)
+        return _local_embedder
+
+def document_index_stats() -> Dict[str, Any]:
+    """Documents and chunks held by the per-document index cache, and its hit counts"""
+    return document_indexes.stats()
+
+def close_embeddings():
+    """Stop the embedding worker processes, if running"""
+    if isinstance(_local_embedder, EmbeddingService):
+        _local_embedder.close()
+
+def embedding_stats() -> Dict[str, Any]:
+    """Embedding status and path health without waiting for the model to load"""
+    health = embedding_health.stats()
+    if not _local_embedder_loaded or _local_embedder_lock.locked():
+        return {"mode": "loading" if _local_embedder_loaded else "not started", "health": health}
+    if _local_embedder is None:
+        stats = {"mode": "openai", **remote_embedder.stats()} if remote_embedder else {"mode": "unavailable"}
+    elif isinstance(_local_embedder, EmbeddingService):
+        stats = _local_embedder.stats()
+    else:
+        stats = {"mode": "inline", "model": _local_embedder.model_id}
+    stats["health"] = health
+    return stats
+
+class _PathFailed(RuntimeError):
+    """An embedding path failed (already recorded in embedding_health)"""
 
 class RAGSystem:
     def __init__(self):
@@ -73,6 +206,53 @@ class RAGSystem:
             logger.debug(traceback.format_exc())
             raise
 
+    def chunk_tokens(self, text: str) -> List[List[int]]:
+        """Split text into overlapping chunks of token ids."""
+        tokens = self.encoder.encode(text)
+        chunks = []
+        
+        i = 0
+        while i < len(tokens):
+            # Get chunk_size tokens
+            chunk_end = min(i + CHUNK_SIZE, len(tokens))
+            chunks.append(tokens[i:chunk_end])
+            
+            # Move to next chunk with overlap
+            i += CHUNK_SIZE - CHUNK_OVERLAP
+            
+            # Avoid getting stuck
+            if i >= len(tokens) or i < 0:
+                break
+        return chunks
+
+    def document_chunks(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Chunk a document for its retrieval index.
+        
+        Returns:
+            Dicts with position, tokens, text, and the start and end character
+            offsets of the chunk in the document
+        """
+        tokens = self.encoder.encode(text)
+        if hasattr(self.encoder, "decode_with_offsets"):
+            decoded, offsets = self.encoder.decode_with_offsets(tokens)
+        else:
+            offsets, decoded = [], ""
+            for token in tokens:
+                offsets.append(len(decoded))
+                decoded += self.encoder.decode([token])
+        offsets = offsets + [len(decoded)]
+        
+        # Same windows as chunk_tokens, with the character span of each
+        chunks = []
+        for position, start in enumerate(range(0, len(tokens), CHUNK_SIZE - CHUNK_OVERLAP)):
+            end = min(start + CHUNK_SIZE, len(tokens))
+            chunks.append({"position": position, "tokens": tokens[start:end], "text": self.encoder.decode(tokens[start:end]),
+                           "start": offsets[start], "end": offsets[end]})
+            if end == len(tokens):
+                break
+        return chunks
+
     def chunk_text(self, text: str) -> List[str]:
         """Split text into overlapping chunks based on token count."""
         if not text:
@@ -80,23 +260,7 @@ class RAGSystem:
             return []
             
         try:
-            tokens = self.encoder.encode(text)
-            chunks = []
-            
-            i = 0
-            while i < len(tokens):
-                # Get chunk_size tokens
-                chunk_end = min(i + CHUNK_SIZE, len(tokens))
-                chunk = self.encoder.decode(tokens[i:chunk_end])
-                chunks.append(chunk)
-                
-                # Move to next chunk with overlap
-                i += CHUNK_SIZE - CHUNK_OVERLAP
-                
-                # Avoid getting stuck
-                if i >= len(tokens) or i < 0:
-                    break
-            
+            chunks = [self.encoder.decode(tokens) for tokens in self.chunk_tokens(text)]
             logger.info(f"Text split into {len(chunks)} chunks")
             return chunks
         
@@ -111,64 +275,186 @@ class RAGSystem:
             logger.info(f"Used fallback chunking method: {len(chunks)} chunks")
             return chunks
 
+    def embed_for_retrieval(self, indexes: List[DocumentIndex], queries: List[str]) -> Tuple[np.ndarray, List[List[float]]]:
+        """
+        Chunk embeddings of documents and embeddings of queries, from the same model.
+        
+        The model is that of the first healthy embedding path; if the path fails,
+        chunks and queries are both embedded again on the next one, so vectors of
+        different models (and dimensions) are never ranked against each other.
+        
+        Raises:
+            EmbeddingUnavailableError: if no embedding path works
+        """
+        return self._on_one_path(lambda path, model: (self._index_embeddings(indexes, path, model),
+                                                      self._query_embeddings(queries, path, model)))
+
+    def index_embeddings(self, indexes: List[DocumentIndex]) -> np.ndarray:
+        """
+        Chunk embeddings of documents, in chunk order, embedding only the documents not cached.
+        
+        Raises:
+            EmbeddingUnavailableError: if no embedding path works
+        """
+        return self._on_one_path(lambda path, model: self._index_embeddings(indexes, path, model))
+
+    def _index_embeddings(self, indexes: List[DocumentIndex], path: str, model: str) -> np.ndarray:
+        vectors = [document_indexes.embeddings(index, model) for index in indexes]
+        missing = [i for i, cached in enumerate(vectors) if cached is None and indexes[i].chunks]
+        if missing:
+            texts = [chunk["text"] for i in missing for chunk in indexes[i].chunks]
+            embeddings = np.asarray(self._embed_with(path, texts), dtype=np.float32)
+            offset = 0
+            for i in missing:
+                count = len(indexes[i].chunks)
+                vectors[i] = embeddings[offset:offset + count]
+                document_indexes.put_embeddings(indexes[i], model, vectors[i])
+                offset += count
+        logger.debug("Chunk embeddings reused for %d/%d documents", len(indexes) - len(missing), len(indexes))
+        return np.vstack([v for v in vectors if v is not None and len(v)])
+
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings using the best available method."""
+        return self._generate_embeddings(texts)[0]
+
+    def embedding_model(self) -> str:
+        """Name of the model generate_embeddings tries first (skipping paths that failed recently)"""
+        embedder = local_embedder() if USE_LOCAL_EMBEDDINGS else None
+        if embedder and embedding_health.available("local"):
+            return embedder.model_id
+        if remote_embedder and embedding_health.available("openai"):
+            return OPENAI_EMBEDDING_MODEL
+        return "unavailable"
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Embed a retrieval query, reusing cached vectors.
+        
+        Returns:
+            The query vector
+        
+        Raises:
+            EmbeddingUnavailableError: if no embedding path works
+        """
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed retrieval queries, reusing cached vectors and embedding the rest in one batch.
+        
+        Raises:
+            EmbeddingUnavailableError: if no embedding path works
+        """
+        return self._on_one_path(lambda path, model: self._query_embeddings(queries, path, model))
+
+    def _query_embeddings(self, queries: List[str], path: str, model: str) -> List[List[float]]:
+        vectors = [query_embedding_cache.get(model, query) for query in queries]
+        missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        logger.debug("Query embedding cache hits: %d/%d", len(queries) - len(missing), len(queries))
+        if missing:
+            embedded = dict(zip(missing, self._embed_with(path, missing)))
+            for query, vector in embedded.items():
+                query_embedding_cache.put(model, query, vector)
+            vectors = [vector if vector is not None else embedded[query] for query, vector in zip(queries, vectors)]
+        return vectors
+
+    def pin_queries(self, queries: List[str]):
+        """Never evict these recurring queries from the query embedding cache"""
+        pinned_queries.extend(queries)
+        query_embedding_cache.pin(OPENAI_EMBEDDING_MODEL, queries)
+        if _local_embedder is not None:
+            query_embedding_cache.pin(_local_embedder.model_id, queries)
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        """Query embedding cache hits, misses and hit ratio"""
+        return query_embedding_cache.stats()
+
+    def _generate_embeddings(self, texts: List[str]) -> Tuple[List[List[float]], str]:
+        """
+        Generate embeddings and report the model that produced them.
+        
+        Raises:
+            EmbeddingUnavailableError: if neither the local model nor OpenAI can embed the texts
+        """
         if not texts:
             logger.warning("Empty texts provided for embedding")
-            return []
-            
-        # Use local embeddings if available and enabled
-        if USE_LOCAL_EMBEDDINGS and sentence_transformer:
-            try:
-                logger.info(f"Generating local embeddings for {len(texts)} chunks")
-                start_time = time.time()
-                
-                # Process in batches for better memory management
-                batch_size = 32
-                all_embeddings = []
-                
-                for i in range(0, len(texts), batch_size):
-                    batch_texts = texts[i:i + batch_size]
-                    batch_embeddings = sentence_transformer.encode(batch_texts)
-                    all_embeddings.extend(batch_embeddings.tolist())
-                
-                logger.info(f"Generated {len(all_embeddings)} local embeddings in {time.time() - start_time:.2f}s")
-                return all_embeddings
-            except Exception as e:
-                logger.error(f"Error generating local embeddings: {e}")
-                # Continue to OpenAI if local embedding fails
-        
-        # Use OpenAI embeddings if available
-        if openai_client:
+            return [], self.embedding_model()
+        return self._on_one_path(lambda path, model: (self._embed_with(path, texts), model))
+
+    def _embedding_paths(self, errors: Dict[str, str]) -> Iterator[Tuple[str, str]]:
+        """
+        (path, model) of the embedding paths to try, in order: the local model, then OpenAI
+        
+        Paths that failed recently or aren't configured are skipped, with the reason in errors.
+        """
+        embedder = local_embedder() if USE_LOCAL_EMBEDDINGS else None
+        if embedder and not embedding_health.available("local"):
+            errors["local"] = embedding_health.skip_reason("local")
+            EMBEDDING_CALLS.labels("local", "skipped").inc()
+        elif embedder:
+            yield "local", embedder.model_id
+        elif USE_LOCAL_EMBEDDINGS:
+            errors["local"] = "no local embedding model loaded"
+        
+        if remote_embedder and not embedding_health.available("openai"):
+            errors["openai"] = embedding_health.skip_reason("openai")
+            EMBEDDING_CALLS.labels("openai", "skipped").inc()
+        elif remote_embedder:
+            yield "openai", OPENAI_EMBEDDING_MODEL
+        else:
+            errors["openai"] = "OPENAI_API_KEY not set"
+
+    def _on_one_path(self, embed: Callable[[str, str], Any]) -> Any:
+        """
+        Run embed(path, model) on the first embedding path that works
+        
+        Everything embed() embeds goes through _embed_with(path, ...), so all
+        its vectors come from one model; if the path fails, embed() is run
+        again from the start on the next path.
+        
+        Raises:
+            EmbeddingUnavailableError: if no embedding path works
+        """
+        errors = {}
+        for path, model in self._embedding_paths(errors):
             try:
-                batch_size = 5  # Smaller batch size to avoid rate limits
-                all_embeddings = []
-                
-                for i in range(0, len(texts), batch_size):
-                    batch_texts = texts[i:i + batch_size]
-                    logger.info(f"Generating OpenAI embeddings for batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-                    
-                    response = openai_client.embeddings.create(
-                        model="text-embedding-ada-002",
-                        input=batch_texts
-                    )
-                    
-                    batch_embeddings = [item.embedding for item in response.data]
-                    all_embeddings.extend(batch_embeddings)
-                    
-                    # Add delay between batches
-                    if i + batch_size < len(texts):
-                        time.sleep(2.0)
-                
-                logger.info(f"Successfully generated {len(all_embeddings)} OpenAI embeddings")
-                return all_embeddings
-            except Exception as e:
-                logger.error(f"Error generating OpenAI embeddings: {e}")
-                # Fall back to random embeddings as last resort
+                return embed(path, model)
+            except _PathFailed as e:
+                errors[path] = str(e)
+        error = EmbeddingUnavailableError(errors)
+        logger.error(f"Could not embed: {error}")
+        raise error
+
+    def _embed_with(self, path: str, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts on one path ("local" or "openai"), recording the outcome
         
-        # Last resort: random embeddings
-        logger.warning(f"Using random embeddings for {len(texts)} chunks (both local and OpenAI methods failed)")
-        return [np.random.rand(EMBEDDING_DIMENSION).tolist() for _ in texts]
+        Raises:
+            _PathFailed: if the path fails
+        """
+        start_time = time.time()
+        try:
+            if path == "local":
+                embedder = local_embedder()
+                logger.info("Generating local embeddings for %d chunks (%s)", len(texts), embedder.name)
+                # Batched by the backend (and shared with concurrent requests by the embedding service)
+                all_embeddings = embedder.encode(texts).tolist()
+                logger.info("Generated %d local embeddings in %.2fs", len(all_embeddings), time.time() - start_time)
+                record_span("embedding.local", start_time, time.time() - start_time, texts=len(texts), model=embedder.model_id)
+            else:
+                logger.info("Generating OpenAI embeddings for %d chunks", len(texts))
+                all_embeddings = remote_embedder.embed(texts)
+                logger.info("Successfully generated %d OpenAI embeddings in %.2fs", len(all_embeddings), time.time() - start_time)
+                record_span("embedding.openai", start_time, time.time() - start_time, texts=len(texts))
+        except Exception as e:
+            logger.error(f"Error generating {path} embeddings: {e}")
+            record_span(f"embedding.{path}", start_time, time.time() - start_time, error=str(e), texts=len(texts))
+            embedding_health.record_failure(path, e)
+            EMBEDDING_CALLS.labels(path, "failure").inc()
+            raise _PathFailed(str(e)) from e
+        embedding_health.record_success(path)
+        EMBEDDING_CALLS.labels(path, "success").inc()
+        return all_embeddings
 
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """Calculate cosine similarity between two vectors."""
@@ -177,44 +463,91 @@ class RAGSystem:
         norm2 = np.linalg.norm(vec2)
         return dot_product / (norm1 * norm2) if norm1 > 0 and norm2 > 0 else 0
 
+    def rank_chunks(self, query_embedding: List[float], chunk_embeddings: List[List[float]],
+                    query: Optional[str] = None, chunk_texts: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        """
+        Chunk indices and scores, best first.
+        
+        With the query and chunk texts (and HYBRID_RETRIEVAL on), the cosine
+        ranking is fused with a BM25 ranking of the chunks, so exact terms the
+        embedding model misses still count; scores are then fusion scores.
+        """
+        return self.rank_chunks_batch([query_embedding], chunk_embeddings,
+                                      [query] if query else None, chunk_texts)[0]
+
+    def rank_chunks_batch(self, query_embeddings: List[List[float]], chunk_embeddings: List[List[float]],
+                          queries: Optional[List[str]] = None,
+                          chunk_texts: Optional[List[str]] = None,
+                          indexes: Optional[List[DocumentIndex]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        rank_chunks for several queries over the same chunks: one matrix product
+        scores every query against every chunk, and one BM25 index serves all queries.
+        
+        With the document indexes the chunks come from, their cached BM25
+        postings are searched together instead of indexing the chunk texts.
+        """
+        chunk_matrix = np.asarray(chunk_embeddings, dtype=np.float32)
+        query_matrix = np.asarray(query_embeddings, dtype=np.float32)
+        chunk_norms = np.linalg.norm(chunk_matrix, axis=1)
+        query_norms = np.linalg.norm(query_matrix, axis=1)
+        norms = np.outer(query_norms, chunk_norms)
+        # Zero vectors get similarity 0 (as cosine_similarity)
+        scores = np.divide(query_matrix @ chunk_matrix.T, norms, out=np.zeros_like(norms), where=norms > 0)
+        rankings = [[(int(i), float(row[i])) for i in np.argsort(-row, kind="stable")] for row in scores]
+        if not (HYBRID_RETRIEVAL and queries and (chunk_texts or indexes)):
+            return rankings
+        
+        start = time.monotonic()
+        deadline = start + LEXICAL_BUDGET_MS / 1000
+        try:
+            if indexes is not None:
+                index = JoinedLexicalIndex([document_indexes.lexical(document, deadline) for document in indexes])
+            else:
+                index = LexicalIndex(chunk_texts, deadline=deadline)
+        except TimeoutError as e:
+            logger.warning(f"Using vector ranking only: {e}")
+            return rankings
+        fused = [reciprocal_rank_fusion([ranking, index.search(query)]) for ranking, query in zip(rankings, queries)]
+        logger.debug("BM25 over %d chunks for %d queries in %.1fms", len(index), len(queries), 1000 * (time.monotonic() - start))
+        return fused
+
     def retrieve_chunks(self, query_embedding: List[float], 
                        indexed_chunks: List[Tuple[str, List[float]]], 
-                       k: int = 5) -> List[str]:
-        """Retrieve most relevant chunks based on cosine similarity."""
+                       k: int = 5, query: Optional[str] = None) -> List[str]:
+        """Retrieve the most relevant chunks by cosine similarity, fused with BM25 when the query text is given."""
         if not indexed_chunks:
             logger.warning("No chunks to retrieve from")
             return []
         
         try:
-            # Calculate similarities
-            similarities = []
-            for chunk, embedding in indexed_chunks:
-                similarity = self.cosine_similarity(query_embedding, embedding)
-                similarities.append((chunk, similarity))
-            
             # Sort by similarity and get top k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_chunks = [chunk for chunk, sim in similarities[:k]]
+            similarities = self.rank_chunks(query_embedding, [embedding for _, embedding in indexed_chunks],
+                                            query, [text for text, _ in indexed_chunks])[:k]
+            top_chunks = [indexed_chunks[i][0] for i, _ in similarities]
             
             # Log similarity scores for diagnostics
-            top_similarities = [sim for _, sim in similarities[:k]]
-            logger.info(f"Retrieved top {len(top_chunks)} chunks with similarities: {top_similarities}")
+            top_similarities = [sim for _, sim in similarities]
+            logger.info(f"Retrieved top {len(top_chunks)} chunks with scores: {top_similarities}")
             
             return top_chunks
         except Exception as e:
             logger.error(f"Error retrieving chunks: {e}")
             return []
 
-    @backoff.on_exception(backoff.expo, Exception, max_tries=MAX_RETRIES)
-    def generate_response(self, query: str, context: str, 
-                        model: str = "meta-llama/llama-3-8b-instruct") -> str:
-        """Generate a response using OpenRouter API with retry logic."""
-        if not OPENROUTER_API_KEY:
-            logger.error("OpenRouter API key not found")
-            return "Error: OpenRouter API key not found."
+    def build_prompt(self, query: str, context: str, instructions: Optional[str] = None) -> str:
+        """
+        Build the LLM prompt from the query or task instructions and the context.
         
-        try:
-            prompt = f"""Generate a response to the following query using the provided context.
+        Instructions are sent instead of the query, with the context at their
+        "{context}" placeholder (appended if they have none); the query is then
+        only used for retrieval.
+        """
+        if instructions:
+            if "{context}" in instructions:
+                return instructions.replace("{context}", context)
+            return f"{instructions}\n\nContext:\n{context}"
+        
+        return f"""Generate a response to the following query using the provided context.
             
             Context:
             {context}
@@ -223,9 +556,22 @@ class RAGSystem:
             {query}
             
             Response:"""
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=MAX_RETRIES)
+    def generate_response(self, query: str, context: str, 
+                        model: str = DEFAULT_MODEL,
+                        max_tokens: Optional[int] = None,
+                        instructions: Optional[str] = None) -> str:
+        """Generate a response using OpenRouter API with retry logic."""
+        if not OPENROUTER_API_KEY:
+            logger.error("OpenRouter API key not found")
+            return "Error: OpenRouter API key not found."
+        
+        try:
+            prompt = self.build_prompt(query, context, instructions)
             
-            logger.debug(f"Generating response with model: {model}")
-            logger.debug(f"Prompt length: {len(prompt)} chars")
+            logger.debug("Generating response with model: %s", model)
+            logger.debug("Prompt length: %d chars", len(prompt))
             
             response = requests.post(
                 "https://openrouter.ai/api/v1/chat/completions",
@@ -238,7 +584,7 @@ class RAGSystem:
                 json={
                     "model": model,
                     "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": 500
+                    "max_tokens": max_tokens or DEFAULT_MAX_TOKENS
                 },
                 timeout=30
             )
@@ -258,19 +604,93 @@ class RAGSystem:
             logger.error(f"Error generating response: {e}")
             return f"Error: {str(e)}"
 
-    def process_document(self, document: str, query: str, chunks_to_retrieve: int = 5) -> Dict[str, Any]:
-        """Process a document and query through the RAG pipeline."""
-        logger.info(f"Processing document with RAG pipeline for query: '{query}'")
-        logger.debug(f"Document length: {len(document)} chars, chunks to retrieve: {chunks_to_retrieve}")
+    def process_document(self, document: Union[str, Dict[str, str]], query: str,
+                         chunks_to_retrieve: Optional[int] = None,
+                         max_tokens: Optional[int] = None,
+                         instructions: Optional[str] = None,
+                         model: str = DEFAULT_MODEL,
+                         interleave_sources: bool = False) -> Dict[str, Any]:
+        """
+        Process a document and query through the RAG pipeline.
+        
+        The context is filled with the most relevant chunks up to the model's
+        token budget (see context_builder). A dict document maps source ids to
+        text and gets one labelled context section per source.
+        
+        Args:
+            document: Document text, or dict of source id to text
+            query: Retrieval query (also the question when no instructions are given)
+            chunks_to_retrieve: Optional cap on the number of chunks in the context
+            max_tokens: Response length limit
+            instructions: Task prompt sent to the LLM instead of the query
+            model: OpenRouter model name
+            interleave_sources: Give every source of a dict document context in
+                turn (inline sources that each need an answer) instead of ranking
+                all chunks together
+        """
+        return self.process_queries(document, [{
+            "query": query,
+            "chunks_to_retrieve": chunks_to_retrieve,
+            "max_tokens": max_tokens,
+            "instructions": instructions,
+        }], model=model, interleave_sources=interleave_sources)[0]
+
+    def process_queries(self, document: Union[str, Dict[str, str]], queries: List[Dict[str, Any]],
+                        model: str = DEFAULT_MODEL, concurrency: int = LLM_CONCURRENCY,
+                        interleave_sources: bool = False) -> List[Dict[str, Any]]:
+        """
+        Answer several queries over one document; see iter_queries.
+        
+        Returns:
+            One process_document-style result per query, in query order
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        for position, result in self.iter_queries(document, queries, model, concurrency, interleave_sources):
+            results[position] = result
+        return results
+
+    def iter_queries(self, document: Union[str, Dict[str, str]], queries: List[Dict[str, Any]],
+                     model: str = DEFAULT_MODEL, concurrency: int = LLM_CONCURRENCY,
+                     interleave_sources: bool = False):
+        """
+        Answer several queries over one document, yielding results as they finish.
+        
+        The document is chunked and embedded once, the queries are embedded in
+        one batch and scored against the chunks with one matrix product, and the
+        LLM calls run ``concurrency`` at a time.
+        
+        Args:
+            document: Document text, or dict of source id to text
+            queries: Dicts with "query" and optionally "chunks_to_retrieve",
+                "max_tokens" and "instructions" (as for process_document)
+            model: OpenRouter model name
+            concurrency: LLM calls in flight
+            interleave_sources: Give every source context in turn (see process_document)
+        
+        Yields:
+            (position in queries, result) in completion order
+        """
+        sources = document if isinstance(document, dict) else {None: document}
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Processing document with RAG pipeline for %d quer%s: %s%s",
+                        len(queries), "y" if len(queries) == 1 else "ies",
+                        ", ".join(repr(spec["query"]) for spec in queries[:3]), ", ..." if len(queries) > 3 else "")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Document length: %d chars in %d source(s)", sum(len(text) for text in sources.values()), len(sources))
         
         start_time = time.time()
-        result = {
+        results = [{
             "success": False,
-            "query": query,
+            "query": spec["query"],
             "retrieved_chunks": [],
+            "chunk_sources": [],  # source id and character offsets of each retrieved chunk
             "response": "",
             "processing_time": 0,
             "error": None,
+            "token_usage": None,
+            "retrieval": None,  # "full" (no retrieval needed), "hybrid", "vector" or "bm25"
+            "degraded": False,  # embeddings unavailable, context ranked with BM25
+            "degraded_reason": None,
             "timings": {
                 "chunking": 0,
                 "embedding": 0,
@@ -278,92 +698,198 @@ class RAGSystem:
                 "response": 0,
                 "total": 0
             }
-        }
+        } for spec in queries]
+        
+        def finish(position: int, error: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+            result = results[position]
+            if error:
+                result["error"] = error
+            result["processing_time"] = time.time() - start_time
+            result["timings"]["total"] = result["processing_time"]
+            QUERY_SECONDS.observe(result["processing_time"])
+            QUERIES.labels(result["retrieval"] or "none", "success" if result["success"] else "error").inc()
+            return position, result
         
+        PIPELINES_IN_PROGRESS.inc()
         try:
-            # Step 1: Chunking
+            # Step 1: Chunking (shared by every query)
             chunking_start = time.time()
             logger.debug("Step 1: Chunking document...")
-            chunks = self.chunk_text(document)
-            result["timings"]["chunking"] = time.time() - chunking_start
-            logger.debug(f"Created {len(chunks)} chunks in {result['timings']['chunking']:.2f}s")
+            # Each source is chunked separately (chunks never span two documents) and its
+            # index is reused while cached
+            indexes, chunks = [], []
+            for source_id, text in sources.items():
+                if not text:
+                    continue
+                index = document_indexes.get(text, self.document_chunks)
+                indexes.append(index)
+                chunks.extend({**chunk, "source": source_id} for chunk in index.chunks)
+            chunking_time = time.time() - chunking_start
+            CHUNKING_SECONDS.observe(chunking_time)
+            record_span("rag.chunking", chunking_start, chunking_time, sources=len(indexes), chunks=len(chunks))
+            logger.debug("Created %d chunks in %.2fs", len(chunks), chunking_time)
+            for result in results:
+                result["timings"]["chunking"] = chunking_time
             
             if not chunks:
                 logger.warning("No chunks were created from the document")
-                result["error"] = "Failed to create chunks from document"
-                return result
-                
-            # Step 2: Embedding chunks
-            embedding_start = time.time()
-            logger.debug("Step 2: Generating embeddings for chunks...")
-            chunk_embeddings = self.generate_embeddings(chunks)
+                for position in range(len(queries)):
+                    yield finish(position, "Failed to create chunks from document")
+                return
             
-            if not chunk_embeddings or len(chunk_embeddings) != len(chunks):
-                logger.error(f"Embedding generation failed or mismatch: got {len(chunk_embeddings) if chunk_embeddings else 0} embeddings for {len(chunks)} chunks")
-                result["error"] = "Failed to generate embeddings for chunks"
-                return result
-                
-            # Step 3: Embedding query
-            logger.debug("Step 3: Generating embedding for query...")
-            query_embedding = self.generate_embeddings([query])
+            # The context gets what the prompt and the response leave of the model's window
+            # Chunk n of a source starts n * (CHUNK_SIZE - CHUNK_OVERLAP) tokens in
+            document_tokens = sum(chunk["position"] * (CHUNK_SIZE - CHUNK_OVERLAP) + len(chunk["tokens"])
+                                  for i, chunk in enumerate(chunks)
+                                  if i + 1 == len(chunks) or chunks[i + 1]["source"] != chunk["source"])
+            plans = []
+            for spec in queries:
+                response_tokens = spec.get("max_tokens") or DEFAULT_MAX_TOKENS
+                prompt_tokens = len(self.encoder.encode(self.build_prompt(spec["query"], "", spec.get("instructions"))))
+                budget = context_budget(model, prompt_tokens, response_tokens)
+                plans.append({"prompt_tokens": prompt_tokens, "response_tokens": response_tokens, "budget": budget,
+                              "ranking": None, "interleave": interleave_sources,
+                              "retrieve": document_tokens > budget or bool(spec.get("chunks_to_retrieve"))})
             
-            if not query_embedding:
-                logger.error("Failed to generate embedding for query")
-                result["error"] = "Failed to generate embedding for query"
-                return result
+            retrieving = [position for position, plan in enumerate(plans) if plan["retrieve"]]
+            if retrieving:
+                retrieval_queries = [queries[position]["query"] for position in retrieving]
+                # Steps 2 and 3: Embedding chunks and queries, once for all queries
+                embedding_start = time.time()
+                logger.debug("Steps 2-3: Generating embeddings for %d chunks and %d queries...", len(chunks), len(retrieving))
+                degraded_reason = None
+                try:
+                    chunk_embeddings, query_embeddings = self.embed_for_retrieval(indexes, retrieval_queries)
+                except EmbeddingUnavailableError as e:
+                    degraded_reason = str(e)
+                    embedding_health.record_degraded()
+                embedding_time = time.time() - embedding_start
+                EMBEDDING_SECONDS.observe(embedding_time)
+                record_span("rag.embedding", embedding_start, embedding_time, error=degraded_reason,
+                            chunks=len(chunks), queries=len(retrieving))
                 
-            query_embedding = query_embedding[0]
-            result["timings"]["embedding"] = time.time() - embedding_start
-            logger.debug(f"Generated embeddings in {result['timings']['embedding']:.2f}s")
-            
-            # Step 4: Retrieval
-            retrieval_start = time.time()
-            logger.debug("Step 4: Retrieving chunks...")
-            relevant_chunks = self.retrieve_chunks(
-                query_embedding, 
-                list(zip(chunks, chunk_embeddings)), 
-                k=chunks_to_retrieve
-            )
-            result["timings"]["retrieval"] = time.time() - retrieval_start
-            logger.debug(f"Retrieved {len(relevant_chunks)} chunks in {result['timings']['retrieval']:.2f}s")
-            
-            if not relevant_chunks:
-                logger.warning("No relevant chunks were retrieved")
-                result["error"] = "No relevant chunks could be retrieved from the document"
-                return result
+                # Step 4: Retrieval
+                retrieval_start = time.time()
+                if degraded_reason:
+                    # Rank by the query's words rather than send the LLM arbitrary chunks
+                    logger.warning("Embeddings unavailable, ranking chunks with BM25")
+                    lexical = JoinedLexicalIndex([document_indexes.lexical(index) for index in indexes])
+                    rankings = [lexical.rank(query) for query in retrieval_queries]
+                    mode = "bm25"
+                else:
+                    if len(chunk_embeddings) != len(chunks):
+                        logger.error(f"Embedding mismatch: got {len(chunk_embeddings)} embeddings for {len(chunks)} chunks")
+                        for position in range(len(queries)):
+                            yield finish(position, "Failed to generate embeddings for chunks")
+                        return
+                    logger.debug("Generated embeddings in %.2fs", embedding_time)
+                    logger.debug("Step 4: Ranking chunks...")
+                    rankings = self.rank_chunks_batch(query_embeddings, chunk_embeddings, retrieval_queries,
+                                                      indexes=indexes)
+                    mode = "hybrid" if HYBRID_RETRIEVAL else "vector"
+                retrieval_time = time.time() - retrieval_start
+                RANKING_SECONDS.observe(retrieval_time)
+                record_span("rag.retrieval", retrieval_start, retrieval_time, mode=mode, queries=len(retrieving))
                 
-            # Step 5: Response generation
-            response_start = time.time()
-            logger.debug("Step 5: Generating response...")
-            context = "\n\n".join(relevant_chunks)
-            logger.debug(f"Context for LLM (length: {len(context)} chars)")
-            response = self.generate_response(query, context)
-            result["timings"]["response"] = time.time() - response_start
-            logger.debug(f"Response generated in {result['timings']['response']:.2f}s")
+                for position, ranking in zip(retrieving, rankings):
+                    plans[position]["ranking"] = [i for i, _ in ranking]
+                    result = results[position]
+                    result.update(retrieval=mode, degraded=bool(degraded_reason), degraded_reason=degraded_reason)
+                    result["timings"]["embedding"] = embedding_time
+                    result["timings"]["retrieval"] = retrieval_time
+                    logger.info("Top chunk scores (%s): %s", mode, [round(float(score), 3) for _, score in ranking[:5]])
             
-            if not response or response.startswith("Error:"):
-                logger.error(f"Response generation failed: {response}")
-                result["error"] = response or "Failed to generate response"
-                return result
-                
-            # Populate result
-            result["success"] = True
-            result["retrieved_chunks"] = relevant_chunks
-            result["response"] = response
-            result["processing_time"] = time.time() - start_time
-            result["timings"]["total"] = result["processing_time"]
-            logger.info(f"RAG processing completed successfully in {result['processing_time']:.2f}s")
+            for position, plan in enumerate(plans):
+                if not plan["retrieve"]:
+                    # The whole document fits the budget: no need to embed or rank it
+                    results[position]["retrieval"] = "full"
+                    logger.debug("Document (%d tokens) fits the context budget (%d), skipping retrieval", document_tokens, plan["budget"])
             
-            return result
+            # Step 5: Context assembly and response generation, concurrently across queries
+            if len(queries) == 1:
+                yield finish(0, self._answer(chunks, queries[0], plans[0], document_tokens, results[0], model))
+                return
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries))),
+                                    thread_name_prefix="rag-llm") as executor:
+                futures = {executor.submit(bind(self._answer), chunks, spec, plan, document_tokens, result, model): position
+                           for position, (spec, plan, result) in enumerate(zip(queries, plans, results))}
+                for future in as_completed(futures):
+                    try:
+                        error = future.result()
+                    except Exception as e:
+                        logger.error(f"Error answering query {futures[future]}: {e}")
+                        error = str(e)
+                    yield finish(futures[future], error)
                 
         except Exception as e:
             error_trace = traceback.format_exc()
             logger.error(f"Error in RAG pipeline: {str(e)}")
             logger.debug(f"Error traceback: {error_trace}")
-            result["error"] = str(e)
-            result["processing_time"] = time.time() - start_time
-            result["timings"]["total"] = result["processing_time"]
-            return result
+            for position, result in enumerate(results):
+                if not result["success"] and not result["error"]:
+                    yield finish(position, str(e))
+        finally:
+            PIPELINES_IN_PROGRESS.dec()
+
+    def _answer(self, chunks: List[Dict[str, Any]], spec: Dict[str, Any], plan: Dict[str, Any],
+                document_tokens: int, result: Dict[str, Any], model: str) -> Optional[str]:
+        """
+        Build one query's context and generate its response into result
+        
+        Returns:
+            Error message, or None on success
+        """
+        retrieval_start = time.time()
+        context, selected, token_usage = build_context(
+            self.encoder, chunks, plan["ranking"], plan["budget"], CHUNK_OVERLAP,
+            max_chunks=spec.get("chunks_to_retrieve"), interleave=plan["interleave"]
+        )
+        relevant_chunks = [chunks[i]["text"] for i in selected]
+        CONTEXT_SECONDS.observe(time.time() - retrieval_start)
+        record_span("rag.context", retrieval_start, time.time() - retrieval_start, chunks=len(selected))
+        result["timings"]["retrieval"] += time.time() - retrieval_start
+        logger.debug("Selected %d chunks in %.2fs", len(relevant_chunks), result["timings"]["retrieval"])
+        
+        if not relevant_chunks:
+            logger.warning("No relevant chunks were retrieved")
+            return "No relevant chunks could be retrieved from the document"
+        
+        token_usage.update({
+            "prompt_tokens": plan["prompt_tokens"] + token_usage["context_tokens"],
+            "instruction_tokens": plan["prompt_tokens"],
+            "max_response_tokens": plan["response_tokens"],
+            "document_tokens": document_tokens,
+        })
+        result["token_usage"] = token_usage
+        logger.info("Context: %d/%d tokens from %d/%d chunks (%d duplicates dropped), prompt %d tokens",
+                    token_usage["context_tokens"], plan["budget"], token_usage["chunks_used"], len(chunks),
+                    token_usage["duplicate_chunks_dropped"], token_usage["prompt_tokens"])
+        
+        # Step 5: Response generation
+        response_start = time.time()
+        logger.debug("Step 5: Generating response...")
+        logger.debug("Context for LLM (length: %d chars)", len(context))
+        with LLM_IN_PROGRESS.track(), span("llm.generate", model=model, query=spec["query"][:100]) as llm_span:
+            response = self.generate_response(spec["query"], context, model=model, max_tokens=spec.get("max_tokens"),
+                                              instructions=spec.get("instructions"))
+            if not response or response.startswith("Error:"):
+                llm_span.record_error(response[:200] or "empty response")
+        result["timings"]["response"] = time.time() - response_start
+        RESPONSE_SECONDS.observe(result["timings"]["response"])
+        logger.debug("Response generated in %.2fs", result["timings"]["response"])
+        
+        if not response or response.startswith("Error:"):
+            logger.error(f"Response generation failed: {response}")
+            return response or "Failed to generate response"
+        
+        # Populate result
+        result["success"] = True
+        result["retrieved_chunks"] = relevant_chunks
+        result["chunk_sources"] = [{"source": chunks[i]["source"], "position": chunks[i]["position"],
+                                    "start": chunks[i]["start"], "end": chunks[i]["end"]} for i in selected]
+        result["response"] = response
+        logger.info("RAG query answered in %.2fs", time.time() - retrieval_start)
+        return None
 
 
 # If run directly, perform a demo
@@ -786,7 +1312,7 @@ of your Friday. Have a great Friday. Have a great weekend.
 We'll start virtual memory on Monday.
     """
     
-    query = "Please concisely summarize this lecture including key points and important updates if there are any. Avoid using headers, section breaks, or any areas of your response that don’t have any added information in addition to headers such as: “Here is a concise summary of the lecture:”. Include key dates, exam information, anything mentioned as important or necessary, and skip over anything that is not important or repeated if applicable. This should be well formatted in a concise manner that discusses key points and additionally lists more info for key details and main points under them. All details of the lecture should be covered and it is imperative that you don't miss any details. If there are any details that you can not parse or ideas that aren’t clear, advise the user to review the lecture or check to make sure that the information is correct. You should avoid listing any information that is not relevant or where you have no info to share."
+    query = LECTURE_SUMMARY_QUERY
 
     # Initialize RAG system
     rag = RAGSystem()
@@ -801,5 +1327,6 @@ We'll start virtual memory on Monday.
         print(result["response"])
         print("\nPerformance:")
         print(f"Total time: {result['processing_time']:.2f}s")
+        print(f"Token usage: {result['token_usage']}")
     else:
         print(f"\nError: {result['error']}")
\ No newline at end of file
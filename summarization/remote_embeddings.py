@@ -0,0 +1,286 @@
+#remote_embeddings.py
+"""
+Concurrent, rate-limit-aware OpenAI embeddings.
+
+The OpenAI fallback used to send batches of 5 texts one at a time with a fixed
+2 s sleep between them (over 3 minutes for a 500-chunk lecture).
+``RemoteEmbedder`` sends batches of up to ``OPENAI_EMBEDDING_BATCH_SIZE``
+inputs (and ``OPENAI_EMBEDDING_BATCH_TOKENS`` estimated tokens), with
+``OPENAI_EMBEDDING_CONCURRENCY`` requests in flight.
+
+Pacing comes from the API instead of a sleep: every response's
+``x-ratelimit-remaining-*`` / ``x-ratelimit-reset-*`` headers update a shared
+``RateLimitPacer``, and a request is only sent while the remaining request and
+token budget covers it; otherwise it waits for the reset. A 429 pauses all
+requests for its ``retry-after`` and the batch is retried.
+
+Run this module for a benchmark against a local mock of the embeddings
+endpoint (500 and 5,000 chunks, and the old sequential path on 500 chunks).
+The tests in ``test_remote_embeddings.py`` run ``RemoteEmbedder`` against the
+same mock.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import openai
+
+logger = logging.getLogger("rag_system")
+
+OPENAI_EMBEDDING_BATCH_SIZE = int(os.getenv("OPENAI_EMBEDDING_BATCH_SIZE", "512"))  # API limit: 2048 inputs
+OPENAI_EMBEDDING_BATCH_TOKENS = int(os.getenv("OPENAI_EMBEDDING_BATCH_TOKENS", "100000"))
+OPENAI_EMBEDDING_CONCURRENCY = int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", "4"))
+MAX_RETRIES = 5
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds in a reset header such as "1s", "6m0s" or "120ms" (plain numbers are seconds)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    return sum(float(number) * _DURATION_SECONDS[unit] for number, unit in parts) if parts else None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class RateLimitPacer:
+    """Request/token budget shared by concurrent requests, refreshed from rate-limit headers"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._remaining = {"requests": None, "tokens": None}  # None: unknown, assume available
+        self._reset_at = {"requests": 0.0, "tokens": 0.0}
+        self._paused_until = 0.0
+        self.waited = 0.0  # seconds requests spent held back, summed over threads
+
+    def acquire(self, tokens: int):
+        """Block until the budget allows a request of this many tokens, then reserve it"""
+        need = {"requests": 1, "tokens": tokens}
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait_until = self._paused_until
+                for kind in need:
+                    if self._remaining[kind] is not None and now >= self._reset_at[kind]:
+                        self._remaining[kind] = None  # window reset
+                    if self._remaining[kind] is not None and self._remaining[kind] < need[kind]:
+                        wait_until = max(wait_until, self._reset_at[kind])
+                if wait_until <= now:
+                    for kind in need:
+                        if self._remaining[kind] is not None:
+                            self._remaining[kind] -= need[kind]
+                    self.waited += now - started
+                    return
+                self._condition.wait(wait_until - now)
+
+    def update(self, headers):
+        """Take the server's view of the remaining budget from response headers"""
+        now = time.monotonic()
+        with self._condition:
+            for kind in ("requests", "tokens"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+                if remaining is not None and reset is not None:
+                    self._remaining[kind] = int(float(remaining))
+                    self._reset_at[kind] = now + reset
+            self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold every request for a while (after a 429)"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RemoteEmbedder:
+    def __init__(self, client: "openai.OpenAI", model: str = "text-embedding-ada-002",
+                 batch_size: int = OPENAI_EMBEDDING_BATCH_SIZE, batch_tokens: int = OPENAI_EMBEDDING_BATCH_TOKENS,
+                 concurrency: int = OPENAI_EMBEDDING_CONCURRENCY,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            client: OpenAI client (its own retries are disabled; pacing and retries happen here)
+            model: Embedding model
+            batch_size: Maximum inputs per request
+            batch_tokens: Maximum estimated tokens per request
+            concurrency: Requests in flight
+            count_tokens: Token counter used for batching and the token budget
+        """
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.count_tokens = count_tokens
+        self.pacer = RateLimitPacer()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="openai-embeddings")
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "inputs": 0, "rate_limited": 0, "retries": 0}
+
+    def _batches(self, texts: List[str]) -> List[tuple]:
+        """Split texts into (start, texts, tokens) batches within the input and token limits"""
+        batches = []
+        start, tokens = 0, 0
+        for i, text in enumerate(texts):
+            count = self.count_tokens(text)
+            if i > start and (i - start >= self.batch_size or tokens + count > self.batch_tokens):
+                batches.append((start, texts[start:i], tokens))
+                start, tokens = i, 0
+            tokens += count
+        if start < len(texts):
+            batches.append((start, texts[start:], tokens))
+        return batches
+
+    def _send(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """One embeddings request, paced and retried"""
+        for attempt in range(MAX_RETRIES + 1):
+            self.pacer.acquire(tokens)
+            try:
+                raw = self.client.embeddings.with_raw_response.create(model=self.model, input=texts)
+            except openai.RateLimitError as e:
+                headers = e.response.headers
+                delay = (parse_reset(headers.get("retry-after"))
+                         or parse_reset(headers.get("x-ratelimit-reset-tokens"))
+                         or 2 ** attempt)
+                self.pacer.update(headers)
+                self.pacer.pause(delay)
+                with self._lock:
+                    self._stats["rate_limited"] += 1
+                logger.warning(f"OpenAI embeddings rate limited, retrying in {delay:.2f}s")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"OpenAI embeddings request failed ({e}), retrying")
+                time.sleep(min(30, 2 ** attempt))
+            else:
+                self.pacer.update(raw.headers)
+                with self._lock:
+                    self._stats["requests"] += 1
+                    self._stats["inputs"] += len(texts)
+                data = sorted(raw.parse().data, key=lambda item: item.index)
+                return [item.embedding for item in data]
+            with self._lock:
+                self._stats["retries"] += 1
+        raise RuntimeError(f"OpenAI embeddings still rate limited after {MAX_RETRIES} retries")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in concurrent batches, in input order"""
+        batches = self._batches(texts)
+        futures = [self._executor.submit(self._send, batch, tokens) for _, batch, tokens in batches]
+        embeddings: List[List[float]] = []
+        for future in futures:
+            embeddings.extend(future.result())
+        return embeddings
+
+    def stats(self) -> Dict[str, object]:
+        """Requests, inputs, 429s, retries and time spent waiting for the rate limit"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rate_limit_wait_seconds"] = round(self.pacer.waited, 2)
+        stats["concurrency"] = self.concurrency
+        return stats
+
+
+def _mock_server(requests_per_window: int, tokens_per_window: int, window: float, latency: float):
+    """Local stand-in for POST /v1/embeddings with rate limits and rate-limit headers"""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"start": time.monotonic(), "requests": 0, "tokens": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            inputs = body["input"]
+            tokens = sum(estimate_tokens(text) for text in inputs)
+            with lock:
+                now = time.monotonic()
+                if now - state["start"] >= window:
+                    state.update(start=now, requests=0, tokens=0)
+                reset = window - (now - state["start"])
+                limited = (state["requests"] + 1 > requests_per_window
+                           or state["tokens"] + tokens > tokens_per_window)
+                if not limited:
+                    state["requests"] += 1
+                    state["tokens"] += tokens
+                headers = {
+                    "x-ratelimit-limit-requests": str(requests_per_window),
+                    "x-ratelimit-remaining-requests": str(requests_per_window - state["requests"]),
+                    "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                    "x-ratelimit-limit-tokens": str(tokens_per_window),
+                    "x-ratelimit-remaining-tokens": str(tokens_per_window - state["tokens"]),
+                    "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+                }
+            if limited:
+                payload = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                status = 429
+                headers["retry-after"] = f"{reset:.3f}"
+            else:
+                time.sleep(latency + 0.0002 * len(inputs))
+                payload = {"object": "list", "model": body["model"],
+                           "data": [{"object": "embedding", "index": i, "embedding": [float(len(text) % 7), 1.0]}
+                                    for i, text in enumerate(inputs)],
+                           "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+                status = 200
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    # 100-token chunks; the mock allows 60 requests / 200k tokens per 5 s window and answers in ~150 ms
+    latency = 0.15
+    server = _mock_server(requests_per_window=60, tokens_per_window=200_000, window=5.0, latency=latency)
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+    chunk = "word " * 80
+
+    for count in (500, 5000):
+        texts = [f"{i} {chunk}" for i in range(count)]
+        embedder = RemoteEmbedder(client)
+        start = time.perf_counter()
+        vectors = embedder.embed(texts)
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == count and vectors[7] == [float(len(texts[7]) % 7), 1.0]
+        print(f"{count:5d} chunks: {elapsed:6.2f}s concurrent ({embedder.stats()})")
+        time.sleep(5.0)  # let the mock's window reset between runs
+
+    # The old path, run as it was: sequential batches of 5 with a 2 s sleep between them
+    # (500 chunks only; at 5,000 it takes over half an hour)
+    old_client = client.with_options(max_retries=0)
+    texts = [f"{i} {chunk}" for i in range(500)]
+    start = time.perf_counter()
+    for i in range(0, len(texts), 5):
+        old_client.embeddings.create(model="text-embedding-ada-002", input=texts[i:i + 5])
+        if i + 5 < len(texts):
+            time.sleep(2.0)
+    print(f"  500 chunks: {time.perf_counter() - start:6.2f}s old sequential path")
+    server.shutdown()
@@ -49,7 +49,7 @@ def main():
         
         if not openai_key and not openrouter_key:
             logger.warning("Neither OPENAI_API_KEY nor OPENROUTER_API_KEY environment variables are set")
-            logger.warning("The system will use random embeddings and may not function properly")
+            logger.warning("Without a local embedding model, retrieval will fall back to BM25 keyword ranking")
         
         logger.info("API documentation will be available at: http://localhost:8000/docs")
         
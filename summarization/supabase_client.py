@@ -1,14 +1,41 @@
 # supabase_client.py
 import os
 from supabase import create_client, Client
-from typing import Dict, List, Any, Optional
+from tracing import bind, instrument_httpx
+from typing import Dict, List, Any, Optional, Iterator
 from dotenv import load_dotenv
 import uuid
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
+# Rows fetched per request when paging through a table
+DEFAULT_PAGE_SIZE = int(os.environ.get("SUPABASE_PAGE_SIZE", "500"))
+
+# IDs per ``in_`` filter: keeps the request URL short and each answer under PostgREST's
+# max-rows cap (1000 by default), which would otherwise truncate it silently
+ID_BATCH_SIZE = int(os.environ.get("SUPABASE_ID_BATCH_SIZE", "100"))
+ID_BATCH_CONCURRENCY = int(os.environ.get("SUPABASE_ID_BATCH_CONCURRENCY", "4"))
+
+# Columns needed to build document content (avoids pulling unused columns)
+TRANSCRIPT_CONTENT_COLUMNS = "id,recording_id,user_id,url,transcript_data,formatted_text,created_at"
+ASSIGNMENT_CONTENT_COLUMNS = "id,user_id,course_id,title,description,points,due_date,status,created_at"
+
+# How long document counts are reused before asking Supabase again (dashboard polling)
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL", "30"))
+COUNT_METHODS = ("exact", "planned", "estimated")
+
+# Document catalog: one row per document (see README), cached in-process
+DOCUMENT_TABLES = {"transcript": "zoom_transcripts", "assignment": "assignments"}
+CATALOG_COLUMNS = "id,document_type,source_table,user_id,content_length,content_hash"
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", "2048"))
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "300"))
+
 class SupabaseClient:
     def __init__(self):
         """Initialize Supabase client with environment variables"""
@@ -24,6 +51,152 @@ class SupabaseClient:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
             
         self.client = create_client(self.url, self.key)
+        # A trace span per PostgREST request
+        instrument_httpx(self.client.postgrest.session)
+        
+        # (kind, filters, method) -> (expires_at, counts)
+        self._count_cache: Dict[tuple, tuple] = {}
+        self._count_cache_lock = threading.Lock()
+        
+        # document id -> (expires_at, catalog entry), least recently used first
+        self._catalog_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._catalog_cache_lock = threading.Lock()
+        
+        # Batches of a long ``in_`` filter are fetched concurrently
+        self._batch_executor = ThreadPoolExecutor(max_workers=ID_BATCH_CONCURRENCY, thread_name_prefix="supabase-in")
+    
+    def lookup_document(self, document_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Look up a document in the catalog
+        
+        One primary-key read on ``document_catalog`` (or none on a cache hit)
+        replaces probing ``zoom_transcripts`` and then ``assignments``.
+        
+        Args:
+            document_id: The ID of the document
+            use_cache: Use the in-process catalog cache
+        
+        Returns:
+            Dictionary with id, document_type, source_table, user_id,
+            content_length and content_hash, or None if the document doesn't exist
+        """
+        now = time.monotonic()
+        if use_cache:
+            with self._catalog_cache_lock:
+                cached = self._catalog_cache.get(document_id)
+                if cached and cached[0] > now:
+                    self._catalog_cache.move_to_end(document_id)
+                    return cached[1]
+        
+        try:
+            rows = self.client.table('document_catalog').select(CATALOG_COLUMNS).eq('id', document_id).limit(1).execute().data
+            entry = rows[0] if rows else None
+        except Exception as e:
+            print(f"Document catalog lookup failed, probing tables instead: {e}")
+            entry = self._probe_document(document_id)
+        
+        if entry:
+            self._remember_entries([entry], now)
+        return entry
+    
+    def lookup_documents(self, document_ids: List[str], use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up several documents in the catalog with ``in_`` queries for the cache misses
+        
+        Returns:
+            Catalog entries by document id (ids that don't exist are left out)
+        """
+        now = time.monotonic()
+        entries: Dict[str, Dict[str, Any]] = {}
+        if use_cache:
+            with self._catalog_cache_lock:
+                for document_id in document_ids:
+                    cached = self._catalog_cache.get(document_id)
+                    if cached and cached[0] > now:
+                        self._catalog_cache.move_to_end(document_id)
+                        entries[document_id] = cached[1]
+        missing = [document_id for document_id in dict.fromkeys(document_ids) if document_id not in entries]
+        if not missing:
+            return entries
+        
+        try:
+            rows = self.select_in('document_catalog', CATALOG_COLUMNS, missing)
+        except Exception as e:
+            print(f"Document catalog lookup failed, probing tables instead: {e}")
+            rows = self._probe_documents(missing)
+        self._remember_entries(rows, now)
+        entries.update((row["id"], row) for row in rows)
+        return entries
+    
+    def _remember_entries(self, entries: List[Dict[str, Any]], now: float):
+        """Add catalog entries to the cache, evicting the least recently used"""
+        with self._catalog_cache_lock:
+            for entry in entries:
+                self._catalog_cache[entry["id"]] = (now + CATALOG_CACHE_TTL, entry)
+                self._catalog_cache.move_to_end(entry["id"])
+            while len(self._catalog_cache) > CATALOG_CACHE_SIZE:
+                self._catalog_cache.popitem(last=False)
+    
+    def _probe_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Find a document by checking each table (used when the catalog is unavailable)"""
+        for document_type, table in DOCUMENT_TABLES.items():
+            rows = self.client.table(table).select('id,user_id,content_length').eq('id', document_id).execute().data
+            if rows:
+                return {
+                    "id": document_id,
+                    "document_type": document_type,
+                    "source_table": table,
+                    "user_id": rows[0].get("user_id"),
+                    "content_length": rows[0].get("content_length"),
+                    "content_hash": None
+                }
+        return None
+    
+    def _probe_documents(self, document_ids: List[str]) -> List[Dict[str, Any]]:
+        """Find documents with ``in_`` queries on each table (used when the catalog is unavailable)"""
+        entries = []
+        for document_type, table in DOCUMENT_TABLES.items():
+            rows = self.select_in(table, 'id,user_id,content_length', document_ids)
+            entries.extend({
+                "id": row["id"],
+                "document_type": document_type,
+                "source_table": table,
+                "user_id": row.get("user_id"),
+                "content_length": row.get("content_length"),
+                "content_hash": None
+            } for row in rows)
+        return entries
+    
+    def select_in(self, table: str, columns: str, ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Rows of a table whose id is in ids
+        
+        The ids are split into ``in_`` filters of at most ID_BATCH_SIZE, fetched
+        concurrently, so no request outgrows the URL or the max-rows cap.
+        """
+        ids = list(dict.fromkeys(ids))
+        batches = [ids[i:i + ID_BATCH_SIZE] for i in range(0, len(ids), ID_BATCH_SIZE)]
+        
+        def fetch(batch: List[str]) -> List[Dict[str, Any]]:
+            return self.client.table(table).select(columns).in_('id', batch).execute().data or []
+        
+        if len(batches) <= 1:
+            return fetch(batches[0]) if batches else []
+        futures = [self._batch_executor.submit(bind(fetch), batch) for batch in batches]
+        return [row for future in futures for row in future.result()]
+    
+    def get_rows(self, table: str, ids: List[str], columns: str = '*') -> Dict[str, Dict[str, Any]]:
+        """Rows of a table by id, fetched with ``in_`` queries of at most ID_BATCH_SIZE ids"""
+        if not ids:
+            return {}
+        if columns != '*' and 'id' not in [column.strip() for column in columns.split(',')]:
+            columns = f"id,{columns}"
+        return {row["id"]: row for row in self.select_in(table, columns, ids)}
+    
+    def forget_document(self, document_id: str):
+        """Drop a document from the catalog cache (after deleting it or finding it stale)"""
+        with self._catalog_cache_lock:
+            self._catalog_cache.pop(document_id, None)
     
     def get_transcript(self, transcript_id: str) -> Optional[Dict[str, Any]]:
         """Get a transcript from zoom_transcripts table by ID"""
@@ -33,16 +206,86 @@ class SupabaseClient:
             return response.data[0]
         return None
     
-    def get_transcripts(self, user_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get all transcripts, optionally filtered by user_id"""
-        query = self.client.table('zoom_transcripts').select('*')
+    def iter_pages(self,
+                   table: str,
+                   columns: str = '*',
+                   filters: Optional[Dict[str, Any]] = None,
+                   cursor: Optional[str] = None,
+                   page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Iterate over a table in pages using keyset (cursor) pagination on id
         
-        if user_id:
-            query = query.eq('user_id', user_id)
+        Unlike offset pagination, each page is an indexed range scan
+        (``id > cursor ORDER BY id LIMIT page_size``), so late pages are as
+        cheap as early ones and rows are never skipped or silently truncated.
+        
+        Args:
+            table: Table name
+            columns: Comma-separated columns to select ('id' is always included)
+            filters: Optional column -> value equality filters
+            cursor: Only return rows with id greater than this value
+            page_size: Rows per request
+        
+        Yields:
+            Lists of rows, one per page
+        """
+        if columns != '*' and 'id' not in [column.strip() for column in columns.split(',')]:
+            columns = f"id,{columns}"
+        
+        while True:
+            query = self.client.table(table).select(columns)
+            for column, value in (filters or {}).items():
+                if value is not None:
+                    query = query.eq(column, value)
+            if cursor is not None:
+                query = query.gt('id', cursor)
             
-        query = query.limit(limit)
-        response = query.execute()
-        return response.data
+            rows = query.order('id').limit(page_size).execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            cursor = rows[-1]['id']
+    
+    def list_page(self,
+                  table: str,
+                  columns: str = '*',
+                  filters: Optional[Dict[str, Any]] = None,
+                  cursor: Optional[str] = None,
+                  page_size: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+        """
+        Fetch a single page of a table
+        
+        Returns:
+            Dictionary with the page ``items`` and the ``next_cursor`` to pass
+            back for the following page (None on the last page)
+        """
+        pages = self.iter_pages(table, columns, filters, cursor, page_size)
+        items = next(pages, [])
+        return {
+            "items": items,
+            "next_cursor": items[-1]['id'] if len(items) == page_size else None
+        }
+    
+    def iter_transcripts(self,
+                         user_id: Optional[str] = None,
+                         columns: str = '*',
+                         page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Iterate over all transcripts page by page, optionally filtered by user_id"""
+        for page in self.iter_pages('zoom_transcripts', columns, {'user_id': user_id}, page_size=page_size):
+            yield from page
+    
+    def get_transcripts(self,
+                        user_id: Optional[str] = None,
+                        limit: Optional[int] = None,
+                        columns: str = '*') -> List[Dict[str, Any]]:
+        """Get transcripts (all of them unless limit is given), optionally filtered by user_id"""
+        transcripts = []
+        for transcript in self.iter_transcripts(user_id, columns, page_size=min(limit or DEFAULT_PAGE_SIZE, DEFAULT_PAGE_SIZE)):
+            transcripts.append(transcript)
+            if limit is not None and len(transcripts) >= limit:
+                break
+        return transcripts
     
     def get_assignment(self, assignment_id: str) -> Optional[Dict[str, Any]]:
         """Get an assignment from assignments table by ID"""
@@ -52,35 +295,142 @@ class SupabaseClient:
             return response.data[0]
         return None
     
-    def get_assignments(self, course_id: Optional[str] = None, user_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get all assignments, optionally filtered by course_id or user_id"""
-        query = self.client.table('assignments').select('*')
+    def iter_assignments(self,
+                         course_id: Optional[str] = None,
+                         user_id: Optional[str] = None,
+                         columns: str = '*',
+                         page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Iterate over all assignments page by page, optionally filtered by course_id or user_id"""
+        filters = {'course_id': course_id, 'user_id': user_id}
+        for page in self.iter_pages('assignments', columns, filters, page_size=page_size):
+            yield from page
+    
+    def get_assignments(self,
+                        course_id: Optional[str] = None,
+                        user_id: Optional[str] = None,
+                        limit: Optional[int] = None,
+                        columns: str = '*') -> List[Dict[str, Any]]:
+        """Get assignments (all of them unless limit is given), optionally filtered by course_id or user_id"""
+        assignments = []
+        page_size = min(limit or DEFAULT_PAGE_SIZE, DEFAULT_PAGE_SIZE)
+        for assignment in self.iter_assignments(course_id, user_id, columns, page_size=page_size):
+            assignments.append(assignment)
+            if limit is not None and len(assignments) >= limit:
+                break
+        return assignments
+    
+    def _cached_count(self, key: tuple, compute, use_cache: bool):
+        """Return a cached count result for key, computing and storing it if stale"""
+        now = time.monotonic()
+        if use_cache:
+            with self._count_cache_lock:
+                cached = self._count_cache.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
         
-        if course_id:
-            query = query.eq('course_id', course_id)
-            
-        if user_id:
-            query = query.eq('user_id', user_id)
-            
-        query = query.limit(limit)
-        response = query.execute()
-        return response.data
+        result = compute()
+        with self._count_cache_lock:
+            self._count_cache[key] = (now + COUNT_CACHE_TTL, result)
+        return result
     
-    def count_documents(self) -> Dict[str, int]:
-        """Count documents by type in Supabase"""
-        try:
-            transcripts_count = len(self.client.table('zoom_transcripts').select('id').execute().data)
-            assignments_count = len(self.client.table('assignments').select('id').execute().data)
+    def clear_count_cache(self):
+        """Forget cached document counts (called after inserts and deletes)"""
+        with self._count_cache_lock:
+            self._count_cache.clear()
+    
+    def _count_rows(self, table: str, method: str, filters: Dict[str, Any], columns: str = 'id') -> int:
+        """Count rows server-side; only the count (and at most one row) crosses the wire"""
+        query = self.client.table(table).select(columns, count=method)
+        for column, value in filters.items():
+            if value is not None:
+                query = query.eq(column, value)
+        return query.limit(1).execute().count or 0
+    
+    def count_documents(self,
+                        user_id: Optional[str] = None,
+                        course_id: Optional[str] = None,
+                        method: str = "exact",
+                        use_cache: bool = True) -> Dict[str, int]:
+        """
+        Count documents by type in Supabase
+        
+        Args:
+            user_id: Optional user ID to count documents for
+            course_id: Optional course ID (transcripts are matched through their recording)
+            method: "exact" (COUNT(*)), "planned" (query planner estimate) or
+                "estimated" (exact for small tables, planner estimate for large ones)
+            use_cache: Reuse a result younger than COUNT_CACHE_TTL seconds
+        
+        Returns:
+            Dictionary with transcripts, assignments and total counts
+        """
+        if method not in COUNT_METHODS:
+            raise ValueError(f"method must be one of {COUNT_METHODS}")
+        
+        def compute():
+            if course_id:
+                # Transcripts have no course_id column; filter through the recording
+                transcripts_count = self._count_rows(
+                    'zoom_transcripts', method,
+                    {'user_id': user_id, 'zoom_recordings.course_id': course_id},
+                    columns='id,zoom_recordings!inner(course_id)'
+                )
+            else:
+                transcripts_count = self._count_rows('zoom_transcripts', method, {'user_id': user_id})
+            assignments_count = self._count_rows('assignments', method, {'user_id': user_id, 'course_id': course_id})
             
             return {
                 "transcripts": transcripts_count,
                 "assignments": assignments_count,
                 "total": transcripts_count + assignments_count
             }
+        
+        try:
+            return self._cached_count(("total", user_id, course_id, method), compute, use_cache)
         except Exception as e:
             print(f"Error counting documents: {e}")
             return {"transcripts": 0, "assignments": 0, "total": 0}
     
+    def count_documents_by(self,
+                           group_by: str = "user",
+                           user_id: Optional[str] = None,
+                           use_cache: bool = True) -> Dict[str, Dict[str, int]]:
+        """
+        Count documents per user or per course
+        
+        Reads the ``document_counts`` view (one row per user/course/type, see
+        README), so the work stays in Postgres and only the grouped rows are sent.
+        
+        Args:
+            group_by: "user" or "course"
+            user_id: Optional user ID to restrict the breakdown to
+            use_cache: Reuse a result younger than COUNT_CACHE_TTL seconds
+        
+        Returns:
+            Dictionary mapping user or course ID to transcripts/assignments/total counts
+        """
+        if group_by not in ("user", "course"):
+            raise ValueError("group_by must be 'user' or 'course'")
+        group_column = "user_id" if group_by == "user" else "course_id"
+        
+        def compute():
+            query = self.client.table('document_counts').select(f"{group_column},document_type,count")
+            if user_id:
+                query = query.eq('user_id', user_id)
+            
+            breakdown: Dict[str, Dict[str, int]] = {}
+            for row in query.execute().data or []:
+                counts = breakdown.setdefault(row.get(group_column) or "", {"transcripts": 0, "assignments": 0, "total": 0})
+                counts[f"{row['document_type']}s"] += row["count"]
+                counts["total"] += row["count"]
+            return breakdown
+        
+        try:
+            return self._cached_count(("by", group_by, user_id), compute, use_cache)
+        except Exception as e:
+            print(f"Error counting documents by {group_by}: {e}")
+            return {}
+    
     def add_transcript(self, 
                       content: str, 
                       title: Optional[str] = None, 
@@ -102,7 +452,8 @@ class SupabaseClient:
             "id": document_id,
             "user_id": user_id,
             "transcript_data": content,
-            "formatted_text": content,
+            "formatted_text": "",  # Built on demand from transcript_data
+            "content_length": len(content),
             "created_at": datetime.now().isoformat()
         }
         
@@ -110,6 +461,7 @@ class SupabaseClient:
         
         if not response.data:
             raise Exception("Failed to insert transcript into Supabase")
+        self.clear_count_cache()
             
         return {
             "id": document_id,
@@ -157,6 +509,7 @@ class SupabaseClient:
         
         if not response.data:
             raise Exception("Failed to insert assignment into Supabase")
+        self.clear_count_cache()
             
         return {
             "id": document_id,
@@ -176,29 +529,21 @@ class SupabaseClient:
         Returns:
             True if document was deleted, False otherwise
         """
-        # Try to find and delete from transcripts
-        transcript_query = self.client.table('zoom_transcripts')
-        
-        # Add user check if provided
-        if user_id:
-            transcript_query = transcript_query.eq('user_id', user_id)
-            
-        transcript_response = transcript_query.delete().eq('id', document_id).execute()
+        entry = self.lookup_document(document_id)
+        if not entry:
+            return False
         
-        if transcript_response.data and len(transcript_response.data) > 0:
-            return True
-            
-        # Try to find and delete from assignments
-        assignment_query = self.client.table('assignments')
+        # Ownership is checked against the catalog before touching the table
+        if user_id and str(entry.get("user_id")) != str(user_id):
+            return False
         
-        # Add user check if provided
+        query = self.client.table(entry["source_table"]).delete().eq('id', document_id)
         if user_id:
-            assignment_query = assignment_query.eq('user_id', user_id)
-            
-        assignment_response = assignment_query.delete().eq('id', document_id).execute()
+            query = query.eq('user_id', user_id)
+        response = query.execute()
         
-        if assignment_response.data and len(assignment_response.data) > 0:
+        self.forget_document(document_id)
+        if response.data and len(response.data) > 0:
+            self.clear_count_cache()
             return True
-            
-        # Not found in either table
-        return False
\ No newline at end of file
+        return False
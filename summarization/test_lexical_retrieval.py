@@ -0,0 +1,39 @@
+"""
+BM25 over per-document indexes searched together.
+
+Run with: python -m pytest test_lexical_retrieval.py
+"""
+
+import pytest
+
+from lexical_retrieval import JoinedLexicalIndex, LexicalIndex, bm25_rank
+
+DOCUMENTS = [
+    ["the msi protocol keeps caches coherent", "each line has msi bits", "lru beats fifo on hit rate"],
+    [],
+    ["snooping lets a cache find out another core wrote the block", "the bus is shared by all l1 caches"],
+    ["hit rate goes up with associativity and cache size", "fifo evicts the oldest line", "msi state m is modified"],
+]
+QUERIES = ["What is the MSI protocol?", "lru or fifo", "How does snooping work on the bus?", "nothing matches"]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_joined_index_matches_one_index_over_all_chunks(query):
+    joined = JoinedLexicalIndex([LexicalIndex(texts) for texts in DOCUMENTS])
+    single = LexicalIndex([text for texts in DOCUMENTS for text in texts])
+    assert len(joined) == len(single) == 8
+    expected = single.rank(query)
+    ranked = joined.rank(query)
+    assert [i for i, _ in ranked] == [i for i, _ in expected]
+    assert [score for _, score in ranked] == pytest.approx([score for _, score in expected])
+
+
+def test_rank_keeps_unmatched_chunks_in_document_order():
+    ranking = bm25_rank("snooping", ["caches", "snooping on the bus", "blocks", "lines"])
+    assert ranking[0][0] == 1
+    assert ranking[1:] == [(0, 0.0), (2, 0.0), (3, 0.0)]
+
+
+def test_deadline_stops_indexing():
+    with pytest.raises(TimeoutError):
+        LexicalIndex(["word"] * 10, deadline=0.0)
@@ -0,0 +1,101 @@
+"""
+RemoteEmbedder against the local mock of the embeddings endpoint.
+
+Run with: python -m pytest test_remote_embeddings.py
+"""
+
+import time
+
+import openai
+import pytest
+
+from remote_embeddings import RemoteEmbedder, _mock_server, parse_reset
+
+
+@pytest.fixture
+def mock_client():
+    servers = []
+
+    def start(**limits):
+        server = _mock_server(**limits)
+        servers.append(server)
+        return openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def expected(text):
+    return [float(len(text) % 7), 1.0]
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("120ms") == pytest.approx(0.12)
+    assert parse_reset("1.5") == 1.5
+    assert parse_reset("") is None
+
+
+def test_embeddings_keep_input_order(mock_client):
+    client = mock_client(requests_per_window=1000, tokens_per_window=1_000_000, window=60.0, latency=0.01)
+    texts = ["x" * (i % 13 + 1) for i in range(100)]
+    embedder = RemoteEmbedder(client, batch_size=7, concurrency=4)
+    vectors = embedder.embed(texts)
+    assert vectors == [expected(text) for text in texts]
+    stats = embedder.stats()
+    assert stats["requests"] == 15 and stats["inputs"] == 100
+    assert stats["rate_limited"] == 0
+
+
+def test_batches_respect_the_token_limit(mock_client):
+    client = mock_client(requests_per_window=1000, tokens_per_window=1_000_000, window=60.0, latency=0.0)
+    texts = ["word " * 80] * 10  # 101 estimated tokens each
+    embedder = RemoteEmbedder(client, batch_size=100, batch_tokens=350, concurrency=2)
+    assert len(embedder.embed(texts)) == 10
+    assert embedder.stats()["requests"] == 4  # 3 + 3 + 3 + 1
+
+
+def test_429_pauses_for_retry_after_and_retries(mock_client):
+    # No headers seen yet, so all three batches go out at once and the third is rejected
+    window = 1.0
+    client = mock_client(requests_per_window=2, tokens_per_window=1_000_000, window=window, latency=0.05)
+    texts = [f"chunk {i}" for i in range(3)]
+    embedder = RemoteEmbedder(client, batch_size=1, concurrency=3)
+    start = time.monotonic()
+    vectors = embedder.embed(texts)
+    elapsed = time.monotonic() - start
+    assert vectors == [expected(text) for text in texts]
+    stats = embedder.stats()
+    assert stats["rate_limited"] >= 1 and stats["retries"] >= 1
+    assert stats["requests"] == 3
+    assert elapsed >= window * 0.8  # the retry waited for the window to reset
+
+
+def test_requests_held_back_when_header_budget_runs_out(mock_client):
+    # One request at a time: after the second response reports 0 remaining requests,
+    # the third waits for the reset instead of drawing a 429
+    window = 1.0
+    client = mock_client(requests_per_window=2, tokens_per_window=1_000_000, window=window, latency=0.01)
+    texts = [f"chunk {i}" for i in range(3)]
+    embedder = RemoteEmbedder(client, batch_size=1, concurrency=1)
+    start = time.monotonic()
+    vectors = embedder.embed(texts)
+    elapsed = time.monotonic() - start
+    assert vectors == [expected(text) for text in texts]
+    stats = embedder.stats()
+    assert stats["rate_limited"] == 0
+    assert stats["rate_limit_wait_seconds"] >= window * 0.8
+    assert elapsed >= window * 0.8
+
+
+def test_token_budget_holds_back_requests(mock_client):
+    # 250 tokens per window and 101-token batches: the third batch waits for the reset
+    window = 1.0
+    client = mock_client(requests_per_window=1000, tokens_per_window=250, window=window, latency=0.01)
+    texts = ["word " * 80] * 3
+    embedder = RemoteEmbedder(client, batch_size=1, concurrency=1)
+    start = time.monotonic()
+    assert len(embedder.embed(texts)) == 3
+    assert embedder.stats()["rate_limited"] == 0
+    assert time.monotonic() - start >= window * 0.8
@@ -0,0 +1,432 @@
+"""
+Lightweight request tracing across the backend, the RAG service and the LLM.
+
+A slow notecard generation touches the backend, the RAG service, Supabase and
+OpenRouter, and their logs are separate files. This module ties them
+together:
+
+- ``TracingMiddleware`` opens a server span per request. It continues the
+  caller's trace from a W3C ``traceparent`` header and keeps its
+  ``X-Request-ID`` (or uses the trace id), and echoes ``X-Request-ID`` on the
+  response.
+- ``span(name, **attributes)`` times a block as a child of the current span;
+  ``record_span`` adds one from a start time and duration already measured.
+- ``outgoing_headers()`` gives ``traceparent`` and ``X-Request-ID`` for calls
+  to the other service, so its spans join the same trace.
+- ``instrument_httpx`` adds a span per Supabase (PostgREST) request.
+- ``bind(fn)`` carries the current trace into thread pools, which don't copy
+  context variables on their own.
+- ``TraceLogFilter`` puts the request id in log records, so log lines can be
+  matched to a trace.
+
+Finished spans go through a bounded queue to a background exporter, so the
+request path never waits on I/O; spans are dropped (and counted) when the
+queue is full. ``TRACE_EXPORT`` picks the sink: ``file`` (the default)
+appends OTLP/JSON export requests, one per line, to ``TRACE_FILE``; ``otlp``
+posts them to an OTLP/HTTP collector at ``TRACE_OTLP_ENDPOINT``; ``off``
+disables tracing. ``TRACE_SAMPLE_RATE`` samples new traces; the caller's
+sampling decision is kept.
+
+Run ``python tracing.py [TRACE_FILE]`` to print the slowest traces in a trace
+file as span trees.
+
+Used by both services: ``backend/tracing.py`` and ``summarization/tracing.py``
+must stay identical, which ``backend/test_shared_modules.py`` checks.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import route_template
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "file").lower()  # file, otlp or off
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))  # spans waiting for export
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_SECONDS = 1.0
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID = re.compile(r"^[\w\-.:]{1,128}$")
+
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+logger = logging.getLogger("tracing")
+
+
+class Span:
+    """A timed operation in a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "request_id", "sampled", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], request_id: str, sampled: bool,
+                 kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.sampled = sampled
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: Any):
+        self.error = str(error) or type(error).__name__
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.sampled:
+            _exporter.submit(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def request_id() -> Optional[str]:
+    """Id of the request being handled, if any"""
+    span = _current_span.get()
+    return span.request_id if span else None
+
+
+def _child(name: str, kind: int, attributes: Dict[str, Any], start_ns: Optional[int] = None) -> Span:
+    parent = _current_span.get()
+    if parent is None:
+        trace_id = os.urandom(16).hex()
+        return Span(name, trace_id, None, trace_id, TRACE_EXPORT != "off" and random.random() < TRACE_SAMPLE_RATE,
+                    kind, attributes, start_ns)
+    return Span(name, parent.trace_id, parent.span_id, parent.request_id, parent.sampled, kind, attributes, start_ns)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """
+    Time the enclosed block as a child of the current span (or as a new trace)
+
+    Yields:
+        The Span, to add attributes; an exception raised in the block is
+        recorded on it and re-raised
+    """
+    current = _child(name, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def record_span(name: str, start_time: float, duration: float, error: Optional[str] = None, **attributes):
+    """
+    Add a finished child span of the current span from timings already measured
+
+    Args:
+        start_time: time.time() at the start
+        duration: Seconds
+    """
+    finished = _child(name, KIND_INTERNAL, attributes, start_ns=int(start_time * 1e9))
+    if error:
+        finished.record_error(error)
+    finished.end(finished.start_ns + int(duration * 1e9))
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """traceparent and X-Request-ID headers continuing the current trace in another service"""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {"traceparent": current.traceparent(), REQUEST_ID_HEADER: current.request_id}
+
+
+def bind(fn: Callable) -> Callable:
+    """fn, running in a copy of the current context (for thread pools)"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def instrument_httpx(client, prefix: str = "db"):
+    """
+    Add a client span per request of an httpx.Client (e.g. supabase_client.postgrest.session)
+
+    Spans end when the response headers arrive.
+    """
+    def on_request(request):
+        path = request.url.path
+        table = path.rsplit("/", 1)[-1]
+        request.extensions["trace_span"] = _child(f"{prefix} {request.method} {table}", KIND_CLIENT,
+                                                  {"http.method": request.method, "http.url.path": path})
+
+    def on_response(response):
+        started = response.request.extensions.get("trace_span")
+        if started is not None:
+            started.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 400:
+                started.record_error(f"HTTP {response.status_code}")
+            started.end()
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
+
+
+class TraceLogFilter(logging.Filter):
+    """Adds request_id and trace_id ("-" outside a request) to log records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _current_span.get()
+        record.request_id = current.request_id if current else "-"
+        record.trace_id = current.trace_id if current else "-"
+        return True
+
+
+def _header(headers, name: bytes) -> str:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per request
+
+    Add it before the other middlewares (so it runs innermost and sees the
+    routing result in the scope).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or TRACE_EXPORT == "off":
+            await self.app(scope, receive, send)
+            return
+
+        headers = scope.get("headers", [])
+        parent = _TRACEPARENT.match(_header(headers, b"traceparent").strip().lower())
+        incoming_id = _header(headers, REQUEST_ID_HEADER.lower().encode()).strip()
+        if parent:
+            trace_id, parent_id, sampled = parent.group(1), parent.group(2), parent.group(3) == "01"
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < TRACE_SAMPLE_RATE
+        rid = incoming_id if _REQUEST_ID.match(incoming_id) else trace_id
+        server = Span(f"{scope['method']} {scope['path']}", trace_id, parent_id, rid, sampled, KIND_SERVER,
+                      {"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                server.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    server.record_error(f"HTTP {message['status']}")
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.lower().encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        token = _current_span.set(server)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            server.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            if "endpoint" in scope:
+                server.name = f"{scope['method']} {route_template(scope)}"
+            server.end()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_request(spans: List[Span], service: str) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for finished spans"""
+    otlp_spans = []
+    for finished in spans:
+        attributes = dict(finished.attributes, **{"request.id": finished.request_id})
+        otlp_span = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": finished.kind,
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            otlp_span["parentSpanId"] = finished.parent_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class _Exporter:
+    """Background export of finished spans through a bounded queue"""
+
+    def __init__(self):
+        self.service = os.getenv("TRACE_SERVICE_NAME", "unknown")
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.exported = 0
+
+    def submit(self, finished: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f"Could not export {len(batch)} spans: {e}")
+
+    def _export(self, batch: List[Span]):
+        payload = otlp_request(batch, self.service)
+        if TRACE_EXPORT == "otlp":
+            import requests
+
+            response = requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=10)
+            response.raise_for_status()
+        else:
+            directory = os.path.dirname(TRACE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to timeout) for queued spans to be exported"""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(min(EXPORT_INTERVAL_SECONDS + 0.1, max(0.0, deadline - time.monotonic())))
+
+
+_exporter = _Exporter()
+
+
+def set_service(name: str):
+    """Service name reported with the spans of this process"""
+    _exporter.service = name
+
+
+def flush(timeout: float = 5.0):
+    _exporter.flush(timeout)
+
+
+def stats() -> Dict[str, Any]:
+    """Exporter sink, spans exported, dropped and queued"""
+    return {"export": TRACE_EXPORT, "sample_rate": TRACE_SAMPLE_RATE, "exported": _exporter.exported,
+            "dropped": _exporter.dropped, "queued": _exporter._queue.qsize()}
+
+
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Spans of a trace file by trace id, each with its service"""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                service = next((a["value"]["stringValue"] for a in resource["resource"]["attributes"]
+                                if a["key"] == "service.name"), "unknown")
+                for scope in resource["scopeSpans"]:
+                    for s in scope["spans"]:
+                        traces.setdefault(s["traceId"], []).append(dict(s, service=service))
+    return traces
+
+
+def format_trace(spans: List[Dict[str, Any]]) -> str:
+    """A trace as an indented span tree with offsets and durations in milliseconds"""
+    by_parent: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        by_parent.setdefault(s.get("parentSpanId") if s.get("parentSpanId") in ids else None, []).append(s)
+    start = min(int(s["startTimeUnixNano"]) for s in spans)
+    lines = []
+
+    def walk(parent: Optional[str], depth: int):
+        for s in sorted(by_parent.get(parent, []), key=lambda s: int(s["startTimeUnixNano"])):
+            offset = (int(s["startTimeUnixNano"]) - start) / 1e6
+            duration = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+            error = f"  ERROR {s['status'].get('message')}" if s["status"].get("code") == 2 else ""
+            lines.append(f"{offset:9.1f} {duration:9.1f}  {'  ' * depth}{s['service']}: {s['name']}{error}")
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE
+    traces = load_traces(path)
+
+    def trace_duration(spans):
+        return max(int(s["endTimeUnixNano"]) for s in spans) - min(int(s["startTimeUnixNano"]) for s in spans)
+
+    slowest = sorted(traces.values(), key=trace_duration, reverse=True)[:5]
+    print(f"{len(traces)} traces in {path}; the slowest (start and duration in ms):")
+    for spans in slowest:
+        request_ids = {a["value"]["stringValue"] for s in spans for a in s["attributes"] if a["key"] == "request.id"}
+        print(f"\ntrace {spans[0]['traceId']} (request {', '.join(sorted(request_ids))}), "
+              f"{trace_duration(spans) / 1e6:.1f} ms")
+        print(format_trace(spans))